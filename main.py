@@ -1,59 +1,196 @@
+import argparse
 import configparser
 import logging
 import os
+import re
 import sys
-from collections import defaultdict
+import time
 
 # Add src to path if needed, though structure implies checking from root
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.pdf_checker import scan_directory
-from src.db_client import DBClient
-from src.email_sender import EmailSender
+from src.pdf_checker import (iter_corrupt_files, scan_directory, list_partitions, parse_validation_depth, ValidationPool,
+                             DEFAULT_CHUNKSIZE, DEFAULT_MAX_IN_FLIGHT, EXECUTION_PROCESSES, EXECUTION_MODES, DEFAULT_READ_THREADS, DEFAULT_MAX_READ_THREADS,
+                             DEFAULT_READ_AHEAD, DEFAULT_READ_MEMORY_MB, DEFAULT_FILE_TIMEOUT, DEFAULT_MEMORY_LIMIT_MB,
+                             DEFAULT_MAX_TASKS_PER_CHILD, DEFAULT_PAGE_SAMPLE, DEFAULT_PAGES_PER_TASK)
+from src.dir_walker import DEFAULT_WALKER_THREADS
+from src.revisions import REVISION_POLICIES, REVISIONS_ALL, NEWEST_BY, NEWEST_BY_NUMBER
+from src.verdict_cache import VerdictCache
+from src.run_metrics import RunMetrics
+# DB, SMTP and watch mode modules are imported in the functions that use them:
+# pool workers started with spawn (Windows) re-import this file before their
+# first task, and only need the validation code.
 
-# Configure Logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("auto_check.log"),
-        logging.StreamHandler(sys.stdout)
-    ]
-)
+def setup_logging(settings=None, log_path: str = None):
+    """
+    Starts the log pipeline for the run (see log_setup.LogPipeline) with the
+    [REGISTRO] options, or the defaults while config.ini is not read yet.
+    Called from main() rather than at import time: pool workers started
+    with spawn (Windows) re-import this module and must not each open the
+    log file. Returns the pipeline, to be stopped at exit.
+    """
+    from src.log_setup import LogPipeline, DEFAULT_LOG_FILE
 
-def main():
-    logging.info("Starting Auto Check Albaran...")
-    
-    # 1. Load Config
-    config = configparser.ConfigParser()
-    config_path = 'config.ini'
-    if not os.path.exists(config_path):
-        logging.error("config.ini not found!")
-        res = config.read(config_path)
-        if not res:
-             logging.error("Failed to read config.ini")
-             return
-
-    config.read(config_path)
+    if settings is None:
+        return LogPipeline(log_path or DEFAULT_LOG_FILE).start()
+    return LogPipeline(log_path or settings['log_path'], settings['log_level'], settings['log_module_levels'],
+                       settings['log_format'], settings['log_max_mb'] * 1024 * 1024, settings['log_backups'],
+                       settings['log_console_level']).start()
+
+def load_settings(config: configparser.ConfigParser):
+    """
+    Reads every option used by the run from config.ini.
+    Returns a dict, or None if a required key is missing or invalid.
+    """
+    from src.db_client import DEFAULT_BATCH_SIZE, DEFAULT_FETCH_SIZE
+    from src.db_backends import BACKEND_ODBC, BACKEND_SQLITE, BACKENDS
+    from src.email_sender import DEFAULT_MAX_RETRIES, DEFAULT_RETRY_BACKOFF, DEFAULT_CIRCUIT_RESET
+    from src.report_builder import DEFAULT_MAX_INLINE_ROWS
+    from src.run_history import NOTIFY_ALL, NOTIFY_MODES
+    from src.watcher import DEFAULT_POLL_INTERVAL, DEFAULT_FLUSH_INTERVAL
+    from src.sharding import DEFAULT_PARTITIONS, DEFAULT_LEASE_SECONDS, DEFAULT_START_WAIT
+    from src.albaran_record import CenterRouter
+    from src.log_setup import (DEFAULT_LOG_FILE, DEFAULT_MAX_MB, DEFAULT_BACKUPS, LOG_TEXT, LOG_FORMATS,
+                               parse_level, parse_module_levels)
 
+    settings = {}
     try:
-        pdf_path = config['GENERAL']['carpeta_pdf']
-        days_back = int(config['GENERAL']['dias_atras'])
-        fecha_desde = config['GENERAL'].get('fechadesde', None)
+        # One or more roots separated by ';' or new lines
+        settings['pdf_paths'] = [p.strip() for p in re.split(r"[;\n]", config['GENERAL']['carpeta_pdf']) if p.strip()]
+        settings['days_back'] = int(config['GENERAL']['dias_atras'])
+        settings['fecha_desde'] = config['GENERAL'].get('fechadesde', None)
+        # Verdict cache next to auto_check.log. Empty value disables it.
+        settings['cache_path'] = config['GENERAL'].get('cache_veredictos', 'auto_check_cache.db')
+        settings['cache_max_entries'] = config['GENERAL'].getint('cache_max_entradas', 200000)
+        settings['cache_max_days'] = config['GENERAL'].getint('cache_max_dias', 30)
+        # estructura = header/trailer only, pypdf = also open with pypdf (default),
+        # profundo = also decode every page (or first, last and paginas_muestra random ones)
+        settings['validation_depth'] = parse_validation_depth(config['GENERAL'].get('nivel_validacion', 'pypdf'))
+        settings['page_sample'] = config['GENERAL'].getint('paginas_muestra', DEFAULT_PAGE_SAMPLE)
+        settings['pages_per_task'] = config['GENERAL'].getint('paginas_por_tarea', DEFAULT_PAGES_PER_TASK)
+        # Pool size (0 = one per CPU), files per pool task and max files in flight
+        settings['processes'] = config['GENERAL'].getint('procesos', 0)
+        settings['chunksize'] = config['GENERAL'].getint('lote_validacion', DEFAULT_CHUNKSIZE)
+        settings['max_in_flight'] = config['GENERAL'].getint('max_en_vuelo', DEFAULT_MAX_IN_FLIGHT)
+        # procesos = each process reads and parses; hibrido = threads read, processes parse
+        settings['execution'] = config['GENERAL'].get('modo_ejecucion', EXECUTION_PROCESSES).strip().lower()
+        if settings['execution'] not in EXECUTION_MODES:
+            raise ValueError(f"Unknown modo_ejecucion: {settings['execution']}. Expected one of {list(EXECUTION_MODES)}")
+        settings['read_threads'] = config['GENERAL'].getint('hilos_lectura', DEFAULT_READ_THREADS)
+        settings['max_read_threads'] = config['GENERAL'].getint('hilos_lectura_max', DEFAULT_MAX_READ_THREADS)
+        settings['read_ahead'] = config['GENERAL'].getint('lectura_adelantada', DEFAULT_READ_AHEAD)
+        settings['read_memory_mb'] = config['GENERAL'].getint('memoria_lectura_mb', DEFAULT_READ_MEMORY_MB)
+        # Per-file limits (seconds, MB per worker; 0 = no limit) and files per worker before it is recycled
+        settings['file_timeout'] = config['GENERAL'].getfloat('tiempo_max_archivo', DEFAULT_FILE_TIMEOUT)
+        settings['memory_limit_mb'] = config['GENERAL'].getint('memoria_max_mb', DEFAULT_MEMORY_LIMIT_MB)
+        settings['max_tasks_per_child'] = config['GENERAL'].getint('archivos_por_proceso', DEFAULT_MAX_TASKS_PER_CHILD)
+        # Subfolder walk: depth 0 = unlimited, exclusions are comma-separated globs
+        settings['recursive'] = config['GENERAL'].getboolean('recursivo', False)
+        settings['max_depth'] = config['GENERAL'].getint('profundidad_max', 0)
+        settings['exclude'] = [g.strip() for g in config['GENERAL'].get('excluir', '').split(',') if g.strip()]
+        settings['walker_threads'] = config['GENERAL'].getint('hilos_listado', DEFAULT_WALKER_THREADS)
+        settings['prune_dirs'] = config['GENERAL'].getboolean('podar_carpetas', False)
+        # Several files per albaran: todas, ultima (newest only) or todas_corruptas (corrupt if all are bad)
+        settings['revision_policy'] = config['GENERAL'].get('revisiones', REVISIONS_ALL).strip().lower()
+        if settings['revision_policy'] not in REVISION_POLICIES:
+            raise ValueError(f"Unknown revisiones: {settings['revision_policy']}. Expected one of {list(REVISION_POLICIES)}")
+        settings['newest_by'] = config['GENERAL'].get('revision_mas_reciente', NEWEST_BY_NUMBER).strip().lower()
+        if settings['newest_by'] not in NEWEST_BY:
+            raise ValueError(f"Unknown revision_mas_reciente: {settings['newest_by']}. Expected one of {list(NEWEST_BY)}")
+        settings['skip_copies'] = config['GENERAL'].getboolean('omitir_copias_identicas', True)
+        # Run history: what each run found and notified (empty = disabled)
+        settings['history_path'] = config['GENERAL'].get('historial', 'auto_check_history.db')
+        settings['history_max_days'] = config['GENERAL'].getint('historial_max_dias', 90)
+
+
+        # Watch mode (--watch): auto = inotify on Linux, polling elsewhere. Use 'sondeo' for network shares.
+        # Each file is judged on its own as it lands: revisiones and omitir_copias_identicas only
+        # apply to scheduled scans.
+        if 'VIGILANCIA' not in config:
+            config['VIGILANCIA'] = {}
+        settings['watch_mode'] = config['VIGILANCIA'].get('modo', 'auto')
+        settings['watch_poll_interval'] = config['VIGILANCIA'].getfloat('intervalo_sondeo', DEFAULT_POLL_INTERVAL)
+        settings['watch_flush_interval'] = config['VIGILANCIA'].getfloat('intervalo_envio', DEFAULT_FLUSH_INTERVAL)
+
+        # Sharded scan (--coordinate / --shard): lease store on a share every host can reach
+        if 'REPARTO' not in config:
+            config['REPARTO'] = {}
+        settings['shard_store'] = config['REPARTO'].get('almacen', '')
+        settings['shard_partitions'] = config['REPARTO'].getint('particiones', DEFAULT_PARTITIONS)
+        settings['shard_lease_seconds'] = config['REPARTO'].getfloat('concesion_segundos', DEFAULT_LEASE_SECONDS)
+        # How long the coordinator waits for the shards (0 = no limit) and a shard for a scan to start
+        settings['shard_max_wait_minutes'] = config['REPARTO'].getfloat('espera_max_minutos', 0)
+        settings['shard_start_wait'] = config['REPARTO'].getfloat('espera_inicio', DEFAULT_START_WAIT)
         
-        dsn_name = config['DATABASE']['dsn_name']
-        db_user = config['DATABASE']['user']
-        db_password = config['DATABASE']['password']
+        # motor = sqlite reads a local copy of the tables (ruta_sqlite) instead of the AS400
+        settings['db_backend'] = config['DATABASE'].get('motor', BACKEND_ODBC).strip().lower()
+        if settings['db_backend'] not in BACKENDS:
+            raise ValueError(f"Unknown motor: {settings['db_backend']}. Expected one of {list(BACKENDS)}")
+        if settings['db_backend'] == BACKEND_SQLITE:
+            settings['db_sqlite_path'] = config['DATABASE']['ruta_sqlite']
+            settings['dsn_name'] = config['DATABASE'].get('dsn_name', '')
+            settings['db_user'] = config['DATABASE'].get('user', '')
+            settings['db_password'] = config['DATABASE'].get('password', '')
+        else:
+            settings['dsn_name'] = config['DATABASE']['dsn_name']
+            settings['db_user'] = config['DATABASE']['user']
+            settings['db_password'] = config['DATABASE']['password']
+        # IN-list chunk size, pooled connections, concurrent chunks and rows per fetch
+        settings['db_batch_size'] = config['DATABASE'].getint('tamano_lote', DEFAULT_BATCH_SIZE)
+        settings['db_pool_size'] = config['DATABASE'].getint('conexiones', 2)
+        settings['db_parallel'] = config['DATABASE'].getint('consultas_paralelas', 1)
+        settings['db_fetch_size'] = config['DATABASE'].getint('filas_por_fetch', DEFAULT_FETCH_SIZE)
+        # Local cache of detail rows. Empty value disables it.
+        settings['detail_cache_path'] = config['DATABASE'].get('cache_detalles', 'auto_check_details.db')
+        settings['detail_ttl_hours'] = config['DATABASE'].getfloat('cache_ttl_horas', 24)
+        settings['detail_negative_ttl_hours'] = config['DATABASE'].getfloat('cache_ttl_negativo_horas', 6)
+        settings['detail_max_entries'] = config['DATABASE'].getint('cache_max_entradas', 50000)
         
-        smtp_server = config['EMAIL']['servidor_smtp']
-        smtp_port = int(config['EMAIL']['puerto_smtp'])
-        sender_email = config['EMAIL']['remitente']
-        use_tls = config['EMAIL'].getboolean('usar_tls')
-        debug_email = config['EMAIL'].get('debug_email', None)
-        central_recipients = config['EMAIL']['destinatarios_central'].split(',')
-        if debug_email:
-             logging.info(f"DEBUG MODE ACTIVE: All emails (Central + Centers) will be sent to {debug_email}")
-             central_recipients = [debug_email]
+        settings['smtp_server'] = config['EMAIL']['servidor_smtp']
+        settings['smtp_port'] = int(config['EMAIL']['puerto_smtp'])
+        settings['sender_email'] = config['EMAIL']['remitente']
+        settings['use_tls'] = config['EMAIL'].getboolean('usar_tls')
+        settings['debug_email'] = config['EMAIL'].get('debug_email', None)
+        settings['central_recipients'] = config['EMAIL']['destinatarios_central'].split(',')
+        # Retries for transient (4xx / dropped connection) errors and parallel SMTP sessions
+        settings['smtp_retries'] = config['EMAIL'].getint('reintentos', DEFAULT_MAX_RETRIES)
+        settings['smtp_retry_backoff'] = config['EMAIL'].getfloat('espera_reintento', DEFAULT_RETRY_BACKOFF)
+        settings['smtp_concurrency'] = config['EMAIL'].getint('envios_paralelos', 1)
+        # Seconds without trying the relay once it refused connections through every retry
+        settings['smtp_circuit_reset'] = config['EMAIL'].getfloat('pausa_servidor_caido', DEFAULT_CIRCUIT_RESET)
+        # Above this many rows a report goes as a summary plus a CSV attachment
+        settings['max_inline_rows'] = config['EMAIL'].getint('max_filas_correo', DEFAULT_MAX_INLINE_ROWS)
+        settings['attach_csv'] = config['EMAIL'].getboolean('adjuntar_csv', False)
+        # "nuevos": only new albaranes plus reminders every recordatorio_horas (needs historial)
+        settings['notify_mode'] = config['EMAIL'].get('notificar', NOTIFY_ALL).strip().lower()
+        if settings['notify_mode'] not in NOTIFY_MODES:
+            raise ValueError(f"Unknown notificar: {settings['notify_mode']}. Expected one of {list(NOTIFY_MODES)}")
+        settings['reminder_hours'] = config['EMAIL'].getfloat('recordatorio_horas', 24)
+
+        # Log file (rotated at max_mb, keeping `copias` old files), line format and levels.
+        # niveles sets the level of single source files, e.g. "db_client=DEBUG, pdf_worker=WARNING".
+        if 'REGISTRO' not in config:
+            config['REGISTRO'] = {}
+        settings['log_path'] = config['REGISTRO'].get('archivo', DEFAULT_LOG_FILE)
+        settings['log_format'] = config['REGISTRO'].get('formato', LOG_TEXT).strip().lower()
+        if settings['log_format'] not in LOG_FORMATS:
+            raise ValueError(f"Unknown formato: {settings['log_format']}. Expected one of {list(LOG_FORMATS)}")
+        settings['log_level'] = parse_level(config['REGISTRO'].get('nivel', 'INFO'))
+        settings['log_module_levels'] = parse_module_levels(config['REGISTRO'].get('niveles', ''))
+        # The console is slow on the Windows scheduler host: e.g. nivel_consola = WARNING
+        console_level = config['REGISTRO'].get('nivel_consola', '')
+        settings['log_console_level'] = parse_level(console_level) if console_level.strip() else None
+        settings['log_max_mb'] = config['REGISTRO'].getfloat('max_mb', DEFAULT_MAX_MB)
+        settings['log_backups'] = config['REGISTRO'].getint('copias', DEFAULT_BACKUPS)
+
+        # Run metrics: JSON summary (empty disables) and optional Prometheus textfile
+        if 'METRICAS' not in config:
+            config['METRICAS'] = {}
+        settings['metrics_json'] = config['METRICAS'].get('json', 'auto_check_metrics.json')
+        settings['metrics_prometheus'] = config['METRICAS'].get('prometheus', '')
+        if settings['debug_email']:
+             logging.info(f"DEBUG MODE ACTIVE: All emails (Central + Centers) will be sent to {settings['debug_email']}")
+             settings['central_recipients'] = [settings['debug_email']]
         
         # Load Center > Email, Name Mapping
         center_emails = {}
@@ -65,103 +202,476 @@ def main():
         if 'NOMBRES_CENTROS' in config:
             for key in config['NOMBRES_CENTROS']:
                 center_names[key] = config['NOMBRES_CENTROS'][key]
+        # Center code -> (email, name), with '060' and 60 as the same center
+        settings['center_router'] = CenterRouter(center_emails, center_names, settings['debug_email'])
                 
     except KeyError as e:
         logging.error(f"Missing configuration key: {e}")
-        return
+        return None
+    except ValueError as e:
+        logging.error(f"Invalid configuration value: {e}")
+        return None
 
-    # 2. Check PDFs
-    corrupt_files = scan_directory(pdf_path, days_back, fecha_desde)
-    
-    if not corrupt_files:
-        logging.info("No corrupt files found. Process finished.")
-        return
-
-    logging.info(f"Found {len(corrupt_files)} corrupt files.")
-    
+    return settings
+
+def open_verdict_cache(settings):
+    if not settings['cache_path']:
+        return None
+    try:
+        return VerdictCache(settings['cache_path'], settings['cache_max_entries'], settings['cache_max_days'])
+    except Exception as e:
+        logging.warning(f"Could not open verdict cache {settings['cache_path']}: {e}. Validating all files.")
+        return None
+
+def open_run_history(settings):
+    from src.run_history import RunHistory
+
+    if not settings['history_path']:
+        return None
+    try:
+        return RunHistory(settings['history_path'], settings['reminder_hours'], settings['history_max_days'])
+    except Exception as e:
+        logging.warning(f"Could not open run history {settings['history_path']}: {e}. Notifying every corrupt file.")
+        return None
+
+def start_validation_pool(settings):
+    """
+    Starts the validation workers once for the whole run (scan or watch session).
+    """
+    from src.log_setup import worker_log_config
+
+    # Workers log through this process's log pipeline
+    return ValidationPool(settings['processes'] or None, settings['file_timeout'], settings['memory_limit_mb'],
+                          settings['max_tasks_per_child'], settings['page_sample'], settings['pages_per_task'],
+                          log_config=worker_log_config())
+
+def send_reports(email_client, messages, metrics=None):
+    """
+    Sends (message, barcodes) pairs in one batch. Returns the barcodes
+    included in at least one message that was delivered.
+    """
+    messages = [(message, barcodes) for message, barcodes in messages if message is not None]
+    start = time.perf_counter()
+    results = email_client.send_batch([message for message, _ in messages])
+    if metrics is not None:
+        metrics.add_time("email", time.perf_counter() - start)
+        metrics.incr("emails_sent", sum(1 for r in results if r["ok"]))
+        metrics.incr("emails_failed", sum(1 for r in results if not r["ok"]))
+    notified = set()
+    for (_, barcodes), result in zip(messages, results):
+        if result["ok"]:
+            notified.update(barcodes)
+    return notified
+
+def notified_albaranes(central_notified, center_messages, centers_notified):
+    """
+    Albaranes whose own report was delivered: their center's report, or the
+    Central one for those without a center report (not in the DB, or no
+    email configured for their center). Central lists every albaran, so its
+    delivery alone doesn't notify a center whose report failed.
+    """
+    owned = {barcode for _, barcodes in center_messages for barcode in barcodes}
+    return set(centers_notified) | (set(central_notified) - owned)
+
+def open_db_client(settings, metrics=None):
+    """
+    Returns (DBClient, AlbaranDetailCache or None). Connections open on first use.
+    """
+    from src.db_client import DBClient
+    from src.db_backends import BACKEND_SQLITE, SQLiteBackend
+    from src.detail_cache import AlbaranDetailCache
+
+    detail_cache = None
+    if settings['detail_cache_path']:
+        try:
+            detail_cache = AlbaranDetailCache(settings['detail_cache_path'], settings['detail_ttl_hours'],
+                                              settings['detail_negative_ttl_hours'], settings['detail_max_entries'])
+        except Exception as e:
+            logging.warning(f"Could not open detail cache {settings['detail_cache_path']}: {e}. Querying all albaranes.")
+
+    backend = None
+    if settings['db_backend'] == BACKEND_SQLITE:
+        backend = SQLiteBackend(settings['db_sqlite_path'])
+    db_client = DBClient(settings['dsn_name'], settings['db_user'], settings['db_password'],
+                         batch_size=settings['db_batch_size'], pool_size=settings['db_pool_size'],
+                         parallel_queries=settings['db_parallel'], fetch_size=settings['db_fetch_size'],
+                         cache=detail_cache, metrics=metrics, backend=backend)
+    return db_client, detail_cache
+
+def open_email_client(settings):
+    from src.email_sender import EmailSender
+
+    return EmailSender(settings['smtp_server'], settings['smtp_port'], settings['use_tls'],
+                       settings['sender_email'], max_retries=settings['smtp_retries'],
+                       retry_backoff=settings['smtp_retry_backoff'], concurrency=settings['smtp_concurrency'],
+                       max_inline_rows=settings['max_inline_rows'], attach_csv=settings['attach_csv'],
+                       circuit_reset=settings['smtp_circuit_reset'])
+
+def missing_from_db(corrupt_files, details):
+    """
+    Returns the corrupt albaranes without DB rows, and logs them.
+    """
+    found_ids = {record.cod_barras for record in details}
+    missing_files = [f for f in corrupt_files if f not in found_ids]
+    if missing_files:
+        logging.warning(f"Files found on disk but NOT in DB: {missing_files}")
+    return missing_files
+
+def central_report(email_client, corrupt_files, settings):
+    """
+    Returns the (message, barcodes) pair of the Central report.
+    """
+    # Central gets the full list; the ones missing from the DB are only in the log
+    return email_client.build_central_report(settings['central_recipients'], corrupt_files), corrupt_files
+
+def center_reports(email_client, details, settings):
+    """
+    Groups the DB records by center (ALM) and returns a (message, barcodes)
+    pair per center with a configured email.
+    """
+    router = settings['center_router']
+    messages = []
+    for center_code, records in router.group(details).items():
+        route = router.route(center_code)
+        if route is None:
+            logging.warning(f"No email configured for Center {center_code}. Skipping notification for this center.")
+            continue
+
+        recipient, center_name = route
+        logging.info(f"Sending report to {center_name} ({recipient}) with {len(records)} items.")
+        messages.append((email_client.build_center_report(recipient, records, center_name),
+                         [record.cod_barras for record in records]))
+
+    return messages
+
+def notify_corrupt_files(corrupt_files, settings, metrics=None):
+    """
+    Looks up the corrupt albaranes in the DB and emails Central and each center.
+    Returns (barcodes notified, barcodes not found in the DB).
+    """
     # 4. Query DB for Details
     details = []
+    db_client, detail_cache = open_db_client(settings, metrics)
+    db_start = time.perf_counter()
     try:
-        db_client = DBClient(dsn_name, db_user, db_password)
         details = db_client.get_albaran_details(corrupt_files)
     except Exception as e:
         logging.error(f"Failed to query database: {e}")
         # Proceed with empty details to at least notify central about files
-    
-    # Identify Missing Files (Not found in DB)
-    # DB keys are uppercase now (COD_BARRAS matches filename stem)
-    found_ids = set()
+    finally:
+        db_client.close()
+        if detail_cache is not None:
+            detail_cache.close()
+        if metrics is not None:
+            metrics.add_time("db_lookup", time.perf_counter() - db_start)
+
+    missing_files = missing_from_db(corrupt_files, details)
+
+    # 3. Notify Central, 5. and each center
+    # All reports go out in one batch over a reused SMTP session
+    email_client = open_email_client(settings)
+    messages = []
     if details:
-        for r in details:
-            # Handle potential Decimal/clean types
-            val = str(r.get('COD_BARRAS', r.get('cod_barras', ''))).split('.')[0] 
-            found_ids.add(val)
+        messages = center_reports(email_client, details, settings)
+    else:
+        logging.warning("No details found in DB for the corrupt files.")
+    central_message, _ = central_report(email_client, corrupt_files, settings)
+    # Central only notifies the albaranes no center report covers
+    notified = send_reports(email_client, [(central_message, notified_albaranes(corrupt_files, messages, ()))]
+                            + messages, metrics)
 
-    missing_files = [f for f in corrupt_files if f not in found_ids]
-    
-    if missing_files:
-        logging.warning(f"Files found on disk but NOT in DB: {missing_files}")
+    logging.info("Process completed successfully.")
+    return notified, missing_files
 
-    # 3. Notify Central
-    # We pass both lists so Central knows what's going on
-    email_client = EmailSender(smtp_server, smtp_port, use_tls, sender_email)
-    # Append note about missing files to central report logic (requires modifying send_central_report signature or just appending here? 
-    # Let's keep signature simple and just pass 'corrupt_files' but maybe we log it.
-    # Ideally we'd tell Central which ones failed DB check.
-    # For now, let's just stick to the original list for Central, but user knows to check logs.
-    email_client.send_central_report(central_recipients, corrupt_files)
+def run_once(settings):
+    metrics = RunMetrics()
+    try:
+        _run_once(settings, metrics)
+    finally:
+        metrics.write(settings['metrics_json'], settings['metrics_prometheus'])
 
-    if not details:
-        logging.warning("No details found in DB for the corrupt files.")
-        return
-
-    # 5. Group by Center and Notify
-    grouped_data = defaultdict(list)
-    for record in details:
-        # Assuming 'ALM' is the center code from DB
-        # Handle Decimal values by converting to int then str to remove .0
-        raw_alm = record.get('ALM', '')
+def scan_options(settings):
+    """
+    Keyword arguments of iter_corrupt_files/scan_directory taken from the settings.
+    """
+    return dict(validation_depth=settings['validation_depth'], chunksize=settings['chunksize'],
+                max_in_flight=settings['max_in_flight'], recursive=settings['recursive'],
+                max_depth=settings['max_depth'], exclude=settings['exclude'],
+                walker_threads=settings['walker_threads'], prune_dirs=settings['prune_dirs'],
+                execution=settings['execution'], read_threads=settings['read_threads'],
+                max_read_threads=settings['max_read_threads'], read_ahead=settings['read_ahead'],
+                read_memory_mb=settings['read_memory_mb'], revision_policy=settings['revision_policy'],
+                newest_by=settings['newest_by'], skip_copies=settings['skip_copies'])
+
+def _run_once(settings, metrics):
+    """
+    Scans, looks up and notifies with the stages overlapped (see
+    orchestrator.run_pipeline): corrupt albaranes go to the DB in batches
+    while the scan goes on.
+    """
+    # 2. Check PDFs
+    # Workers start booting now, while the caches open and the folders are listed
+    pool = start_validation_pool(settings)
+    scan_errors = []
+
+    def local_scan():
+        # Runs in the orchestrator's scan thread, which owns the verdict cache (SQLite connection)
+        verdict_cache = open_verdict_cache(settings)
         try:
-             # If it's a decimal like 160.00, this makes it '160'
-             center_code = str(int(float(raw_alm)))
-        except (ValueError, TypeError):
-             center_code = str(raw_alm).strip()
-             
-        grouped_data[center_code].append(record)
-
-    for center_code, records in grouped_data.items():
-        # Look for email in config mapping
-        recipient = center_emails.get(center_code)
-        
-        if not recipient:
-             # Try removing leading zeros (just in case config has '60')
-             recipient = center_emails.get(center_code.lstrip('0'))
-        
-        if not recipient:
-             # Try adding leading zeros (DB has '60', config has '060')
-             recipient = center_emails.get(center_code.zfill(3))
-
-        # Get Center Name
-        # Try all variants: exact, stripped, filled
-        center_name = center_names.get(center_code)
-        if not center_name:
-             center_name = center_names.get(center_code.lstrip('0'))
-        if not center_name:
-             center_name = center_names.get(center_code.zfill(3))
-             
-        if not center_name:
-             center_name = f"CENTRO {center_code}"
-             
-        if recipient:
-            if debug_email:
-                 recipient = debug_email
-            
-            logging.info(f"Sending report to {center_name} ({recipient}) with {len(records)} items.")
-            email_client.send_center_report(recipient, records, center_name)
+            yield from iter_corrupt_files(settings['pdf_paths'], settings['days_back'], settings['fecha_desde'],
+                                          cache=verdict_cache, metrics=metrics, pool=pool, errors=scan_errors,
+                                          **scan_options(settings))
+        finally:
+            if verdict_cache is not None:
+                verdict_cache.close()
+
+    try:
+        _notify_run(local_scan(), settings, metrics, scan_errors)
+    finally:
+        pool.close()
+
+def _notify_run(corrupt_stems, settings, metrics, scan_errors):
+    """
+    Looks up and notifies the corrupt albaranes yielded by `corrupt_stems`
+    (a local scan or the merged results of a sharded one) and records them
+    in the run history. `corrupt_stems` is consumed in the orchestrator's
+    scan thread and fills `scan_errors`; if it reports any, the scan was
+    partial and the history resolves nothing.
+    """
+    from src.orchestrator import run_pipeline
+    from src.run_history import NOTIFY_DELTA
+
+    history = open_run_history(settings)
+    db_client, detail_cache = open_db_client(settings, metrics)
+    email_client = open_email_client(settings)
+    corrupt_files = []
+
+    def due_files():
+        # Every corrupt albaran goes to the history; only those due are looked up and notified
+        delta = history is not None and settings['notify_mode'] == NOTIFY_DELTA
+        for stem in corrupt_stems:
+            corrupt_files.append(stem)
+            if not delta or history.is_due(stem):
+                yield stem
+
+    # What each side delivered: an albaran counts as notified once its own report went out
+    sent = {}
+
+    def notify_central(stems):
+        sent["central"] = send_reports(email_client, [central_report(email_client, stems, settings)], metrics)
+        return sent["central"]
+
+    def notify_centers(rows):
+        sent["center_messages"] = messages = center_reports(email_client, rows, settings)
+        sent["centers"] = send_reports(email_client, messages, metrics)
+        return sent["centers"]
+
+    try:
+        if history is not None:
+            history.start_run()
+        result = run_pipeline(
+            due_files(), db_client.get_albaran_details, notify_central, notify_centers,
+            batch_size=settings['db_batch_size'], lookup_concurrency=settings['db_parallel'], metrics=metrics)
+        notified = notified_albaranes(sent.get("central", ()), sent.get("center_messages", ()),
+                                      sent.get("centers", ()))
+
+        due = result['corrupt']
+        missing = missing_from_db(due, result['rows']) if due else []
+        if due and not result['rows']:
+            logging.warning("No details found in DB for the corrupt files.")
+
+        if scan_errors:
+            logging.warning(f"The scan was partial ({len(scan_errors)} errors); albaranes under the folders "
+                            f"not listed were not checked.")
+            metrics.incr("scan_errors", len(scan_errors))
+        if history is not None:
+            history.record_corrupt(corrupt_files, complete=not scan_errors)
+            history.record_missing(missing)
+            history.record_notified(notified)
+            changes = history.changes()
+            logging.info(f"Since the previous run: {len(changes['new'])} new, "
+                         f"{len(changes['resolved'])} resolved corrupt albaranes.")
+            metrics.incr("albaranes_new", len(changes['new']))
+            metrics.incr("albaranes_resolved", len(changes['resolved']))
+            metrics.incr("albaranes_suppressed", len(corrupt_files) - len(due))
+            # A run that fails before this point is not finished, so the next one ignores it
+            history.finish_run()
+
+        if not corrupt_files:
+            logging.info("No corrupt files found. Process finished.")
+        elif not due:
+            logging.info(f"Found {len(corrupt_files)} corrupt files, all already notified. Process finished.")
         else:
-            logging.warning(f"No email configured for Center {center_code}. Skipping notification for this center.")
+            if len(due) < len(corrupt_files):
+                logging.info(f"Skipped {len(corrupt_files) - len(due)} albaranes already notified.")
+            logging.info(f"Found {len(corrupt_files)} corrupt files. Process completed successfully.")
+    finally:
+        db_client.close()
+        if detail_cache is not None:
+            detail_cache.close()
+        if history is not None:
+            history.close()
 
-    logging.info("Process completed successfully.")
+def run_shard_worker(settings):
+    """
+    Shard mode: scans the partitions leased from the [REPARTO] store and
+    leaves the corrupt albaranes there for the coordinator.
+    """
+    from src.sharding import ShardStore, run_shard
+
+    pool = start_validation_pool(settings)
+    verdict_cache = open_verdict_cache(settings)
+    store = ShardStore(settings['shard_store'], settings['shard_lease_seconds'])
+    scan_errors = []
+    listing = None
+    listing_errors = []
+
+    def scan_partition(partition, partitions):
+        nonlocal listing
+        # The share is walked once, on the first lease; later partitions reuse the listing
+        if listing is None:
+            listing = list_partitions(settings['pdf_paths'], settings['days_back'], partitions,
+                                      settings['fecha_desde'], settings['recursive'], settings['max_depth'],
+                                      settings['exclude'], settings['walker_threads'], settings['prune_dirs'],
+                                      listing_errors)
+        # Folders the walk missed may hold albaranes of every partition
+        scan_errors.extend(listing_errors)
+        return scan_directory(settings['pdf_paths'], settings['days_back'], settings['fecha_desde'],
+                              cache=verdict_cache, pool=pool, errors=scan_errors,
+                              entries=listing.get(partition, []), **scan_options(settings))
+
+    try:
+        run_shard(store, scan_partition, start_wait=settings['shard_start_wait'], errors=scan_errors)
+    finally:
+        store.close()
+        pool.close()
+        if verdict_cache is not None:
+            verdict_cache.close()
+
+def run_coordinator(settings, local_shards: int = 0):
+    """
+    Coordinator of a sharded scan: opens the scan in the [REPARTO] store,
+    optionally starts `local_shards` shard processes on this machine, and
+    looks up and notifies the corrupt albaranes as the shards report them.
+    Shards on other hosts are started with --shard.
+    """
+    import subprocess
+    from src.sharding import ShardStore, iter_shard_results
+
+    store = ShardStore(settings['shard_store'], settings['shard_lease_seconds'])
+    try:
+        scan_id = store.create_scan(settings['shard_partitions'])
+    finally:
+        store.close()
+    logging.info(f"Sharded scan {scan_id}: {settings['shard_partitions']} partitions in {settings['shard_store']}.")
+
+    # Each local shard writes its own log file: only one process may rotate a file
+    log_root, log_ext = os.path.splitext(settings['log_path'])
+    shards = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--shard',
+                                '--log', f"{log_root}.shard{i + 1}{log_ext}"])
+              for i in range(local_shards)]
+    timeout = settings['shard_max_wait_minutes'] * 60 or None
+    metrics = RunMetrics()
+    scan_errors = []
+
+    def shard_results():
+        # Runs in the orchestrator's scan thread, so it gets its own connection
+        results = ShardStore(settings['shard_store'], settings['shard_lease_seconds'])
+        try:
+            yield from iter_shard_results(results, scan_id, timeout=timeout, errors=scan_errors)
+        finally:
+            results.close()
+
+    completed = False
+    try:
+        _notify_run(shard_results(), settings, metrics, scan_errors)
+        completed = True
+    finally:
+        store = ShardStore(settings['shard_store'], settings['shard_lease_seconds'])
+        try:
+            store.close_scan(scan_id)
+        finally:
+            store.close()
+        for shard in shards:
+            # Once every partition is done the shards exit on their own
+            if not completed:
+                shard.terminate()
+            shard.wait()
+        metrics.write(settings['metrics_json'], settings['metrics_prometheus'])
+
+def run_watch(settings):
+    """
+    Long-running mode: validates PDFs as they land and notifies the findings
+    every `intervalo_envio` seconds.
+    """
+    from src.watcher import watch_directories
+
+    if settings['revision_policy'] != REVISIONS_ALL:
+        logging.warning(f"revisiones = {settings['revision_policy']} does not apply to watch mode: "
+                        f"every file is reported on its own.")
+    pool = start_validation_pool(settings)
+    verdict_cache = open_verdict_cache(settings)
+    try:
+        watch_directories(settings['pdf_paths'], lambda stems: notify_corrupt_files(stems, settings),
+                          mode=settings['watch_mode'], poll_interval=settings['watch_poll_interval'],
+                          flush_interval=settings['watch_flush_interval'],
+                          validation_depth=settings['validation_depth'], recursive=settings['recursive'],
+                          max_depth=settings['max_depth'], exclude=settings['exclude'], cache=verdict_cache,
+                          pool=pool)
+    finally:
+        pool.close()
+        if verdict_cache is not None:
+            verdict_cache.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks scanned albaran PDFs and reports the corrupt ones.")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and validate PDFs as they are written (see [VIGILANCIA]).")
+    parser.add_argument("--coordinate", action="store_true",
+                        help="Split the scan among shards (see [REPARTO]) and notify their results.")
+    parser.add_argument("--local-shards", type=int, default=0, metavar="N",
+                        help="With --coordinate, also start N shard processes on this machine.")
+    parser.add_argument("--shard", action="store_true",
+                        help="Scan partitions of the open sharded scan (see [REPARTO]).")
+    parser.add_argument("--log", metavar="FILE", help="Log file (default: [REGISTRO] archivo).")
+    args = parser.parse_args()
+
+    # Defaults until config.ini is read, then the [REGISTRO] options
+    logs = setup_logging(log_path=args.log)
+    try:
+        # 1. Load Config
+        config = configparser.ConfigParser()
+        config_path = 'config.ini'
+        if not os.path.exists(config_path):
+            logging.error("config.ini not found!")
+            res = config.read(config_path)
+            if not res:
+                 logging.error("Failed to read config.ini")
+                 return
+
+        config.read(config_path)
+
+        settings = load_settings(config)
+        if settings is None:
+            return
+        logs.stop()
+        logs = setup_logging(settings, args.log)
+        logging.info("Starting Auto Check Albaran...")
+
+        if (args.coordinate or args.shard) and not settings['shard_store']:
+            logging.error("--coordinate and --shard need [REPARTO] almacen in config.ini")
+            return
+
+        if args.watch:
+            run_watch(settings)
+        elif args.shard:
+            run_shard_worker(settings)
+        elif args.coordinate:
+            run_coordinator(settings, args.local_shards)
+        else:
+            run_once(settings)
+    finally:
+        logs.stop()
 
 if __name__ == "__main__":
     main()
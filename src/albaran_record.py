@@ -0,0 +1,146 @@
+import logging
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+# Columns of the detail query (db_client), in select order. DB2 returns
+# them in uppercase; they are matched case-insensitively.
+FIELDS = ("cod_barras", "flag", "alm", "num_int", "fecha", "cuenta_mayor", "prov_codigo", "division",
+          "serie", "albaran", "proveedor_desc")
+
+def normalise_value(value: Any) -> Any:
+    """
+    AS400 values as they are shown and compared: integral DECIMAL/float
+    columns become int (160.00 -> 160), CHAR columns lose their padding.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else value
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+def normalise_barcode(value: Any) -> str:
+    """
+    COD_BARRAS as a filename-style stem (Decimal/float values lose their '.0').
+    """
+    return str(normalise_value(value)).split('.')[0]
+
+def normalise_center(value: Any) -> Any:
+    """
+    Center code (ALM) as an int when it is numeric, so '060', '60' and
+    60.00 are the same center. Non-numeric codes are compared in
+    uppercase (configparser lowercases the [CENTROS] keys).
+    """
+    value = normalise_value(value)
+    if isinstance(value, str):
+        try:
+            # '60.00' is what a Decimal ALM looks like once it went through text
+            number = Decimal(value)
+        except ArithmeticError:
+            number = None
+        if number is not None and number.is_finite():
+            return normalise_value(number)
+        return value.upper() or None
+    return value
+
+class AlbaranRecord:
+    """
+    One detail row of an albaran, normalised once when it is fetched:
+    `cod_barras` is the filename stem, `alm` the center code (see
+    normalise_center) and the other columns are unpadded, with integral
+    decimals as int. Slotted, so large result sets take a fraction of the
+    memory of one dict per row.
+    """
+    __slots__ = FIELDS
+
+    def __init__(self, cod_barras: str, flag=None, alm=None, num_int=None, fecha=None, cuenta_mayor=None,
+                 prov_codigo=None, division=None, serie=None, albaran=None, proveedor_desc=None):
+        self.cod_barras = cod_barras
+        self.flag = flag
+        self.alm = alm
+        self.num_int = num_int
+        self.fecha = fecha
+        self.cuenta_mayor = cuenta_mayor
+        self.prov_codigo = prov_codigo
+        self.division = division
+        self.serie = serie
+        self.albaran = albaran
+        self.proveedor_desc = proveedor_desc
+
+    @classmethod
+    def from_values(cls, values: Sequence[Any]) -> "AlbaranRecord":
+        """
+        Builds a record from raw column values in FIELDS order.
+        """
+        normalise = normalise_value
+        return cls(normalise_barcode(values[0]), normalise(values[1]), normalise_center(values[2]),
+                   *map(normalise, values[3:]))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in FIELDS}
+
+    def __eq__(self, other):
+        if not isinstance(other, AlbaranRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in FIELDS)
+
+    def __repr__(self):
+        return f"AlbaranRecord({self.cod_barras!r}, alm={self.alm!r}, num_int={self.num_int!r})"
+
+def record_factory(columns: Sequence[str]) -> Callable[[Sequence[Any]], AlbaranRecord]:
+    """
+    Returns a function that turns a cursor row with these column names
+    into an AlbaranRecord. Column positions are resolved once per cursor;
+    columns the query doesn't return are left as None.
+    """
+    positions = {name.lower(): i for i, name in enumerate(columns)}
+    missing = [field for field in FIELDS if field not in positions]
+    if missing:
+        logging.warning(f"Detail query did not return columns {missing}.")
+    if not missing and [positions[field] for field in FIELDS] == list(range(len(FIELDS))):
+        return AlbaranRecord.from_values
+    order = [positions.get(field) for field in FIELDS]
+    return lambda row: AlbaranRecord.from_values([None if i is None else row[i] for i in order])
+
+class CenterRouter:
+    """
+    Center code -> (recipient, center name) index built once from the
+    [CENTROS] and [NOMBRES_CENTROS] sections. Codes are keyed by
+    normalise_center, so '060' in config.ini matches center 60 in the DB.
+    With a `debug_email`, every center is routed to it.
+    """
+
+    def __init__(self, center_emails: Mapping[str, str], center_names: Mapping[str, str] = None,
+                 debug_email: str = None):
+        names: Dict[Any, str] = {}
+        for code, name in (center_names or {}).items():
+            names.setdefault(normalise_center(code), name)
+
+        self._routes: Dict[Any, Tuple[str, str]] = {}
+        for code, recipient in center_emails.items():
+            key = normalise_center(code)
+            if key in self._routes:
+                logging.warning(f"Center {code} is configured twice in [CENTROS]; keeping the first email.")
+                continue
+            self._routes[key] = (debug_email or recipient, names.get(key) or f"CENTRO {key}")
+
+    def route(self, center) -> Optional[Tuple[str, str]]:
+        """
+        Returns (recipient, center name) of a center code, or None if it has no email.
+        """
+        return self._routes.get(normalise_center(center) if isinstance(center, str) else center)
+
+    def group(self, records: Iterable[AlbaranRecord]) -> Dict[Any, List[AlbaranRecord]]:
+        """
+        Groups records by center code, in order of first appearance.
+        """
+        grouped: Dict[Any, List[AlbaranRecord]] = {}
+        for record in records:
+            grouped.setdefault(record.alm, []).append(record)
+        return grouped
+
+    def __len__(self):
+        return len(self._routes)
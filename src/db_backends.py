@@ -0,0 +1,89 @@
+import os
+import sqlite3
+from urllib.request import pathname2url
+
+# Where DBClient reads albaran details from ([DATABASE] motor)
+BACKEND_ODBC = "odbc"      # the AS400, through pyodbc and a DSN
+BACKEND_SQLITE = "sqlite"  # a local SQLite copy of the tables, for tests and benchmarks
+BACKENDS = (BACKEND_ODBC, BACKEND_SQLITE)
+
+# The AS400 tables read by the detail query, with the columns it uses.
+# Numeric columns are DECIMAL and text columns fixed-width CHAR, as on DB2.
+SQLITE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS DRVAA00K (
+        HVPROG DECIMAL(13, 0) NOT NULL,
+        HVFELA CHAR(1),
+        HVKEY1 DECIMAL(3, 0),
+        HVKEY2 DECIMAL(9, 0)
+    );
+    CREATE INDEX IF NOT EXISTS DRVAA00K_HVPROG ON DRVAA00K(HVPROG);
+    CREATE TABLE IF NOT EXISTS ENTMEC (
+        EMCALM DECIMAL(3, 0) NOT NULL,
+        EMCNUM DECIMAL(9, 0) NOT NULL,
+        EMCFEE DECIMAL(8, 0),
+        EMCMAY DECIMAL(4, 0),
+        EMCCTA DECIMAL(6, 0),
+        EMCDIV DECIMAL(3, 0),
+        EMCSER CHAR(2),
+        EMCDOC CHAR(10),
+        PRIMARY KEY (EMCALM, EMCNUM)
+    );
+    CREATE TABLE IF NOT EXISTS PRODIV (
+        PDMAYO DECIMAL(4, 0) NOT NULL,
+        PDCTAA DECIMAL(6, 0) NOT NULL,
+        PDDIVI DECIMAL(3, 0) NOT NULL,
+        PDDESC CHAR(40),
+        PRIMARY KEY (PDMAYO, PDCTAA, PDDIVI)
+    );
+"""
+
+class ODBCBackend:
+    """
+    The AS400, through pyodbc and an ODBC DSN.
+    """
+
+    def __init__(self, dsn: str, user: str, password: str):
+        self.dsn = dsn
+        self.connection_string = f"DSN={dsn};UID={user};PWD={password}"
+
+    def connect(self):
+        # Imported here so that importing this module (e.g. from a
+        # spawned pool worker re-importing main.py) doesn't load the ODBC driver manager
+        import pyodbc
+        return pyodbc.connect(self.connection_string)
+
+    def __str__(self):
+        return f"DSN {self.dsn}"
+
+class SQLiteBackend:
+    """
+    Local stand-in for the AS400: a SQLite file with the DRVAA00K, ENTMEC
+    and PRODIV tables (see SQLITE_SCHEMA), attached read-only as "$$LIBFAL"
+    and LIB001 so the production query runs unchanged.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._uri = f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro"
+
+    def connect(self) -> sqlite3.Connection:
+        # Fails like an unreachable AS400 would: on first use, not at startup
+        if not os.path.isfile(self.db_path):
+            raise FileNotFoundError(f"SQLite database not found: {self.db_path}")
+        # Pooled connections are handed from thread to thread, one at a time
+        conn = sqlite3.connect("file::memory:", uri=True, check_same_thread=False)
+        conn.execute('ATTACH DATABASE ? AS "$$LIBFAL"', (self._uri,))
+        conn.execute("ATTACH DATABASE ? AS LIB001", (self._uri,))
+        return conn
+
+    def __str__(self):
+        return f"SQLite {self.db_path}"
+
+def create_sqlite_database(db_path: str) -> sqlite3.Connection:
+    """
+    Creates (or opens) a SQLite database with the AS400 tables and returns
+    a writable connection to fill it.
+    """
+    conn = sqlite3.connect(db_path)
+    conn.executescript(SQLITE_SCHEMA)
+    return conn
@@ -1,29 +1,110 @@
-import pyodbc
+import time
+import queue
 import logging
-from typing import List, Dict, Any
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict
+from typing import Callable, List, Iterator
+
+from albaran_record import AlbaranRecord, record_factory
+from db_backends import ODBCBackend
+
+# DB2/ODBC limits the number of parameter markers per statement and huge IN
+# lists get slow plans, so lookups are split into chunks of this size.
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FETCH_SIZE = 1000
+
+class _ConnectionPool:
+    """
+    Small pool of reusable DB connections, opened lazily with `connect`, up
+    to `size`. A connection that raised an error is discarded.
+    """
+
+    def __init__(self, connect: Callable, size: int):
+        self.connect = connect
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        conn = None
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                try:
+                    conn = self.connect()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+
+        try:
+            yield conn
+        except BaseException:
+            # Includes GeneratorExit when a caller stops reading mid-result
+            self._discard(conn)
+            raise
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn):
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
 
 class DBClient:
-    def __init__(self, dsn: str, user: str, password: str):
+    def __init__(self, dsn: str = None, user: str = None, password: str = None, batch_size: int = DEFAULT_BATCH_SIZE,
+                 pool_size: int = 1, parallel_queries: int = 1, fetch_size: int = DEFAULT_FETCH_SIZE,
+                 cache=None, metrics=None, backend=None):
         self.dsn = dsn
         self.user = user
         self.password = password
-        self.connection_string = f"DSN={dsn};UID={user};PWD={password}"
+        # Anything with a connect() returning a DB-API connection (db_backends); the AS400 by default
+        self.backend = backend or ODBCBackend(dsn, user, password)
+        self.batch_size = max(1, batch_size)
+        self.parallel_queries = max(1, parallel_queries)
+        self.fetch_size = max(1, fetch_size)
+        # Optional AlbaranDetailCache in front of the AS400
+        self.cache = cache
+        # Optional RunMetrics for chunk and row counts
+        self.metrics = metrics
+        self._pool = _ConnectionPool(self.backend.connect, max(pool_size, self.parallel_queries))
 
-    def get_albaran_details(self, albaran_numbers: List[str]) -> List[Dict[str, Any]]:
+    def close(self):
         """
-        Queries AS400 for details of the given albaran numbers.
-        Returns a list of dictionaries.
+        Closes the pooled connections.
         """
-        if not albaran_numbers:
-            return []
+        self._pool.close()
 
+    def _build_query(self, count: int) -> str:
         # Sanitize inputs (ensure they are strings/numbers)
         # The albaran numbers from PDF filename might need casting or trimming?
         # Assuming they match EMCNUM or similar field. 
         # Based on user QRY, T01.EMCNUM seems to be the join key.
         
         # Prepare placeholders for IN clause
-        placeholders = ",".join("?" for _ in albaran_numbers)
+        placeholders = ",".join("?" for _ in range(count))
         
         # IMPORTANT: The user provided QRY code has hardcoded library names (LIB001, BIESTADI, "$$LIBFAL").
         # I will use them as is, but this might need adjustment if they are variables.
@@ -73,21 +154,100 @@ class DBClient:
             T02.EMCALM ASC,
             T02.EMCNUM ASC
         """
-        
-        results = []
+        return sql_query
+
+    def _iter_chunk_rows(self, chunk: List[str]) -> Iterator[AlbaranRecord]:
+        """
+        Runs the query for one chunk, fetching rows in batches of `fetch_size`
+        and normalising each into an AlbaranRecord.
+        """
+        with self._pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self._build_query(len(chunk)), chunk)
+
+                make_record = record_factory([column[0] for column in cursor.description])
+                while True:
+                    rows = cursor.fetchmany(self.fetch_size)
+                    if not rows:
+                        break
+                    yield from map(make_record, rows)
+            finally:
+                cursor.close()
+
+    def _chunk_done(self, index: int, total: int, chunk: List[str], rows: int, seconds: float):
+        logging.info(f"DB chunk {index}/{total}: {len(chunk)} albaranes, {rows} rows in {seconds:.2f}s")
+        if self.metrics is not None:
+            self.metrics.incr("db_chunks")
+            self.metrics.incr("db_rows", rows)
+
+    def _query_chunk(self, index: int, total: int, chunk: List[str]) -> List[AlbaranRecord]:
+        start = time.perf_counter()
+        rows = list(self._iter_chunk_rows(chunk))
+        self._chunk_done(index, total, chunk, len(rows), time.perf_counter() - start)
+        return rows
+
+    def iter_albaran_details(self, albaran_numbers: List[str]) -> Iterator[AlbaranRecord]:
+        """
+        Queries AS400 for details of the given albaran numbers, in chunks of
+        `batch_size`, running up to `parallel_queries` chunks at once.
+        Yields one AlbaranRecord per row as each chunk's rows arrive.
+        If a cache is set, cached barcodes are served from it and only the
+        rest are queried.
+        """
+        # Duplicate stems (several revisions of one albaran) only need one lookup
+        albaran_numbers = list(dict.fromkeys(albaran_numbers))
+        if self.cache is None:
+            yield from self._query_albaran_details(albaran_numbers)
+            return
+
+        requested = len(albaran_numbers)
+        cached_rows, albaran_numbers = self.cache.get_many(albaran_numbers)
+        logging.info(f"Detail cache: {requested - len(albaran_numbers)} hits, {len(albaran_numbers)} to query.")
+        yield from cached_rows
+
+        found = defaultdict(list)
+        for row in self._query_albaran_details(albaran_numbers):
+            found[row.cod_barras].append(row)
+            yield row
+        self.cache.store(albaran_numbers, found)
+
+    def _query_albaran_details(self, albaran_numbers: List[str]) -> Iterator[AlbaranRecord]:
+        if not albaran_numbers:
+            return
+
+        chunks = [albaran_numbers[i:i + self.batch_size] for i in range(0, len(albaran_numbers), self.batch_size)]
+        total = len(chunks)
+
         try:
-            with pyodbc.connect(self.connection_string) as conn:
-                cursor = conn.cursor()
-                cursor.execute(sql_query, albaran_numbers)
-                
-                columns = [column[0] for column in cursor.description]
-                for row in cursor.fetchall():
-                    results.append(dict(zip(columns, row)))
-                    
+            if self.parallel_queries == 1 or total == 1:
+                for index, chunk in enumerate(chunks, 1):
+                    start = time.perf_counter()
+                    count = 0
+                    for row in self._iter_chunk_rows(chunk):
+                        count += 1
+                        yield row
+                    self._chunk_done(index, total, chunk, count, time.perf_counter() - start)
+            else:
+                with ThreadPoolExecutor(max_workers=self.parallel_queries) as executor:
+                    futures = [executor.submit(self._query_chunk, index, total, chunk)
+                               for index, chunk in enumerate(chunks, 1)]
+                    try:
+                        for future in as_completed(futures):
+                            yield from future.result()
+                    finally:
+                        for future in futures:
+                            future.cancel()
+
         except Exception as e:
-            logging.error(f"Database error: {e}")
+            logging.error(f"Database error ({self.backend}): {e}")
             # If development/dry_run without DB, return empty or mock? 
             # For now just log and re-raise or return empty.
             raise e
-            
-        return results
+
+    def get_albaran_details(self, albaran_numbers: List[str]) -> List[AlbaranRecord]:
+        """
+        Queries AS400 for details of the given albaran numbers.
+        Returns a list of AlbaranRecord.
+        """
+        return list(self.iter_albaran_details(albaran_numbers))
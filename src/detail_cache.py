@@ -0,0 +1,139 @@
+import json
+import sqlite3
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from albaran_record import AlbaranRecord
+
+class AlbaranDetailCache:
+    """
+    Local TTL cache of AS400 detail rows, keyed by COD_BARRAS, so a barcode
+    that stays corrupt for several runs is not queried every time.
+
+    Barcodes that were not found in the DB are cached too (negative entries,
+    with their own, usually shorter, TTL). The cache is bounded to
+    `max_entries`, evicting the least recently used barcodes first.
+    """
+
+    def __init__(self, db_path: str, ttl_hours: float = 24, negative_ttl_hours: float = 6,
+                 max_entries: int = 50000):
+        self.db_path = db_path
+        self.ttl = ttl_hours * 3600
+        self.negative_ttl = negative_ttl_hours * 3600
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.RLock()
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS details (
+                cod_barras TEXT PRIMARY KEY,
+                rows TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_details_last_access ON details(last_access)")
+        self._conn.commit()
+
+    def get_many(self, barcodes: List[str]) -> Tuple[List[AlbaranRecord], List[str]]:
+        """
+        Returns (cached rows, barcodes that must be queried). Barcodes cached
+        as not found return no rows and are not queried again until they expire.
+        """
+        now = time.time()
+        with self._lock:
+            return self._get_many(barcodes, now)
+
+    def _get_many(self, barcodes: List[str], now: float) -> Tuple[List[AlbaranRecord], List[str]]:
+        rows = []
+        to_query = []
+        hit_keys = []
+
+        # SQLite's default limit on bound variables is 999
+        cached = {}
+        for i in range(0, len(barcodes), 900):
+            chunk = barcodes[i:i + 900]
+            placeholders = ",".join("?" for _ in chunk)
+            for cod_barras, rows_json, found, fetched_at in self._conn.execute(
+                    f"SELECT cod_barras, rows, found, fetched_at FROM details WHERE cod_barras IN ({placeholders})", chunk):
+                cached[cod_barras] = (rows_json, found, fetched_at)
+
+        for barcode in barcodes:
+            entry = cached.get(barcode)
+            if entry is not None:
+                rows_json, found, fetched_at = entry
+                ttl = self.ttl if found else self.negative_ttl
+                if now - fetched_at < ttl:
+                    rows.extend(AlbaranRecord(**row) for row in json.loads(rows_json))
+                    hit_keys.append(barcode)
+                    continue
+            to_query.append(barcode)
+
+        self.hits += len(hit_keys)
+        self.misses += len(to_query)
+        if hit_keys:
+            self._conn.executemany("UPDATE details SET last_access = ? WHERE cod_barras = ?",
+                                   ((now, k) for k in hit_keys))
+            self._conn.commit()
+
+        return rows, to_query
+
+    def store(self, queried: Iterable[str], rows_by_barcode: Dict[str, List[AlbaranRecord]]):
+        """
+        Stores the result of a lookup: the rows found for each barcode, and a
+        negative entry for each queried barcode without rows.
+        """
+        now = time.time()
+        entries = []
+        for barcode in queried:
+            rows = rows_by_barcode.get(barcode, [])
+            # default=str keeps Decimal/date values printable the same way
+            entries.append((barcode, json.dumps([row.as_dict() for row in rows], default=str),
+                            int(bool(rows)), now, now))
+
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO details VALUES (?, ?, ?, ?, ?)", entries)
+            self._conn.commit()
+            self.evict()
+
+    def invalidate(self, barcode: str = None):
+        """
+        Drops the entry for `barcode`, or every entry if no barcode is given.
+        """
+        with self._lock:
+            if barcode is None:
+                self._conn.execute("DELETE FROM details")
+            else:
+                self._conn.execute("DELETE FROM details WHERE cod_barras = ?", (barcode,))
+            self._conn.commit()
+
+    def evict(self):
+        """
+        Removes expired entries, then the least recently used ones until at
+        most `max_entries` remain.
+        """
+        now = time.time()
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM details WHERE (found = 1 AND fetched_at < ?) OR (found = 0 AND fetched_at < ?)",
+                (now - self.ttl, now - self.negative_ttl)).rowcount
+
+            if self.max_entries and self.max_entries > 0:
+                removed += self._conn.execute("""
+                    DELETE FROM details WHERE cod_barras IN (
+                        SELECT cod_barras FROM details ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,)).rowcount
+
+            self._conn.commit()
+            if removed:
+                logging.info(f"Detail cache: evicted {removed} entries.")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
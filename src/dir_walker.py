@@ -0,0 +1,108 @@
+import os
+import fnmatch
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, List, Optional, Tuple
+
+DEFAULT_WALKER_THREADS = 8
+
+def is_excluded(path: str, name: str, exclude: List[str]) -> bool:
+    """
+    True if `name` or `path` matches any of the `exclude` glob patterns.
+    """
+    if not exclude:
+        return False
+    path = path.replace("\\", "/")
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in exclude)
+
+def _list_directory(path: str, depth: int, cutoff_ts: float, descend: bool,
+                    exclude: List[str], prune_by_mtime: bool) -> Tuple[List[os.DirEntry], List[str], Optional[str]]:
+    """
+    Lists one directory. Returns (recent PDF entries, subdirectories to visit,
+    error message or None if it was listed completely).
+    Runs in a worker thread, so the per-file stat() calls of several
+    directories overlap instead of running one after another.
+    """
+    files = []
+    subdirs = []
+    error = None
+
+    # A directory's mtime only changes when entries are added, removed or
+    # renamed, so an old directory has no newly written files. Its
+    # subdirectories are still visited, since their changes don't bubble up.
+    skip_files = False
+    if prune_by_mtime and depth > 0:
+        try:
+            skip_files = os.stat(path).st_mtime < cutoff_ts
+        except OSError:
+            pass
+
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if is_excluded(entry.path, entry.name, exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if descend:
+                        subdirs.append(entry.path)
+                elif not skip_files and entry.name.lower().endswith(".pdf") and entry.is_file():
+                    # Check modification time
+                    if entry.stat().st_mtime >= cutoff_ts:
+                        files.append(entry)
+    except OSError as e:
+        error = f"Error scanning directory {path}: {e}"
+        logging.warning(error)
+
+    return files, subdirs, error
+
+def walk_pdf_files(roots: Iterable[str], cutoff_ts: float, recursive: bool = False, max_depth: int = 0,
+                   exclude: List[str] = None, threads: int = DEFAULT_WALKER_THREADS,
+                   prune_by_mtime: bool = False, errors: List[str] = None):
+    """
+    Yields DirEntry objects for the PDF files under `roots` modified since
+    `cutoff_ts`, as soon as each directory has been listed.
+
+    Directories are listed concurrently by `threads` threads. With `recursive`,
+    subdirectories are visited up to `max_depth` levels below each root
+    (0 = no limit). `exclude` holds glob patterns matched against the name and
+    the full path of files and directories. With `prune_by_mtime`,
+    subdirectories whose mtime is older than the cutoff are not searched for
+    files (but their own subdirectories still are).
+
+    Roots that cannot be reached and directories that fail to list are
+    logged and skipped; if an `errors` list is given, their messages are
+    appended to it, so the caller can tell a partial listing from a complete
+    one.
+    """
+    exclude = list(exclude or [])
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as executor:
+        pending = {}
+
+        def visit(path: str, depth: int):
+            descend = recursive and (not max_depth or depth < max_depth)
+            future = executor.submit(_list_directory, path, depth, cutoff_ts, descend, exclude, prune_by_mtime)
+            pending[future] = depth
+
+        for root in roots:
+            if not os.path.isdir(root):
+                logging.error(f"Directory not found: {root}")
+                if errors is not None:
+                    errors.append(f"Directory not found: {root}")
+                continue
+            visit(root, 0)
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    depth = pending.pop(future)
+                    files, subdirs, error = future.result()
+                    if error is not None and errors is not None:
+                        errors.append(error)
+                    for subdir in subdirs:
+                        visit(subdir, depth + 1)
+                    yield from files
+        finally:
+            for future in pending:
+                future.cancel()
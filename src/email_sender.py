@@ -1,114 +1,257 @@
+import time
+import queue
 import smtplib
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
 import logging
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from albaran_record import AlbaranRecord
+from report_builder import CENTER_REPORT, CENTRAL_REPORT, DEFAULT_MAX_INLINE_ROWS
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_BACKOFF = 2.0
+# After the relay refused connections through every retry, messages fail
+# at once for this many seconds instead of each going through the retries
+DEFAULT_CIRCUIT_RESET = 300
+
+def _needs_reconnect(error: Exception) -> bool:
+    """
+    True for connection-level failures, after which the session is reopened.
+    (SMTPException subclasses OSError, so SMTP replies are excluded explicitly.)
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+def _is_transient(error: Exception) -> bool:
+    """
+    True for 4xx replies (greylisting, mailbox busy, rate limits), which are
+    worth retrying. 5xx replies are permanent.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return False
 
 class EmailSender:
-    def __init__(self, smtp_server: str, smtp_port: int, use_tls: bool, sender_email: str):
+    def __init__(self, smtp_server: str, smtp_port: int, use_tls: bool, sender_email: str,
+                 max_retries: int = DEFAULT_MAX_RETRIES, retry_backoff: float = DEFAULT_RETRY_BACKOFF,
+                 concurrency: int = 1, timeout: float = 60, max_inline_rows: int = DEFAULT_MAX_INLINE_ROWS,
+                 attach_csv: bool = False, circuit_reset: float = DEFAULT_CIRCUIT_RESET):
         self.smtp_server = smtp_server
         self.smtp_port = smtp_port
         self.use_tls = use_tls
         self.sender_email = sender_email
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.max_inline_rows = max_inline_rows
+        self.attach_csv = attach_csv
+        self.circuit_reset = circuit_reset
+        # Circuit breaker: monotonic time until which the relay counts as down, and why
+        self._circuit_lock = threading.Lock()
+        self._down_until = 0.0
+        self._down_error = None
 
-    def _send_email(self, to_emails: List[str], subject: str, body_text: str, body_html: str = None):
+    def _relay_down(self) -> Optional[str]:
+        """
+        The connection error that opened the circuit breaker, while it is
+        open; None otherwise.
+        """
+        with self._circuit_lock:
+            return self._down_error if time.monotonic() < self._down_until else None
+
+    def _open_circuit(self, error: Exception):
+        with self._circuit_lock:
+            self._down_until = time.monotonic() + self.circuit_reset
+            self._down_error = f"SMTP relay {self.smtp_server}:{self.smtp_port} unreachable: {error}"
+        logging.error(f"{self._down_error}. Not sending more messages for {self.circuit_reset:.0f}s.")
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        # If authentication is needed, it would go here. 
+        # Config didn't specify auth, assuming internal relay based on config.ini example.
+        return server
+
+    def _close(self, server: Optional[smtplib.SMTP]):
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _deliver(self, server: Optional[smtplib.SMTP], to_emails: List[str], msg: MIMEMultipart):
+        """
+        Sends one message over `server`, reconnecting if the session dropped
+        and retrying transient errors with exponential backoff.
+        If connecting still fails after the retries, the relay is taken as
+        down: the circuit breaker opens and, until `circuit_reset` seconds
+        pass, messages fail without being attempted ('attempts' 0).
+        Returns (server to keep using, result dict).
+        """
+        subject = msg["Subject"]
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            down = self._relay_down()
+            if down is not None:
+                return server, {"to": to_emails, "subject": subject, "ok": False,
+                                "latency": time.perf_counter() - start, "attempts": attempt, "error": down}
+            attempt += 1
+            connecting = server is None
+            try:
+                if server is None:
+                    server = self._connect()
+                refused = server.sendmail(self.sender_email, to_emails, msg.as_string())
+                latency = time.perf_counter() - start
+                if refused:
+                    logging.warning(f"Recipients refused for {subject}: {refused}")
+                logging.info(f"Email sent to {to_emails}: {subject} ({latency * 1000:.0f} ms, {attempt} attempt(s))")
+                return server, {"to": to_emails, "subject": subject, "ok": True, "latency": latency,
+                                "attempts": attempt, "error": None}
+            except Exception as e:
+                reconnect = _needs_reconnect(e)
+                if reconnect:
+                    self._close(server)
+                    server = None
+                if attempt > self.max_retries or not (reconnect or _is_transient(e)):
+                    latency = time.perf_counter() - start
+                    logging.error(f"Failed to send email to {to_emails}: {e}")
+                    if connecting and reconnect:
+                        self._open_circuit(e)
+                    return server, {"to": to_emails, "subject": subject, "ok": False, "latency": latency,
+                                    "attempts": attempt, "error": str(e)}
+                delay = self.retry_backoff * (2 ** (attempt - 1))
+                logging.warning(f"Transient error sending to {to_emails}: {e}. Retrying in {delay:.1f}s.")
+                time.sleep(delay)
+
+    def send_batch(self, messages: List[Tuple[List[str], MIMEMultipart]]) -> List[Dict[str, Any]]:
+        """
+        Sends several messages reusing one SMTP session (one per sender
+        thread when `concurrency` > 1) instead of one connection per message.
+        Returns one result dict per message, in the same order, with
+        'ok', 'latency' (seconds), 'attempts' (0: not attempted, the relay
+        was down) and 'error'.
+        """
+        messages = [m for m in messages if m is not None]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+        pending = queue.Queue()
+        for index, message in enumerate(messages):
+            pending.put((index, message))
+
+        def sender():
+            server = None
+            try:
+                while True:
+                    try:
+                        index, (to_emails, msg) = pending.get_nowait()
+                    except queue.Empty:
+                        break
+                    server, results[index] = self._deliver(server, to_emails, msg)
+            finally:
+                self._close(server)
+
+        workers = min(self.concurrency, len(messages))
+        if workers <= 1:
+            sender()
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for future in [executor.submit(sender) for _ in range(workers)]:
+                    future.result()
+
+        if len(messages) > 1:
+            sent = sum(1 for r in results if r["ok"])
+            logging.info(f"Email batch: {sent}/{len(messages)} sent.")
+        unsent = [r["to"] for r in results if r["attempts"] == 0]
+        if unsent:
+            logging.error(f"{len(unsent)} messages not sent, SMTP relay down. Recipients: "
+                          f"{', '.join(dict.fromkeys(email for to in unsent for email in to))}")
+        return results
+
+    def _build_message(self, to_emails: List[str], subject: str, body_text: str, body_html: str = None,
+                       attachments: List[Tuple[str, bytes]] = None) -> Optional[Tuple[List[str], MIMEMultipart]]:
         if not to_emails:
             logging.warning("No recipients provided for email.")
-            return
+            return None
+
+        body = MIMEMultipart("alternative")
+        body.attach(MIMEText(body_text, "plain"))
+        if body_html:
+            body.attach(MIMEText(body_html, "html"))
+
+        if attachments:
+            msg = MIMEMultipart("mixed")
+            msg.attach(body)
+            for file_name, data in attachments:
+                part = MIMEApplication(data, Name=file_name)
+                part["Content-Disposition"] = f'attachment; filename="{file_name}"'
+                msg.attach(part)
+        else:
+            msg = body
 
-        msg = MIMEMultipart("alternative")
         msg["Subject"] = subject
         msg["From"] = self.sender_email
         msg["To"] = ", ".join(to_emails)
+        return to_emails, msg
 
-        part1 = MIMEText(body_text, "plain")
-        msg.attach(part1)
-        
-        if body_html:
-            part2 = MIMEText(body_html, "html")
-            msg.attach(part2)
-
-        try:
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                if self.use_tls:
-                    server.starttls()
-                # If authentication is needed, it would go here. 
-                # Config didn't specify auth, assuming internal relay based on config.ini example.
-                server.sendmail(self.sender_email, to_emails, msg.as_string())
-            logging.info(f"Email sent to {to_emails}: {subject}")
-        except Exception as e:
-            logging.error(f"Failed to send email to {to_emails}: {e}")
+    def _send_email(self, to_emails: List[str], subject: str, body_text: str, body_html: str = None):
+        message = self._build_message(to_emails, subject, body_text, body_html)
+        if message is not None:
+            self.send_batch([message])
 
     def send_central_report(self, recipients: List[str], corrupt_files: List[str]):
         """
         Sends the list of corrupted files to Central Systems.
         """
+        self.send_batch([self.build_central_report(recipients, corrupt_files)])
+
+    def build_central_report(self, recipients: List[str], corrupt_files: List[str]):
+        """
+        Builds the Central Systems report, to be sent with send_batch.
+        """
         subject = f"Informe de Albaranes PDF Corruptos - {len(corrupt_files)} detectados"
-        
-        body_text = "Se han detectado los siguientes archivos PDF corruptos o ilegibles:\n\n"
-        for f in corrupt_files:
-            body_text += f"- {f}\n"
-            
-        body_text += "\nPor favor, revise estos archivos."
-        
-        self._send_email(recipients, subject, body_text)
+        body_text, body_html, attachment = CENTRAL_REPORT.render(
+            [AlbaranRecord(f) for f in corrupt_files], self.max_inline_rows, self.attach_csv,
+            "albaranes_corruptos.csv")
+        return self._build_message(recipients, subject, body_text, body_html, [attachment] if attachment else None)
 
-    def send_center_report(self, recipient: str, check_data: List[Dict[str, Any]], center_name: str = ""):
+    def send_center_report(self, recipient: str, check_data: List[AlbaranRecord], center_name: str = ""):
         """
         Sends the report to a specific center with the details of their albaranes.
         """
+        message = self.build_center_report(recipient, check_data, center_name)
+        if message is not None:
+            self.send_batch([message])
+
+    def send_center_reports(self, reports: List[Tuple[str, List[AlbaranRecord], str]]) -> List[Dict[str, Any]]:
+        """
+        Sends the reports of many centers, given as (recipient, check_data,
+        center_name) tuples, over shared SMTP sessions.
+        """
+        return self.send_batch([self.build_center_report(*report) for report in reports])
+
+    def build_center_report(self, recipient: str, check_data: List[AlbaranRecord], center_name: str = ""):
+        """
+        Builds the report for a specific center, to be sent with send_batch.
+        Returns None if there is nothing to report.
+        """
         if not check_data:
-            return
+            return None
 
         # Subject as requested: "Listado de Albaranes Dañados - {CENTER_NAME}"
         subject = f"Listado de Albaranes Dañados - {center_name}" if center_name else "Listado de Albaranes Dañados"
 
-        # Headers based on user request example
+        # Columns based on user request example
         # Cod.Barras  ALM     Nº int  Fecha     ****    Prov  Div Proveedor                           ** Albaran  Flag
-        
-        header = f"{'Cod.Barras':<12} {'ALM':<4} {'Nº int':<8} {'Fecha':<9} {'****':<6} {'Prov':<6} {'Div':<4} {'Proveedor':<40} {'**':<3} {'Albaran':<9} {'Flag':<4}"
-        separator = "-" * len(header)
-        
-        rows = []
-        for row in check_data:
-            # Safely get values and format
-            line = f"{str(row.get('COD_BARRAS', '')):<12} {str(row.get('ALM', '')):<4} {str(row.get('NUM_INT', '')):<8} " \
-                   f"{str(row.get('FECHA', '')):<9} {str(row.get('CUENTA_MAYOR', '')):<6} {str(row.get('PROV_CODIGO', '')):<6} " \
-                   f"{str(row.get('DIVISION', '')):<4} {str(row.get('PROVEEDOR_DESC', ''))[:39]:<40} {str(row.get('SERIE', '')):<3} " \
-                   f"{str(row.get('ALBARAN', '')):<9} {str(row.get('FLAG', '')):<4}"
-            rows.append(line)
-
-        body_text = f"{header}\n{separator}\n" + "\n".join(rows)
-        body_text += "\n\nPor favor, vuelva a escanear estos documentos."
-
-        # Optional HTML version could be added here for better rendering in modern clients
-        html_rows = ""
-        for row in check_data:
-             html_rows += f"<tr><td>{row.get('COD_BARRAS', '')}</td><td>{row.get('ALM', '')}</td><td>{row.get('NUM_INT', '')}</td>" \
-                          f"<td>{row.get('FECHA', '')}</td><td>{row.get('CUENTA_MAYOR', '')}</td><td>{row.get('PROV_CODIGO', '')}</td>" \
-                          f"<td>{row.get('DIVISION', '')}</td><td>{row.get('PROVEEDOR_DESC', '')}</td><td>{row.get('SERIE', '')}</td>" \
-                          f"<td>{row.get('ALBARAN', '')}</td><td>{row.get('FLAG', '')}</td></tr>"
-
-        body_html = f"""
-        <html>
-        <head>
-        <style>
-        table {{ border-collapse: collapse; width: 100%; font-family: monospace; }}
-        th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
-        th {{ background-color: #f2f2f2; }}
-        </style>
-        </head>
-        <body>
-        <h3>Listado de Albaranes Dañados</h3>
-        <table>
-        <tr>
-            <th>Cod.Barras</th><th>ALM</th><th>Nº int</th><th>Fecha</th><th>****</th><th>Prov</th><th>Div</th><th>Proveedor</th><th>**</th><th>Albaran</th><th>Flag</th>
-        </tr>
-        {html_rows}
-        </table>
-        <p>Por favor, vuelva a escanear estos documentos.</p>
-        </body>
-        </html>
-        """
-
-        self._send_email([recipient], subject, body_text, body_html)
+        body_text, body_html, attachment = CENTER_REPORT.render(check_data, self.max_inline_rows, self.attach_csv,
+                                                                "albaranes_danados.csv")
+        return self._build_message([recipient], subject, body_text, body_html, [attachment] if attachment else None)
@@ -0,0 +1,151 @@
+import sys
+import json
+import queue
+import logging
+import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Tuple
+
+# Log line formats ([REGISTRO] formato)
+LOG_TEXT = "texto"
+LOG_JSON = "json"  # one JSON object per line
+LOG_FORMATS = (LOG_TEXT, LOG_JSON)
+
+DEFAULT_LOG_FILE = "auto_check.log"
+DEFAULT_MAX_MB = 10
+DEFAULT_BACKUPS = 5
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRS = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+def parse_level(value: str) -> int:
+    level = logging.getLevelName(value.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level: {value}")
+    return level
+
+def parse_module_levels(value: str) -> Dict[str, int]:
+    """
+    Parses "db_client=DEBUG, pdf_worker=WARNING" into {module: level}.
+    """
+    levels = {}
+    for item in value.replace(";", ",").split(","):
+        if not item.strip():
+            continue
+        module, sep, level = item.partition("=")
+        if not sep or not module.strip():
+            raise ValueError(f"Expected module=LEVEL, got: {item.strip()}")
+        module = module.strip()
+        levels[module[:-3] if module.endswith(".py") else module] = parse_level(level)
+    return levels
+
+class ModuleLevelFilter(logging.Filter):
+    """
+    Per source file log levels. The modules log through the root logger,
+    so records are told apart by the file they come from (record.module).
+    """
+
+    def __init__(self, level: int, module_levels: Dict[str, int] = None):
+        super().__init__()
+        self.level = level
+        self.module_levels = dict(module_levels or {})
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= self.module_levels.get(record.module, self.level)
+
+class JsonLinesFormatter(logging.Formatter):
+    """
+    One JSON object per record: time, level, process, thread, module,
+    line and message, plus any fields passed with extra={...}.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "process": record.processName,
+            "pid": record.process,
+            "thread": record.threadName,
+            "module": record.module,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key not in entry:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class LogPipeline:
+    """
+    Logging for a run: every logger hands its records to a QueueHandler,
+    and a single QueueListener thread formats them and writes the (rotating)
+    log file and the console. The code logging, including the scan loop,
+    only pays for a queue put.
+
+    Pool workers ship their records to the parent over their own pipe (see
+    worker_pool and worker_log_config), where they join the same queue, so
+    only this process ever writes the log file.
+    """
+
+    def __init__(self, log_path: str = DEFAULT_LOG_FILE, level: int = logging.INFO,
+                 module_levels: Dict[str, int] = None, log_format: str = LOG_TEXT,
+                 max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024, backups: int = DEFAULT_BACKUPS,
+                 console_level: int = None):
+        self.filter = ModuleLevelFilter(level, module_levels)
+        # Records below this never get created, not even to be filtered
+        self.level = min([level, *self.filter.module_levels.values()])
+        self.queue: queue.Queue = queue.Queue()
+
+        file_handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+        file_handler.setFormatter(JsonLinesFormatter() if log_format == LOG_JSON else logging.Formatter(TEXT_FORMAT))
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        if console_level is not None:
+            console_handler.setLevel(console_level)
+        self.handlers = [file_handler, console_handler]
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self._queue_handler = QueueHandler(self.queue)
+        self._queue_handler.addFilter(self.filter)
+
+    def start(self) -> "LogPipeline":
+        global _active
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(self._queue_handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        _active = self
+        return self
+
+    def stop(self):
+        """
+        Writes out the records still queued and closes the log file.
+        """
+        global _active
+        if _active is self:
+            _active = None
+        root = logging.getLogger()
+        root.removeHandler(self._queue_handler)
+        self.listener.stop()
+        for handler in self.handlers:
+            handler.close()
+
+    def worker_config(self) -> Tuple[int, logging.Filter]:
+        return self.level, self.filter
+
+_active: Optional[LogPipeline] = None
+
+def worker_log_config() -> Optional[Tuple[int, logging.Filter]]:
+    """
+    (level, filter) for pool workers to ship their records to the running
+    LogPipeline, or None if there is none (workers then log as configured
+    in their own process).
+    """
+    return _active.worker_config() if _active is not None else None
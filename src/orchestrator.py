@@ -0,0 +1,134 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+# Corrupt albaranes are sent to the DB in batches of up to `batch_size`, or
+# once the oldest one in the batch has waited this many seconds
+DEFAULT_LOOKUP_LINGER = 0.5
+
+_SCAN_DONE = object()
+
+async def _pipeline(stems: Iterable[str], lookup: Callable, notify_central: Callable, notify_centers: Callable,
+                    batch_size: int, lookup_concurrency: int, linger: float, timings: Dict[str, float]) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    found: asyncio.Queue = asyncio.Queue()
+    # Scan thread and the Central mail; DB lookups get their own bounded executor
+    io_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="orchestrator")
+    db_executor = ThreadPoolExecutor(max_workers=max(1, lookup_concurrency), thread_name_prefix="lookup")
+
+    def scan():
+        try:
+            for stem in stems:
+                loop.call_soon_threadsafe(found.put_nowait, stem)
+        finally:
+            loop.call_soon_threadsafe(found.put_nowait, _SCAN_DONE)
+
+    async def timed(stage: str, executor, function: Callable, arg):
+        # Stage times are added on the loop thread, so no lock is needed
+        stage_start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, function, arg)
+        finally:
+            timings[stage] += time.perf_counter() - stage_start
+
+    async def timed_lookup(batch: List[str]) -> List[Dict[str, Any]]:
+        try:
+            return await timed("db_lookup", db_executor, lookup, batch)
+        except Exception as e:
+            # Like a failed lookup in the sequential flow: Central is still notified
+            logging.error(f"Failed to query database for {len(batch)} albaranes: {e}")
+            return []
+
+    completed = False
+    lookups = []
+    try:
+        scanning = loop.run_in_executor(io_executor, scan)
+        corrupt: List[str] = []
+        batch: List[str] = []
+
+        def flush():
+            if batch:
+                lookups.append(asyncio.ensure_future(timed_lookup(list(batch))))
+                batch.clear()
+
+        deadline = 0.0
+        while True:
+            try:
+                if batch:
+                    stem = await asyncio.wait_for(found.get(), max(0.0, deadline - time.monotonic()))
+                else:
+                    stem = await found.get()
+            except asyncio.TimeoutError:
+                flush()
+                continue
+            if stem is _SCAN_DONE:
+                break
+            if not batch:
+                deadline = time.monotonic() + linger
+            corrupt.append(stem)
+            batch.append(stem)
+            if len(batch) >= batch_size:
+                flush()
+        flush()
+        await scanning
+        timings["scan"] = time.perf_counter() - start
+
+        notified: Set[str] = set()
+        rows: List[Dict[str, Any]] = []
+        if corrupt:
+            # Central only needs the albaran numbers: it goes out while lookups finish
+            central = asyncio.ensure_future(timed("email", io_executor, notify_central, corrupt))
+            # Any albaran may belong to any center, so a center's rows are only
+            # complete once every lookup is done
+            for batch_rows in await asyncio.gather(*lookups):
+                rows += batch_rows
+            notified |= await timed("email", None, notify_centers, rows)
+            notified |= await central
+
+        completed = True
+        return {"corrupt": corrupt, "rows": rows, "notified": notified}
+    finally:
+        # On error or Ctrl+C don't wait for the scan thread, the caller tears the pool down
+        for task in lookups:
+            task.cancel()
+        io_executor.shutdown(wait=completed, cancel_futures=True)
+        db_executor.shutdown(wait=completed, cancel_futures=True)
+
+def run_pipeline(stems: Iterable[str], lookup: Callable[[List[str]], List[Dict[str, Any]]],
+                 notify_central: Callable[[List[str]], Set[str]],
+                 notify_centers: Callable[[List[Dict[str, Any]]], Set[str]],
+                 batch_size: int = 500, lookup_concurrency: int = 1,
+                 linger: float = DEFAULT_LOOKUP_LINGER, metrics=None) -> Dict[str, Any]:
+    """
+    Runs scan, DB lookups and notifications overlapped instead of one after
+    the other.
+
+    `stems` (e.g. iter_corrupt_files) is consumed in a thread. Corrupt
+    albaranes are batched to `lookup` while the scan is still running, with
+    up to `lookup_concurrency` batches at once. When the scan ends,
+    `notify_central(stems)` runs while the remaining lookups finish; then
+    `notify_centers(rows)` gets every row found. The blocking callables run
+    in executors, so pyodbc and smtplib calls never block each other.
+    Both notify callables return the albaran numbers they notified.
+
+    Returns {"corrupt": stems found, "rows": DB rows, "notified": albaran
+    numbers notified, "wall_seconds": end-to-end time}.
+    """
+    start = time.perf_counter()
+    timings = {"scan": 0.0, "db_lookup": 0.0, "email": 0.0}
+    result = asyncio.run(_pipeline(stems, lookup, notify_central, notify_centers, max(1, batch_size),
+                                   lookup_concurrency, linger, timings))
+    result["wall_seconds"] = wall = time.perf_counter() - start
+
+    stage_sum = sum(timings.values())
+    logging.info(f"Run finished in {wall:.2f}s end to end (scan {timings['scan']:.2f}s, "
+                 f"DB lookups {timings['db_lookup']:.2f}s, email {timings['email']:.2f}s; "
+                 f"{max(0.0, stage_sum - wall):.2f}s overlapped).")
+    if metrics is not None:
+        # Scan and email stages are recorded by iter_corrupt_files and the notify callables
+        metrics.add_time("end_to_end", wall)
+        metrics.add_time("db_lookup", timings["db_lookup"])
+    return result
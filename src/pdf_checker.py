@@ -1,46 +1,173 @@
 import os
+import time
+import queue
 import datetime
-from pypdf import PdfReader
 import logging
-from multiprocessing import Pool, cpu_count
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from verdict_cache import file_identity
+from worker_pool import SupervisedPool, TASK_ERROR
+from dir_walker import walk_pdf_files, DEFAULT_WALKER_THREADS
+from revisions import (clean_albaran_number, latest_revisions, skip_identical_copies, CorruptTracker,
+                       REVISIONS_ALL, REVISIONS_LATEST, NEWEST_BY_NUMBER)
+from run_metrics import timed_iter
+from sharding import partition_of
+from pdf_worker import (validate_task, check_file_worker, check_buffer_worker, has_valid_structure, is_valid_pdf,
+                        is_valid_pdf_data, select_pages, first_bad_page, set_deep_options,
+                        VALIDATION_STRUCTURE, VALIDATION_PYPDF, VALIDATION_DEEP, DEFAULT_PAGES_PER_TASK,
+                        DEFAULT_PAGE_SAMPLE, HEADER_WINDOW, TRAILER_WINDOW, REASON_CORRUPT, REASON_SPLIT)
 
-def check_file_worker(args):
+# The validation functions live in pdf_worker (lean, for the pool processes)
+# and are re-exported here, where callers have always imported them from.
+__all__ = [
+    # pdf_worker
+    "check_file_worker", "check_buffer_worker", "has_valid_structure", "is_valid_pdf", "is_valid_pdf_data",
+    "select_pages", "first_bad_page", "VALIDATION_STRUCTURE", "VALIDATION_PYPDF", "VALIDATION_DEEP",
+    "DEFAULT_PAGES_PER_TASK", "DEFAULT_PAGE_SAMPLE", "HEADER_WINDOW", "TRAILER_WINDOW", "REASON_CORRUPT",
+    # revisions
+    "clean_albaran_number",
+    # this module
+    "VALIDATION_LEVELS", "DEFAULT_CHUNKSIZE", "DEFAULT_MAX_IN_FLIGHT", "EXECUTION_PROCESSES", "EXECUTION_HYBRID",
+    "EXECUTION_MODES", "DEFAULT_READ_THREADS", "DEFAULT_MAX_READ_THREADS", "DEFAULT_READ_AHEAD",
+    "DEFAULT_READ_MEMORY_MB", "DEFAULT_FILE_TIMEOUT", "DEFAULT_MEMORY_LIMIT_MB", "DEFAULT_MAX_TASKS_PER_CHILD",
+    "parse_validation_depth", "read_for_validation", "limit_result", "ValidationPool", "get_cutoff_date",
+    "iter_corrupt_files", "scan_directory", "list_partitions",
+]
+
+# nivel_validacion names of the validation depths (see pdf_worker)
+VALIDATION_LEVELS = {
+    "estructura": VALIDATION_STRUCTURE,
+    "pypdf": VALIDATION_PYPDF,
+    "profundo": VALIDATION_DEEP,
+}
+
+# Streaming pipeline: files per pool task and max files queued/validating at once.
+DEFAULT_CHUNKSIZE = 16
+DEFAULT_MAX_IN_FLIGHT = 1024
+
+# Execution models: processes read and parse their own files, or hybrid
+# (threads read, processes parse).
+EXECUTION_PROCESSES = "procesos"
+EXECUTION_HYBRID = "hibrido"
+EXECUTION_MODES = (EXECUTION_PROCESSES, EXECUTION_HYBRID)
+
+# Hybrid mode: initial/max concurrent reads, files read ahead of the parsers
+# and memory held in read buffers.
+DEFAULT_READ_THREADS = 4
+DEFAULT_MAX_READ_THREADS = 16
+DEFAULT_READ_AHEAD = 64
+DEFAULT_READ_MEMORY_MB = 256
+
+# Per-file limits: a worker stuck longer than this or using more memory is
+# killed and the file reported as corrupt. Workers are recycled after
+# DEFAULT_MAX_TASKS_PER_CHILD files. 0 disables each limit.
+DEFAULT_FILE_TIMEOUT = 120
+DEFAULT_MEMORY_LIMIT_MB = 1024
+DEFAULT_MAX_TASKS_PER_CHILD = 1000
+
+def parse_validation_depth(value) -> int:
     """
-    Worker function to check a single file.
-    Args:
-        args: Tuple containing (file_path, file_name, file_mtime)
-    Returns:
-        The filename stem if corrupt, None otherwise.
+    Converts the `nivel_validacion` config value (name or number) to a depth.
     """
-    file_path, file_name, _ = args
-    
-    if not is_valid_pdf(file_path):
-        logging.warning(f"Corrupt PDF found: {file_name}")
-        
-        filename_stem = os.path.splitext(file_name)[0]
-        
-        # Remove -Rev...
-        if "-Rev" in filename_stem:
-            filename_stem = filename_stem.split("-Rev")[0]
-            
-        clean_number = filename_stem.split("-")[0] # Splits at -Rev
-        clean_number = clean_number.split("_")[0] # Splits at _002
-        
-        return clean_number
-    return None
-
-def scan_directory(path: str, days_back: int, fecha_desde_str: str = None) -> list[str]:
-    """
-    Scans the directory for PDF files modified within the last `days_back` days.
-    Checks if they are valid PDFs using multiprocessing.
-    Returns a list of filename stems (no extension) that are corrupt.
-    """
-    logging.info(f"Scanning directory: {path} for files modified in last {days_back} days.")
-    
-    if not os.path.exists(path):
-        logging.error(f"Directory not found: {path}")
-        return []
+    if value is None or str(value).strip() == "":
+        return VALIDATION_PYPDF
+    value = str(value).strip().lower()
+    if value in VALIDATION_LEVELS:
+        return VALIDATION_LEVELS[value]
+    try:
+        depth = int(value)
+    except ValueError:
+        raise ValueError(f"Unknown validation level: {value}. Expected one of {list(VALIDATION_LEVELS)}")
+    return max(VALIDATION_STRUCTURE, min(depth, max(VALIDATION_LEVELS.values())))
+
+def read_for_validation(file_path: str, depth: int):
+    """
+    I/O stage of the hybrid model, run in a thread.
+    Returns (data, read_seconds, verdict): at the structural depth the
+    verdict is decided here (only a few KB are read) and data is None;
+    otherwise the whole file is returned with verdict None, to be parsed
+    in a process.
+    """
+    start = time.perf_counter()
+    if depth <= VALIDATION_STRUCTURE:
+        return None, time.perf_counter() - start, has_valid_structure(file_path)
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None, time.perf_counter() - start, False
+    return data, time.perf_counter() - start, None
+
+def limit_result(args, reason: str, seconds: float):
+    """
+    Result reported by SupervisedPool for a file whose worker was killed
+    (timeout, memory, crash): corrupt, with the reason. Worker errors give
+    no verdict.
+    """
+    bytes_read = len(args[3]) if len(args) > 3 and isinstance(args[3], bytes) else 0
+    return args[0], None if reason == TASK_ERROR else False, seconds, bytes_read, reason, None
 
+class ValidationPool(SupervisedPool):
+    """
+    SupervisedPool running pdf_worker.validate_task, which also fans out
+    deep-mode page tasks: when a worker answers "split", the remaining page
+    chunks are submitted as separate tasks and their results merged into one
+    result per file, with the first bad page.
+
+    The pool can be created once and passed to several scans (and to watch
+    mode), so worker startup is paid once per process. `log_config` (see
+    log_setup.worker_log_config) makes the workers log through the parent.
+    """
+
+    def __init__(self, processes: int = None, task_timeout: float = None, memory_limit_mb: float = None,
+                 max_tasks_per_child: int = None, page_sample: int = DEFAULT_PAGE_SAMPLE,
+                 pages_per_task: int = DEFAULT_PAGES_PER_TASK, log_config: tuple = None):
+        super().__init__(processes or cpu_count(), validate_task, limit_result, task_timeout, memory_limit_mb,
+                         max_tasks_per_child, initializer=set_deep_options, initargs=(page_sample, pages_per_task),
+                         log_config=log_config)
+        # file_path -> [chunks left, seconds, bytes_read, reason, first bad page]
+        self._splits = {}
+
+    def _page_task(self, file_path: str, pages: list):
+        return file_path, os.path.basename(file_path), VALIDATION_DEEP, None, pages
+
+    def restart(self):
+        super().restart()
+        self._splits = {}
+
+    def get(self, timeout: float = None) -> list:
+        while True:
+            results = []
+            for result in super().get(timeout):
+                file_path, is_valid, seconds, bytes_read, reason, detail = result
+                split = self._splits.get(file_path)
+                if reason == REASON_SPLIT:
+                    self._splits[file_path] = [len(detail), seconds, bytes_read, None, None]
+                    self.submit([self._page_task(file_path, pages) for pages in detail])
+                elif split is not None:
+                    split[0] -= 1
+                    split[1] += seconds
+                    if reason is not None and split[3] != REASON_CORRUPT:
+                        split[3] = reason
+                    if detail is not None and (split[4] is None or detail < split[4]):
+                        split[4] = detail
+                    if split[0] == 0:
+                        del self._splits[file_path]
+                        # A page task that failed leaves the file unchecked, unless another one found it corrupt
+                        is_valid = None if split[3] == TASK_ERROR else split[3] is None
+                        results.append((file_path, is_valid, split[1], split[2], split[3], split[4]))
+                else:
+                    results.append(result)
+            # Only page tasks finished: keep waiting if the caller wants a result
+            if results or timeout is not None or not self.pending():
+                return results
+
+def get_cutoff_date(days_back: int, fecha_desde_str: str = None) -> datetime.datetime:
+    """
+    Returns the oldest modification date to check: `days_back` days ago, or
+    `fecha_desde_str` (dd/mm/YYYY) if given and valid.
+    """
     cutoff_date = datetime.datetime.now() - datetime.timedelta(days=days_back)
     
     # Overwrite cutoff if strict date provided
@@ -50,58 +177,464 @@ def scan_directory(path: str, days_back: int, fecha_desde_str: str = None) -> li
         except ValueError:
             logging.warning(f"Invalid date format for fechadesde: {fecha_desde_str}. Using days check.")
 
-    logging.info(f"Cutoff date: {cutoff_date}")
+    return cutoff_date
 
-    files_to_check = []
-    
-    try:
-        with os.scandir(path) as entries:
-            for entry in entries:
-                if entry.name.lower().endswith(".pdf") and entry.is_file():
-                    # Check modification time
-                    mtime_ts = entry.stat().st_mtime
-                    mtime_dt = datetime.datetime.fromtimestamp(mtime_ts)
-                    
-                    if mtime_dt >= cutoff_date:
-                        files_to_check.append((entry.path, entry.name, mtime_ts))
-                        
-    except Exception as e:
-        logging.error(f"Error scanning directory: {e}")
+def _release_pool(pool: ValidationPool, owned: bool):
+    """
+    Stops a pool created for one scan. A pool passed in by the caller is kept
+    running, unless the scan stopped with work still queued on it.
+    """
+    if pool is None:
+        return
+    if owned:
+        pool.terminate()
+    elif pool.pending():
+        pool.restart()
+
+class _PoolScanner:
+    """
+    Default execution model: each pool process reads and parses its files.
+    Files are sent in chunks of `chunksize`, with at most `max_in_flight`
+    files outstanding. `pool_options` are the ValidationPool limits and deep
+    mode options, used if no `pool` is given.
+    """
+
+    def __init__(self, processes: int, depth: int, chunksize: int, max_in_flight: int, pool_options: dict,
+                 pool: ValidationPool = None):
+        self.processes = processes
+        self.depth = depth
+        self.chunksize = max(1, chunksize)
+        self.max_in_flight = max(self.chunksize, max_in_flight)
+        self.pool_options = pool_options
+        self.pool = pool
+        self.owns_pool = pool is None
+        self.batch = []
+
+    def _send(self):
+        if self.pool is None:
+            logging.info(f"Starting multiprocessing pool with {self.processes} processes...")
+            self.pool = ValidationPool(self.processes, **self.pool_options)
+        self.pool.submit(self.batch)
+        self.batch = []
+
+    def submit(self, file_path: str, file_name: str, size: int = 0):
+        self.batch.append((file_path, file_name, self.depth))
+        if len(self.batch) >= self.chunksize:
+            self._send()
+
+    def flush(self):
+        if self.batch:
+            self._send()
+
+    def full(self) -> bool:
+        # Room for one more chunk without going over max_in_flight
+        return self.pool is not None and self.pool.pending() + self.chunksize > self.max_in_flight
+
+    def pending(self) -> bool:
+        return bool(self.batch) or (self.pool is not None and self.pool.pending() > 0)
+
+    def poll(self, block: bool) -> list:
+        if self.pool is None:
+            return []
+        return self.pool.get(timeout=None if block else 0)
+
+    def close(self):
+        _release_pool(self.pool, self.owns_pool)
+
+class _HybridScanner:
+    """
+    Hybrid execution model: a thread pool reads files (I/O bound, e.g. over
+    SMB) and hands the bytes to a process pool that only parses them, so
+    parser processes don't stall on network latency.
+
+    Reads are bounded by `read_ahead` files and `memory_budget` bytes held
+    in memory: a file's size is reserved when its read starts and released
+    once it is parsed, and a read only starts if it fits in the budget (or
+    nothing else is held, for a file bigger than the whole budget). The number of concurrent reads adapts between 1 and
+    `max_read_threads` to the observed read/parse time ratio, aiming to keep
+    every parser process busy.
+    """
+
+    def __init__(self, processes: int, depth: int, read_threads: int, max_read_threads: int,
+                 read_ahead: int, memory_budget: int, pool_options: dict, pool: ValidationPool = None):
+        self.processes = processes
+        self.depth = depth
+        self.pool_options = pool_options
+        self.max_read_threads = max(1, max_read_threads, read_threads)
+        self.read_limit = max(1, min(read_threads, self.max_read_threads))
+        self.read_ahead = max(1, read_ahead)
+        self.memory_budget = max(1, memory_budget)
+
+        self.events = queue.Queue()
+        self.readers = ThreadPoolExecutor(max_workers=self.max_read_threads)
+        self.pool = pool
+        self.owns_pool = pool is None
+        self.waiting = deque()
+        self.read_seconds = {}
+        # Bytes reserved per file being read or parsed
+        self.reserved = {}
+        self.reading = 0
+        self.parsing = 0
+        self.buffered_bytes = 0
+        # Exponentially weighted mean read and parse time per file
+        self.read_time = None
+        self.parse_time = None
+
+    def submit(self, file_path: str, file_name: str, size: int = 0):
+        # The structural tier only reads a few KB per file
+        self.waiting.append((file_path, file_name, size if self.depth > VALIDATION_STRUCTURE else 0))
+        self._start_reads()
+
+    def _fits(self, size: int) -> bool:
+        return self.buffered_bytes == 0 or self.buffered_bytes + size <= self.memory_budget
+
+    def _start_reads(self):
+        while self.waiting and self.reading < self.read_limit and self._fits(self.waiting[0][2]) \
+                and self.reading + self.parsing < self.read_ahead:
+            file_path, file_name, size = self.waiting.popleft()
+            self.reserved[file_path] = size
+            self.buffered_bytes += size
+            self.reading += 1
+            future = self.readers.submit(read_for_validation, file_path, self.depth)
+            future.add_done_callback(lambda f, p=file_path, n=file_name: self.events.put((p, n, f)))
+
+    def flush(self):
+        pass
+
+    def full(self) -> bool:
+        return len(self.waiting) >= self.read_ahead
+
+    def pending(self) -> bool:
+        return bool(self.waiting) or self.reading > 0 or self.parsing > 0
+
+    def _adapt(self):
+        if not self.read_time or not self.parse_time:
+            return
+        # Readers needed so that reading keeps up with `processes` parsers
+        wanted = int(self.processes * self.read_time / self.parse_time + 0.5)
+        limit = max(1, min(self.max_read_threads, wanted))
+        if limit != self.read_limit:
+            logging.debug(f"Hybrid scan: {self.read_limit} -> {limit} read threads "
+                          f"(read {self.read_time * 1000:.1f} ms, parse {self.parse_time * 1000:.1f} ms per file)")
+            self.read_limit = limit
+
+    @staticmethod
+    def _ewma(current, sample):
+        return sample if current is None else current * 0.9 + sample * 0.1
+
+    def poll(self, block: bool) -> list:
+        while True:
+            results = []
+            try:
+                while True:
+                    results += self._on_read(*self.events.get_nowait())
+            except queue.Empty:
+                pass
+
+            if self.parsing:
+                # Wake up regularly while reads are outstanding, to feed the parsers
+                timeout = 0 if results or not block else (0.05 if self.reading else None)
+                results += self._on_parsed(self.pool.get(timeout=timeout))
+            elif self.reading and block and not results:
+                try:
+                    results += self._on_read(*self.events.get(timeout=0.05))
+                except queue.Empty:
+                    pass
+
+            self._start_reads()
+            if results or not block or not self.pending():
+                return results
+
+    def _on_read(self, file_path: str, file_name: str, future) -> list:
+        self.reading -= 1
+        try:
+            data, read_seconds, verdict = future.result()
+        except Exception as e:
+            logging.error(f"Error reading {file_path}: {e}")
+            data, read_seconds, verdict = None, 0.0, False
+        self.read_time = self._ewma(self.read_time, read_seconds)
+        # The file may have changed size since it was listed: hold what was actually read
+        reserved = self.reserved.pop(file_path, 0)
+        self.buffered_bytes -= reserved
+
+        if verdict is not None or data is None:
+            # Decided by the reader (structural tier, or unreadable file)
+            if not verdict:
+                logging.warning(f"Corrupt PDF found: {file_name}")
+            return [(file_path, bool(verdict), read_seconds, len(data or b""),
+                     None if verdict else REASON_CORRUPT, None)]
+
+        if self.pool is None:
+            logging.info(f"Starting hybrid scan: {self.processes} parser processes, "
+                         f"up to {self.max_read_threads} read threads...")
+            self.pool = ValidationPool(self.processes, **self.pool_options)
+        self.parsing += 1
+        self.reserved[file_path] = len(data)
+        self.buffered_bytes += len(data)
+        self.read_seconds[file_path] = read_seconds
+        self.pool.submit([(file_path, file_name, self.depth, data)])
         return []
 
-    count_checked = len(files_to_check)
-    logging.info(f"Found {count_checked} files to check. Starting multiprocessing pool...")
+    def _on_parsed(self, parsed: list) -> list:
+        results = []
+        for file_path, is_valid, parse_seconds, size, reason, detail in parsed:
+            self.parsing -= 1
+            self.buffered_bytes -= self.reserved.pop(file_path, 0)
+            if reason is None or reason == REASON_CORRUPT:
+                self.parse_time = self._ewma(self.parse_time, parse_seconds)
+                self._adapt()
+            read_seconds = self.read_seconds.pop(file_path, 0.0)
+            results.append((file_path, is_valid, read_seconds + parse_seconds, size, reason, detail))
+        return results
 
-    corrupt_files = []
-    
-    # Use multiprocessing
-    if files_to_check:
-        
-        # Use available CPUs or default to 8 if not detectable (though cpu_count usually works)
-        num_processes = cpu_count()
-        # logging.info(f"Using {num_processes} processes.") 
-        
-        with Pool(processes=num_processes) as pool:
-            results = pool.map(check_file_worker, files_to_check)
-            
-        # Filter out None results
-        corrupt_files = [res for res in results if res is not None]
-
-    logging.info(f"Scan complete. Checked {count_checked} files. Found {len(corrupt_files)} corrupt.")
-    return corrupt_files
-
-def is_valid_pdf(file_path: str) -> bool:
-    """
-    Returns True if the PDF is valid, False otherwise.
+    def close(self):
+        self.readers.shutdown(wait=True, cancel_futures=True)
+        _release_pool(self.pool, self.owns_pool)
+
+def _listed_size(entry) -> int:
+    """
+    Size of a listed file, from the stat the listing already made; 0 if it
+    can no longer be read.
+    """
+    try:
+        return entry.stat().st_size
+    except OSError:
+        return 0
+
+def iter_corrupt_files(path, days_back: int, fecha_desde_str: str = None, cache=None,
+                       validation_depth: int = VALIDATION_PYPDF, processes: int = None,
+                       chunksize: int = DEFAULT_CHUNKSIZE, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                       recursive: bool = False, max_depth: int = 0, exclude: list = None,
+                       walker_threads: int = DEFAULT_WALKER_THREADS, prune_dirs: bool = False,
+                       metrics=None, execution: str = EXECUTION_PROCESSES,
+                       read_threads: int = DEFAULT_READ_THREADS, max_read_threads: int = DEFAULT_MAX_READ_THREADS,
+                       read_ahead: int = DEFAULT_READ_AHEAD, read_memory_mb: int = DEFAULT_READ_MEMORY_MB,
+                       file_timeout: float = DEFAULT_FILE_TIMEOUT, memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB,
+                       max_tasks_per_child: int = DEFAULT_MAX_TASKS_PER_CHILD,
+                       page_sample: int = DEFAULT_PAGE_SAMPLE, pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+                       revision_policy: str = REVISIONS_ALL, newest_by: str = NEWEST_BY_NUMBER,
+                       skip_copies: bool = True, pool: ValidationPool = None, shard: tuple = None,
+                       errors: list = None, entries: list = None):
+    """
+    Streaming version of scan_directory: validation starts while the directories
+    are still being listed, and corrupt albaran numbers are yielded as soon as
+    they are known (in completion order, not listing order), each one once.
+
+    `path` is a directory or a list of directories. See walk_pdf_files for the
+    recursion, exclusion and pruning options.
+
+    With `execution` = "procesos", files are sent to the pool in chunks of
+    `chunksize`; at most `max_in_flight` files are queued or being validated
+    at any time, so memory stays bounded regardless of the directory size.
+    With "hibrido", reading and parsing are split (see _HybridScanner).
+    Files are validated on `pool` if given (a ValidationPool reused across
+    scans, whose own limits and deep options apply), otherwise on a pool
+    started for this scan.
+
+    A file that takes longer than `file_timeout` seconds or makes its worker
+    exceed `memory_limit_mb` is reported as corrupt; the worker is killed and
+    replaced (see SupervisedPool). These verdicts are not cached, so the file
+    is retried on the next run. A file whose worker raised an error gets no
+    verdict: it is logged and listed with the limit hits, not reported as
+    corrupt, and likewise checked again on the next run.
+
+    At the deep level ("profundo"), every page is checked, or the first, the
+    last and `page_sample` random ones; documents with more than
+    `pages_per_task` pages to check are split across workers.
+
+    Files are grouped by albaran number while listing. `revision_policy`
+    selects which revisions are validated and when an albaran counts as
+    corrupt (see revisions.py); "ultima" lists everything before validating
+    the newest file of each albaran. With `skip_copies`, files byte-identical
+    to another file of the same albaran are not validated.
+
+    With `shard` = (partition, partitions), only the albaranes of that
+    partition (see sharding.partition_of) are checked; the rest of the
+    listing is left to the other shards. `entries` (e.g. one partition of
+    list_partitions) are checked instead of walking `path` again.
+
+    If an `errors` list is given, the scan appends a message for each root
+    it could not reach and each directory it failed to list or walk: the
+    albaranes under them were not checked, so the result is partial.
+
+    If a RunMetrics is given, listing time, file/byte counters and the
+    per-file latencies reported by the workers are recorded in it.
     """
+    scan_start = time.perf_counter()
+    roots = [path] if isinstance(path, str) else list(path)
+    logging.info(f"Scanning directories: {', '.join(roots)} for files modified in last {days_back} days."
+                 f"{' (recursive)' if recursive else ''}")
+
+    cutoff_date = get_cutoff_date(days_back, fecha_desde_str)
+    logging.info(f"Cutoff date: {cutoff_date}")
+
+    # Use available CPUs unless configured
+    num_processes = pool.processes if pool is not None else processes or cpu_count()
+    pool_options = {"task_timeout": file_timeout, "memory_limit_mb": memory_limit_mb,
+                    "max_tasks_per_child": max_tasks_per_child, "page_sample": page_sample,
+                    "pages_per_task": pages_per_task}
+    if execution == EXECUTION_HYBRID:
+        scanner = _HybridScanner(num_processes, validation_depth, read_threads, max_read_threads,
+                                 read_ahead, read_memory_mb * 1024 * 1024, pool_options, pool)
+    elif execution == EXECUTION_PROCESSES:
+        scanner = _PoolScanner(num_processes, validation_depth, chunksize, max_in_flight, pool_options, pool)
+    else:
+        raise ValueError(f"Unknown execution mode: {execution}. Expected one of {list(EXECUTION_MODES)}")
+
+    identities = {}
+    count_enumerated = 0
+    count_cached = 0
+    count_checked = 0
+    count_corrupt = 0
+    limit_hits = []
+    tracker = CorruptTracker(revision_policy)
+    barcodes = {}
+
+    def collect(block: bool):
+        nonlocal count_checked, count_corrupt
+        for file_path, is_valid, seconds, bytes_read, reason, _ in scanner.poll(block):
+            barcode = barcodes.pop(file_path)
+            if is_valid is None:
+                # Worker error: no verdict, so nothing is cached and the file is checked again next run
+                logging.warning(f"Could not check {os.path.basename(file_path)} ({reason}): "
+                                f"not reported as corrupt.")
+                limit_hits.append(f"{os.path.basename(file_path)} ({reason}, not checked)")
+                if metrics is not None:
+                    metrics.incr(f"files_{reason}")
+                identities.pop(file_path, None)
+                yield from tracker.verdict(barcode, False)
+                continue
+            count_checked += 1
+            if metrics is not None:
+                metrics.observe_latency(seconds)
+                metrics.incr("bytes_read", bytes_read)
+            if reason not in (None, REASON_CORRUPT):
+                limit_hits.append(f"{os.path.basename(file_path)} ({reason}, {seconds:.1f}s)")
+                if metrics is not None:
+                    metrics.incr(f"files_{reason}")
+                identities.pop(file_path, None)
+            elif cache is not None:
+                cache.record(file_path, *identities.pop(file_path), is_valid, validation_depth)
+            if not is_valid:
+                count_corrupt += 1
+            yield from tracker.verdict(barcode, not is_valid)
+
     try:
-        # pypdf validation
-        reader = PdfReader(file_path)
-        # Try to read pages to ensure it's not actually broken content
-        if len(reader.pages) > 0:
-             # Basic check: try accessing the first page
-            _ = reader.pages[0]
-            return True
-        return False
-    except Exception:
-        return False
+        try:
+            if entries is not None:
+                candidates = iter(entries)
+            else:
+                candidates = walk_pdf_files(roots, cutoff_date.timestamp(), recursive, max_depth, exclude,
+                                            walker_threads, prune_dirs, errors)
+            if metrics is not None:
+                candidates = timed_iter(candidates, metrics, "listing")
+            if shard is not None:
+                partition, partitions = shard
+                candidates = (e for e in candidates
+                              if partition_of(clean_albaran_number(e.name), partitions) == partition)
+            if revision_policy == REVISIONS_LATEST:
+                candidates = latest_revisions(candidates, newest_by, metrics)
+            if skip_copies:
+                candidates = skip_identical_copies(candidates, metrics)
+
+            for entry in candidates:
+                count_enumerated += 1
+                barcode = tracker.expect(entry.name)
+                if cache is not None:
+                    identity = file_identity(entry)
+                    verdict = cache.lookup(entry.path, *identity, validation_depth)
+                    if verdict is not None:
+                        count_cached += 1
+                        if not verdict:
+                            count_corrupt += 1
+                        yield from tracker.verdict(barcode, not verdict)
+                        continue
+                    identities[entry.path] = identity
+
+                barcodes[entry.path] = barcode
+                scanner.submit(entry.path, entry.name, _listed_size(entry))
+
+                # Yield whatever finished meanwhile; block only when the window is full
+                yield from collect(block=False)
+                while scanner.full():
+                    yield from collect(block=True)
+
+        except Exception as e:
+            logging.error(f"Error scanning directory: {e}")
+            if errors is not None:
+                errors.append(f"Error scanning directory: {e}")
+
+        yield from tracker.listing_done()
+        scanner.flush()
+        while scanner.pending():
+            yield from collect(block=True)
+
+    finally:
+        scanner.close()
+
+    cache_info = ""
+    if cache is not None:
+        cache.flush()
+        cache_info = f" Cache hits: {cache.hits}, misses: {cache.misses}."
+
+    if metrics is not None:
+        metrics.add_time("scan", time.perf_counter() - scan_start)
+        metrics.incr("files_enumerated", count_enumerated)
+        metrics.incr("files_cached", count_cached)
+        metrics.incr("files_validated", count_checked)
+        metrics.incr("files_corrupt", count_corrupt)
+
+    logging.info(f"Scan complete. Checked {count_checked} files. Found {count_corrupt} corrupt "
+                 f"({len(tracker.reported)} albaranes reported).{cache_info}")
+    if limit_hits:
+        logging.warning(f"{len(limit_hits)} files hit the per-file limits: {', '.join(limit_hits)}")
+
+def scan_directory(path, days_back: int, fecha_desde_str: str = None, cache=None,
+                   validation_depth: int = VALIDATION_PYPDF, processes: int = None,
+                   chunksize: int = DEFAULT_CHUNKSIZE, max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+                   recursive: bool = False, max_depth: int = 0, exclude: list = None,
+                   walker_threads: int = DEFAULT_WALKER_THREADS, prune_dirs: bool = False,
+                   metrics=None, execution: str = EXECUTION_PROCESSES,
+                   read_threads: int = DEFAULT_READ_THREADS, max_read_threads: int = DEFAULT_MAX_READ_THREADS,
+                   read_ahead: int = DEFAULT_READ_AHEAD, read_memory_mb: int = DEFAULT_READ_MEMORY_MB,
+                   file_timeout: float = DEFAULT_FILE_TIMEOUT, memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB,
+                   max_tasks_per_child: int = DEFAULT_MAX_TASKS_PER_CHILD,
+                   page_sample: int = DEFAULT_PAGE_SAMPLE, pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+                   revision_policy: str = REVISIONS_ALL, newest_by: str = NEWEST_BY_NUMBER,
+                   skip_copies: bool = True, pool: ValidationPool = None,
+                   shard: tuple = None, errors: list = None, entries: list = None) -> list[str]:
+    """
+    Scans the directory (or list of directories) for PDF files modified within the last `days_back` days.
+    Checks if they are valid PDFs using multiprocessing, up to `validation_depth`.
+    If a VerdictCache is given, files unchanged since their last check are not parsed again.
+    Returns the corrupt albaran numbers (filename stems without extension or
+    revision suffixes), each once. See iter_corrupt_files for `errors` and `entries`.
+    """
+    return list(iter_corrupt_files(path, days_back, fecha_desde_str, cache, validation_depth,
+                                   processes, chunksize, max_in_flight,
+                                   recursive, max_depth, exclude, walker_threads, prune_dirs, metrics,
+                                   execution, read_threads, max_read_threads, read_ahead, read_memory_mb,
+                                   file_timeout, memory_limit_mb, max_tasks_per_child, page_sample, pages_per_task,
+                                   revision_policy, newest_by, skip_copies, pool, shard, errors, entries))
+
+def list_partitions(path, days_back: int, partitions: int, fecha_desde_str: str = None, recursive: bool = False,
+                    max_depth: int = 0, exclude: list = None, walker_threads: int = DEFAULT_WALKER_THREADS,
+                    prune_dirs: bool = False, errors: list = None) -> dict:
+    """
+    Lists the directory (or list of directories) once and returns the PDF
+    entries modified within the last `days_back` days by partition
+    ({partition: [DirEntry]}, see sharding.partition_of), for a shard to pass
+    each partition it leases to scan_directory as `entries`. Walking the
+    share is the main cost over SMB, so a shard lists it once instead of
+    once per partition. See iter_corrupt_files for the other options.
+    """
+    roots = [path] if isinstance(path, str) else list(path)
+    start = time.perf_counter()
+    cutoff_date = get_cutoff_date(days_back, fecha_desde_str)
+    listing = {}
+    for entry in walk_pdf_files(roots, cutoff_date.timestamp(), recursive, max_depth, exclude,
+                                walker_threads, prune_dirs, errors):
+        listing.setdefault(partition_of(clean_albaran_number(entry.name), partitions), []).append(entry)
+    logging.info(f"Listed {sum(len(e) for e in listing.values())} files in {time.perf_counter() - start:.2f}s "
+                 f"for {partitions} partitions.")
+    return listing
@@ -0,0 +1,140 @@
+import io
+import csv
+from html import escape
+from operator import attrgetter
+from typing import List, Optional, Sequence, Tuple
+
+from albaran_record import AlbaranRecord
+
+# Reports with more rows than this are sent as a short summary with the
+# full listing as a CSV attachment (0 = always inline)
+DEFAULT_MAX_INLINE_ROWS = 500
+
+# Excel in a Spanish locale expects ";" as the CSV separator; the BOM makes
+# it read the file as UTF-8 (Nº, Dañados...)
+CSV_DELIMITER = ";"
+CSV_ENCODING = "utf-8-sig"
+
+# (AlbaranRecord field, header, text format spec); spec None = no padding.
+# Supplier names are cut to 39 characters so the columns stay aligned.
+CENTER_COLUMNS = (
+    ("cod_barras", "Cod.Barras", "<12"),
+    ("alm", "ALM", "<4"),
+    ("num_int", "Nº int", "<8"),
+    ("fecha", "Fecha", "<9"),
+    ("cuenta_mayor", "****", "<6"),
+    ("prov_codigo", "Prov", "<6"),
+    ("division", "Div", "<4"),
+    ("proveedor_desc", "Proveedor", "<40.39"),
+    ("serie", "**", "<3"),
+    ("albaran", "Albaran", "<9"),
+    ("flag", "Flag", "<4"),
+)
+CENTRAL_COLUMNS = (("cod_barras", "Cod.Barras", None),)
+
+HTML_HEAD = """<html>
+<head>
+<style>
+table { border-collapse: collapse; width: 100%; font-family: monospace; }
+th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+th { background-color: #f2f2f2; }
+</style>
+</head>
+<body>
+"""
+HTML_TAIL = "</body>\n</html>\n"
+
+class ReportTemplate:
+    """
+    Text, HTML and CSV layout of a report, with the row templates compiled
+    once into bound str.format methods.
+
+    `text_row` overrides the fixed-width text line (e.g. "- {0}" for a plain
+    list); with `table` False the text body has no header line.
+    """
+
+    def __init__(self, columns: Sequence[tuple], title: str, intro: str, footer: str,
+                 text_row: str = None, table: bool = True):
+        self.keys = [key for key, _, _ in columns]
+        # attrgetter of a single field returns the value, not a 1-tuple
+        getter = attrgetter(*self.keys)
+        self.values = getter if len(self.keys) > 1 else lambda record: (getter(record),)
+        self.headers = [header for _, header, _ in columns]
+        self.title = title
+        self.intro = intro
+        self.footer = footer
+        self.table = table
+
+        if text_row is None:
+            text_row = " ".join(f"{{{i}:{spec}}}" if spec else f"{{{i}}}" for i, (_, _, spec) in enumerate(columns))
+        self.text_row = text_row.format
+        self.html_row = ("<tr>" + "".join(f"<td>{{{i}}}</td>" for i in range(len(columns))) + "</tr>\n").format
+        self.text_header = self.text_row(*self.headers) if table else ""
+        self.html_header = ("<tr>" + "".join(f"<th>{escape(h)}</th>" for h in self.headers) + "</tr>\n")
+
+    def render(self, rows: Sequence[AlbaranRecord], max_inline_rows: int = DEFAULT_MAX_INLINE_ROWS,
+               attach_csv: bool = False, csv_name: str = "albaranes.csv") -> Tuple[str, str, Optional[tuple]]:
+        """
+        Renders the report in one pass over `rows`.
+        Returns (body_text, body_html, attachment), where attachment is
+        (file name, bytes) or None. Above `max_inline_rows` the bodies only
+        carry a summary and the rows go in the CSV attachment.
+        """
+        inline = not max_inline_rows or len(rows) <= max_inline_rows
+        with_csv = attach_csv or not inline
+
+        text: List[str] = []
+        html: List[str] = []
+        csv_buffer = io.StringIO()
+        writer = csv.writer(csv_buffer, delimiter=CSV_DELIMITER, lineterminator="\r\n")
+        if with_csv:
+            writer.writerow(self.headers)
+
+        text_row, html_row, get_values = self.text_row, self.html_row, self.values
+        for row in rows:
+            values = ["" if value is None else str(value) for value in get_values(row)]
+            if inline:
+                text.append(text_row(*values))
+                html.append(html_row(*map(escape, values)))
+            if with_csv:
+                writer.writerow(values)
+
+        attachment = (csv_name, csv_buffer.getvalue().encode(CSV_ENCODING)) if with_csv else None
+        if inline:
+            return self._body_text(text, attachment), self._body_html(html, attachment), attachment
+
+        summary = (f"Se han detectado {len(rows)} albaranes. El listado es demasiado extenso para el cuerpo "
+                   f"del correo y va adjunto en {csv_name}.")
+        body_text = f"{summary}\n\n{self.footer}"
+        body_html = f"{HTML_HEAD}<h3>{escape(self.title)}</h3>\n<p>{escape(summary)}</p>\n" \
+                    f"<p>{escape(self.footer)}</p>\n{HTML_TAIL}"
+        return body_text, body_html, attachment
+
+    def _body_text(self, lines: List[str], attachment: Optional[tuple]) -> str:
+        parts = []
+        if self.intro:
+            parts.append(f"{self.intro}\n")
+        if self.table:
+            parts += [self.text_header, "-" * len(self.text_header)]
+        parts += lines
+        parts.append("")
+        if attachment is not None:
+            parts.append(f"El listado va adjunto también en {attachment[0]}.")
+        parts.append(self.footer)
+        return "\n".join(parts)
+
+    def _body_html(self, rows: List[str], attachment: Optional[tuple]) -> str:
+        parts = [HTML_HEAD, f"<h3>{escape(self.title)}</h3>\n"]
+        if self.intro:
+            parts.append(f"<p>{escape(self.intro)}</p>\n")
+        parts += ["<table>\n", self.html_header, *rows, "</table>\n"]
+        if attachment is not None:
+            parts.append(f"<p>El listado va adjunto también en {escape(attachment[0])}.</p>\n")
+        parts += [f"<p>{escape(self.footer)}</p>\n", HTML_TAIL]
+        return "".join(parts)
+
+CENTER_REPORT = ReportTemplate(CENTER_COLUMNS, "Listado de Albaranes Dañados", "",
+                               "Por favor, vuelva a escanear estos documentos.")
+CENTRAL_REPORT = ReportTemplate(CENTRAL_COLUMNS, "Albaranes PDF Corruptos",
+                                "Se han detectado los siguientes archivos PDF corruptos o ilegibles:",
+                                "Por favor, revise estos archivos.", text_row="- {0}", table=False)
@@ -0,0 +1,182 @@
+import os
+import re
+import hashlib
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# What to validate and report when an albaran has several files
+# (1234.pdf, 1234-Rev(1.02).pdf, 1234_002.pdf...):
+REVISIONS_ALL = "todas"                   # validate every file, corrupt if any file is bad
+REVISIONS_LATEST = "ultima"               # validate only the newest revision
+REVISIONS_ALL_CORRUPT = "todas_corruptas" # validate every file, corrupt only if all of them are bad
+REVISION_POLICIES = (REVISIONS_ALL, REVISIONS_LATEST, REVISIONS_ALL_CORRUPT)
+
+# How "newest" is decided for REVISIONS_LATEST
+NEWEST_BY_NUMBER = "numero"  # -Rev(x.yy) number, then _NNN copy number, then mtime
+NEWEST_BY_DATE = "fecha"     # modification time
+NEWEST_BY = (NEWEST_BY_NUMBER, NEWEST_BY_DATE)
+
+REVISION_RE = re.compile(r"-Rev\(?\s*([\d.]+)", re.IGNORECASE)
+COPY_RE = re.compile(r"_(\d+)$")
+
+HASH_BLOCK = 1024 * 1024
+
+def clean_albaran_number(file_name: str) -> str:
+    """
+    Returns the albaran number from a PDF filename, without extension,
+    -Rev(x.xx) or _002 suffixes.
+    """
+    filename_stem = os.path.splitext(file_name)[0]
+
+    # Remove -Rev...
+    if "-Rev" in filename_stem:
+        filename_stem = filename_stem.split("-Rev")[0]
+
+    clean_number = filename_stem.split("-")[0] # Splits at -Rev
+    clean_number = clean_number.split("_")[0] # Splits at _002
+    return clean_number
+
+def revision_number(file_name: str) -> tuple:
+    """
+    Sort key of a file among the revisions of its albaran:
+    (revision, copy), e.g. "1234-Rev(1.02)_003.pdf" -> ((1, 2), 3).
+    Files without a revision sort first.
+    """
+    filename_stem = os.path.splitext(file_name)[0]
+    match = REVISION_RE.search(filename_stem)
+    revision = tuple(int(part) for part in match.group(1).split(".") if part) if match else ()
+    match = COPY_RE.search(filename_stem)
+    return revision, int(match.group(1)) if match else 0
+
+def latest_revisions(entries: Iterable[os.DirEntry], newest_by: str = NEWEST_BY_NUMBER,
+                     metrics=None) -> Iterator[os.DirEntry]:
+    """
+    Yields only the newest file of each albaran. The whole listing has to be
+    seen first, so validation starts once enumeration is over.
+    """
+    newest: Dict[str, tuple] = {}
+    superseded = 0
+    for entry in entries:
+        try:
+            mtime_ns = entry.stat().st_mtime_ns
+        except OSError:
+            continue
+        if newest_by == NEWEST_BY_DATE:
+            key = (mtime_ns, revision_number(entry.name))
+        else:
+            key = (revision_number(entry.name), mtime_ns)
+        barcode = clean_albaran_number(entry.name)
+        current = newest.get(barcode)
+        if current is None or key > current[0]:
+            newest[barcode] = (key, entry)
+        superseded += current is not None
+
+    if superseded:
+        logging.info(f"Revisions: skipping {superseded} older revisions of {len(newest)} albaranes.")
+    if metrics is not None:
+        metrics.incr("files_superseded", superseded)
+    for _, entry in newest.values():
+        yield entry
+
+def _content_hash(path: str) -> Optional[bytes]:
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(HASH_BLOCK), b""):
+                digest.update(block)
+    except OSError:
+        return None
+    return digest.digest()
+
+def skip_identical_copies(entries: Iterable[os.DirEntry], metrics=None) -> Iterator[os.DirEntry]:
+    """
+    Drops files that are byte-identical to another file of the same albaran
+    (e.g. a _002 copy of the original). Only files whose size matches an
+    earlier file of the same albaran are hashed, so unique files are never
+    read here.
+    """
+    # (barcode, size) -> [[path, hash or None], ...]
+    seen: Dict[tuple, List[list]] = {}
+    skipped = 0
+    for entry in entries:
+        try:
+            size = entry.stat().st_size
+        except OSError:
+            size = None
+        key = (clean_albaran_number(entry.name), size)
+        same_size = seen.setdefault(key, [])
+        if same_size and size is not None:
+            entry_hash = _content_hash(entry.path)
+            duplicate = False
+            for other in same_size:
+                if other[1] is None:
+                    other[1] = _content_hash(other[0])
+                if entry_hash is not None and other[1] == entry_hash:
+                    duplicate = True
+                    break
+            if duplicate:
+                skipped += 1
+                logging.debug(f"Skipping {entry.name}: identical to {os.path.basename(other[0])}")
+                continue
+            same_size.append([entry.path, entry_hash])
+        else:
+            same_size.append([entry.path, None])
+        yield entry
+
+    if skipped:
+        logging.info(f"Revisions: skipped {skipped} byte-identical copies.")
+    if metrics is not None:
+        metrics.incr("files_duplicate", skipped)
+
+class CorruptTracker:
+    """
+    Turns per-file verdicts into corrupt albaran numbers, each reported once.
+
+    With REVISIONS_ALL_CORRUPT an albaran is only reported when every one of
+    its files has a verdict and all of them are bad, which is known once the
+    listing is complete (listing_done). Files without a verdict (worker
+    error) count as not bad.
+    """
+
+    def __init__(self, policy: str = REVISIONS_ALL):
+        if policy not in REVISION_POLICIES:
+            raise ValueError(f"Unknown revision policy: {policy}. Expected one of {list(REVISION_POLICIES)}")
+        self.policy = policy
+        self.reported = set()
+        self.listing_complete = False
+        # barcode -> [files expected, files with a verdict, bad files]
+        self.groups: Dict[str, List[int]] = {}
+
+    def expect(self, file_name: str) -> str:
+        """
+        Registers an enumerated file; returns its albaran number.
+        """
+        barcode = clean_albaran_number(file_name)
+        self.groups.setdefault(barcode, [0, 0, 0])[0] += 1
+        return barcode
+
+    def verdict(self, barcode: str, is_bad: bool) -> List[str]:
+        """
+        Records a file verdict; returns the albaran numbers now known to be corrupt.
+        """
+        group = self.groups[barcode]
+        group[1] += 1
+        group[2] += bool(is_bad)
+        return self._ready(barcode)
+
+    def listing_done(self) -> List[str]:
+        self.listing_complete = True
+        return [b for barcode in list(self.groups) for b in self._ready(barcode)]
+
+    def _ready(self, barcode: str) -> List[str]:
+        if barcode in self.reported:
+            return []
+        expected, done, bad = self.groups[barcode]
+        if self.policy == REVISIONS_ALL_CORRUPT:
+            corrupt = self.listing_complete and done == expected and bad == expected
+        else:
+            corrupt = bad > 0
+        if not corrupt:
+            return []
+        self.reported.add(barcode)
+        return [barcode]
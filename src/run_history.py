@@ -0,0 +1,207 @@
+import sqlite3
+import time
+import logging
+from typing import Dict, Iterable, List, Optional, Set
+
+# Which corrupt albaranes each run emails
+NOTIFY_ALL = "todos"      # every corrupt albaran in the dias_atras window, every run
+NOTIFY_DELTA = "nuevos"   # new ones, plus a reminder for unresolved ones every `reminder_hours`
+NOTIFY_MODES = (NOTIFY_ALL, NOTIFY_DELTA)
+
+# Per-run item states
+STATE_CORRUPT = "corrupt"
+STATE_MISSING = "missing"     # corrupt, but not found in the DB
+STATE_NOTIFIED = "notified"
+
+class RunHistory:
+    """
+    On-disk history of runs: which albaranes each run found corrupt, which
+    were missing from the DB and which were notified.
+
+    An albaran stays open from the first run that finds it corrupt until a
+    run no longer does (the file was rescanned fine or left the window);
+    if it comes back it counts as new again. A run whose scan was partial
+    (a root unreachable, a directory that failed to list) resolves nothing,
+    since the albaranes it did not see may still be corrupt, and is not
+    taken as the previous run by the next one. With NOTIFY_DELTA only new
+    albaranes, and open ones not notified for `reminder_hours` (0 = never
+    remind), are due, so DB lookups and mails scale with new problems
+    rather than with the window size.
+    """
+
+    def __init__(self, db_path: str, reminder_hours: float = 24, max_age_days: int = 90):
+        self.db_path = db_path
+        self.reminder = reminder_hours * 3600
+        self.max_age_days = max_age_days
+        self.run_id: Optional[int] = None
+        self.previous_run_id: Optional[int] = None
+
+        self._conn = sqlite3.connect(db_path)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                corrupt INTEGER NOT NULL DEFAULT 0,
+                notified INTEGER NOT NULL DEFAULT 0,
+                complete INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE TABLE IF NOT EXISTS run_items (
+                run_id INTEGER NOT NULL,
+                barcode TEXT NOT NULL,
+                state TEXT NOT NULL,
+                PRIMARY KEY (run_id, state, barcode)
+            );
+            CREATE TABLE IF NOT EXISTS albaranes (
+                barcode TEXT PRIMARY KEY,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                last_notified REAL,
+                notify_count INTEGER NOT NULL DEFAULT 0,
+                resolved_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_albaranes_open ON albaranes(resolved_at);
+        """)
+        self._conn.commit()
+
+        # barcode -> last_notified of the open albaranes, loaded by start_run
+        self._open: Dict[str, Optional[float]] = {}
+        self._resolved: Set[str] = set()
+
+    def start_run(self) -> int:
+        self.previous_run_id = self._conn.execute(
+            "SELECT MAX(run_id) FROM runs WHERE finished_at IS NOT NULL AND complete = 1").fetchone()[0]
+        self._open = dict(self._conn.execute("SELECT barcode, last_notified FROM albaranes WHERE resolved_at IS NULL"))
+        self._resolved = set()
+        self.run_id = self._conn.execute("INSERT INTO runs (started_at) VALUES (?)", (time.time(),)).lastrowid
+        self._conn.commit()
+        return self.run_id
+
+    def _add_items(self, barcodes: Iterable[str], state: str):
+        self._conn.executemany("INSERT OR IGNORE INTO run_items (run_id, barcode, state) VALUES (?, ?, ?)",
+                               ((self.run_id, b, state) for b in barcodes))
+
+    def record_corrupt(self, barcodes: Iterable[str], complete: bool = True):
+        """
+        Records the corrupt albaranes found by this run. If the scan was
+        `complete`, open albaranes that are no longer among them are marked
+        resolved; after a partial scan they stay open.
+        """
+        now = time.time()
+        current = set(barcodes)
+
+        new = current - self._open.keys()
+        resolved = self._open.keys() - current if complete else set()
+        if not complete:
+            self._conn.execute("UPDATE runs SET complete = 0 WHERE run_id = ?", (self.run_id,))
+            logging.warning(f"Partial scan: {len(self._open.keys() - current)} open albaranes not seen "
+                            f"by this run are kept open.")
+        self._add_items(current, STATE_CORRUPT)
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO albaranes (barcode, first_seen, last_seen, last_notified, notify_count, resolved_at) "
+            "VALUES (?, ?, ?, NULL, 0, NULL)", ((b, now, now) for b in new))
+        self._conn.executemany("UPDATE albaranes SET last_seen = ? WHERE barcode = ?",
+                               ((now, b) for b in current - new))
+        self._conn.commit()
+
+        # Marked resolved by finish_run, so a run that crashes resolves nothing
+        self._resolved = resolved
+        for barcode in resolved:
+            del self._open[barcode]
+        for barcode in new:
+            self._open[barcode] = None
+
+    def is_due(self, barcode: str, now: float = None) -> bool:
+        """
+        True if `barcode` should be notified now: never notified, or last
+        notified more than `reminder_hours` ago. Valid from start_run on, so
+        it can filter albaranes while the scan is still running.
+        """
+        last_notified = self._open.get(barcode)
+        if last_notified is None:
+            return True
+        return self.reminder > 0 and (now or time.time()) - last_notified >= self.reminder
+
+    def due(self, barcodes: Iterable[str]) -> List[str]:
+        """
+        Returns the albaranes of `barcodes` to notify now (see is_due).
+        """
+        now = time.time()
+        return [barcode for barcode in barcodes if self.is_due(barcode, now)]
+
+    def record_missing(self, barcodes: Iterable[str]):
+        self._add_items(barcodes, STATE_MISSING)
+        self._conn.commit()
+
+    def record_notified(self, barcodes: Iterable[str]):
+        now = time.time()
+        barcodes = list(barcodes)
+        self._add_items(barcodes, STATE_NOTIFIED)
+        self._conn.executemany(
+            "UPDATE albaranes SET last_notified = ?, notify_count = notify_count + 1 WHERE barcode = ?",
+            ((now, b) for b in barcodes))
+        self._conn.commit()
+        for barcode in barcodes:
+            if barcode in self._open:
+                self._open[barcode] = now
+
+    def changes(self, run_id: int = None, since_run_id: int = None) -> Dict[str, List[str]]:
+        """
+        What changed between two runs (default: this run and the previous
+        finished, complete one): {"new": corrupt now but not before,
+        "resolved": corrupt before but not now, "missing": missing from the
+        DB now but not before}. A partial run resolves nothing.
+        """
+        run_id = run_id or self.run_id
+        if since_run_id is None:
+            since_run_id = self.previous_run_id if run_id == self.run_id else self._conn.execute(
+                "SELECT MAX(run_id) FROM runs WHERE run_id < ? AND finished_at IS NOT NULL AND complete = 1",
+                (run_id,)).fetchone()[0]
+        complete = self._conn.execute("SELECT complete FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+
+        def diff(a, b, state):
+            return [row[0] for row in self._conn.execute(
+                "SELECT barcode FROM run_items WHERE run_id = ? AND state = ? AND barcode NOT IN "
+                "(SELECT barcode FROM run_items WHERE run_id = ? AND state = ?) ORDER BY barcode",
+                (a, state, b, state))]
+
+        return {"new": diff(run_id, since_run_id, STATE_CORRUPT),
+                "resolved": diff(since_run_id, run_id, STATE_CORRUPT) if complete and complete[0] else [],
+                "missing": diff(run_id, since_run_id, STATE_MISSING)}
+
+    def finish_run(self):
+        """
+        Closes the current run and drops runs and resolved albaranes older
+        than `max_age_days`. A run that never finishes (crash) or was partial
+        is ignored as the previous run by the next one.
+        """
+        if self.run_id is None:
+            return
+        now = time.time()
+        self._conn.executemany("UPDATE albaranes SET resolved_at = ? WHERE barcode = ?",
+                               ((now, b) for b in self._resolved))
+        self._resolved = set()
+        self._conn.execute("""
+            UPDATE runs SET finished_at = ?,
+                corrupt = (SELECT COUNT(*) FROM run_items WHERE run_id = runs.run_id AND state = ?),
+                notified = (SELECT COUNT(*) FROM run_items WHERE run_id = runs.run_id AND state = ?)
+            WHERE run_id = ?
+        """, (now, STATE_CORRUPT, STATE_NOTIFIED, self.run_id))
+        self._conn.commit()
+        self.evict()
+
+    def evict(self):
+        if not self.max_age_days or self.max_age_days <= 0:
+            return
+        cutoff = time.time() - self.max_age_days * 86400
+        old_runs = self._conn.execute("SELECT run_id FROM runs WHERE started_at < ? AND run_id != ?",
+                                      (cutoff, self.run_id or 0)).fetchall()
+        self._conn.executemany("DELETE FROM run_items WHERE run_id = ?", old_runs)
+        self._conn.executemany("DELETE FROM runs WHERE run_id = ?", old_runs)
+        removed = self._conn.execute("DELETE FROM albaranes WHERE resolved_at < ?", (cutoff,)).rowcount
+        self._conn.commit()
+        if old_runs or removed:
+            logging.info(f"Run history: dropped {len(old_runs)} runs and {removed} resolved albaranes.")
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from collections import defaultdict
+from typing import Any, Dict
+
+# Upper bounds (ms) of the per-file validation latency histogram
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class RunMetrics:
+    """
+    Stage timings and counters for one run, written at the end as a JSON
+    summary and optionally as a Prometheus textfile-collector file.
+
+    Stages: listing, scan, db_lookup, email (seconds, accumulated).
+    Counters: files_enumerated, files_cached, files_validated, files_corrupt,
+    files_timeout, files_memory, files_crash, files_error, bytes_read, db_chunks, db_rows,
+    emails_sent, emails_failed, albaranes_new, albaranes_resolved,
+    albaranes_suppressed.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        # DB chunks may be counted from several threads
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] += seconds
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe_latency(self, seconds: float):
+        ms = seconds * 1000
+        index = len(LATENCY_BUCKETS_MS)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if ms <= bound:
+                index = i
+                break
+        with self._lock:
+            self.latency_buckets[index] += 1
+            self.latency_sum += seconds
+            self.latency_count += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}ms": count for bound, count in zip(LATENCY_BUCKETS_MS, self.latency_buckets)}
+        buckets["gt_10000ms"] = self.latency_buckets[-1]
+        return {
+            "started_at": self.started_at,
+            "duration_s": round(time.time() - self.started_at, 3),
+            "stages_s": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            "counters": dict(self.counters),
+            "file_latency": {
+                "count": self.latency_count,
+                "mean_ms": round(self.latency_sum / self.latency_count * 1000, 3) if self.latency_count else 0,
+                "buckets": buckets,
+            },
+        }
+
+    def write_json(self, path: str):
+        _write_atomic(path, json.dumps(self.to_dict(), indent=2))
+
+    def write_prometheus(self, path: str):
+        """
+        Writes the metrics in the Prometheus text format, for node_exporter's
+        textfile collector (the file is replaced atomically).
+        """
+        lines = [
+            "# HELP autocheck_run_duration_seconds Duration of the last run.",
+            "# TYPE autocheck_run_duration_seconds gauge",
+            f"autocheck_run_duration_seconds {time.time() - self.started_at:.3f}",
+            "# HELP autocheck_run_timestamp_seconds Start time of the last run.",
+            "# TYPE autocheck_run_timestamp_seconds gauge",
+            f"autocheck_run_timestamp_seconds {self.started_at:.0f}",
+            "# HELP autocheck_stage_seconds Time spent in each stage of the last run.",
+            "# TYPE autocheck_stage_seconds gauge",
+        ]
+        lines += [f'autocheck_stage_seconds{{stage="{name}"}} {seconds:.3f}' for name, seconds in self.stages.items()]
+        lines += [
+            "# HELP autocheck_count Counters of the last run.",
+            "# TYPE autocheck_count gauge",
+        ]
+        lines += [f'autocheck_count{{name="{name}"}} {value}' for name, value in self.counters.items()]
+        lines += [
+            "# HELP autocheck_file_validation_seconds Per-file validation latency of the last run.",
+            "# TYPE autocheck_file_validation_seconds histogram",
+        ]
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.latency_buckets):
+            cumulative += count
+            lines.append(f'autocheck_file_validation_seconds_bucket{{le="{bound / 1000}"}} {cumulative}')
+        lines.append(f'autocheck_file_validation_seconds_bucket{{le="+Inf"}} {self.latency_count}')
+        lines.append(f"autocheck_file_validation_seconds_sum {self.latency_sum:.6f}")
+        lines.append(f"autocheck_file_validation_seconds_count {self.latency_count}")
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+    def write(self, json_path: str = None, prometheus_path: str = None):
+        """
+        Writes whichever outputs are configured. Failures are logged, never raised.
+        """
+        for path, writer in ((json_path, self.write_json), (prometheus_path, self.write_prometheus)):
+            if not path:
+                continue
+            try:
+                writer(path)
+                logging.info(f"Run metrics written to {path}")
+            except Exception as e:
+                logging.warning(f"Could not write run metrics to {path}: {e}")
+
+def _write_atomic(path: str, content: str):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+def timed_iter(iterable, metrics: RunMetrics, stage: str):
+    """
+    Yields from `iterable`, adding the time spent producing each item to `stage`.
+    """
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            metrics.add_time(stage, time.perf_counter() - start)
+            return
+        metrics.add_time(stage, time.perf_counter() - start)
+        yield item
@@ -0,0 +1,296 @@
+import os
+import time
+import zlib
+import socket
+import sqlite3
+import logging
+import datetime
+import threading
+from typing import Callable, Iterator, List, Optional, Tuple
+
+DEFAULT_PARTITIONS = 8
+# A shard renews its lease every third of this; a lease not renewed in time
+# (the shard died or hung) is handed to another shard
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_POLL_INTERVAL = 2.0
+# How long a shard started before the coordinator waits for a scan to appear
+DEFAULT_START_WAIT = 300
+
+def partition_of(barcode: str, partitions: int) -> int:
+    """
+    Partition of an albaran number. Hashing the albaran rather than the path
+    keeps all of its revisions in the same partition, so revision policies
+    and identical-copy detection work within a shard. crc32 is stable across
+    processes and hosts, unlike hash().
+    """
+    return zlib.crc32(barcode.encode("utf-8")) % partitions
+
+def default_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+class ShardStore:
+    """
+    Lease store shared by the shards of a scan, kept in a SQLite file on a
+    path every host can reach.
+
+    The coordinator creates a scan split into `partitions`; shards claim
+    one partition at a time under a lease of `lease_seconds`, renew it while
+    they work, and complete it with their corrupt albaranes in the same
+    transaction, so a shard that dies leaves either a finished partition or
+    one that is leased again once its lease expires.
+
+    SQLite over SMB/NFS relies on the share's file locking: keep the store on
+    a share that supports it, and not in WAL mode.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float = DEFAULT_LEASE_SECONDS, timeout: float = 30):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        # Autocommit; write transactions are opened explicitly with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(db_path, timeout=timeout, isolation_level=None)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS scans (
+                scan_id TEXT PRIMARY KEY,
+                partitions INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                closed_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                scan_id TEXT NOT NULL,
+                partition INTEGER NOT NULL,
+                owner TEXT,
+                expires_at REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                done_at REAL,
+                errors TEXT,
+                PRIMARY KEY (scan_id, partition)
+            );
+            CREATE TABLE IF NOT EXISTS shard_results (
+                scan_id TEXT NOT NULL,
+                partition INTEGER NOT NULL,
+                barcode TEXT NOT NULL,
+                PRIMARY KEY (scan_id, partition, barcode)
+            );
+        """)
+
+    def _write(self, sql_steps: Callable):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = sql_steps()
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._conn.execute("COMMIT")
+        return result
+
+    def create_scan(self, partitions: int = DEFAULT_PARTITIONS, scan_id: str = None) -> str:
+        scan_id = scan_id or datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+        def create():
+            self._conn.execute("INSERT INTO scans (scan_id, partitions, created_at) VALUES (?, ?, ?)",
+                               (scan_id, partitions, time.time()))
+            self._conn.executemany("INSERT INTO leases (scan_id, partition) VALUES (?, ?)",
+                                   ((scan_id, p) for p in range(partitions)))
+        self._write(create)
+        return scan_id
+
+    def open_scan(self) -> Optional[Tuple[str, int]]:
+        """
+        Returns (scan_id, partitions) of the newest scan not closed yet, or None.
+        """
+        return self._conn.execute("SELECT scan_id, partitions FROM scans WHERE closed_at IS NULL "
+                                  "ORDER BY created_at DESC LIMIT 1").fetchone()
+
+    def close_scan(self, scan_id: str):
+        self._write(lambda: self._conn.execute("UPDATE scans SET closed_at = ? WHERE scan_id = ?",
+                                               (time.time(), scan_id)))
+
+    def claim(self, scan_id: str, owner: str) -> Optional[int]:
+        """
+        Leases a partition that is neither done nor leased (or whose lease
+        expired) to `owner`. Returns its number, or None.
+        """
+        def claim():
+            now = time.time()
+            row = self._conn.execute("SELECT partition, owner FROM leases WHERE scan_id = ? AND done_at IS NULL "
+                                     "AND expires_at < ? ORDER BY attempts, partition LIMIT 1",
+                                     (scan_id, now)).fetchone()
+            if row is None:
+                return None
+            partition, previous = row
+            if previous is not None:
+                logging.warning(f"Shard lease of partition {partition} held by {previous} expired; "
+                                f"re-leasing it to {owner}.")
+            self._conn.execute("UPDATE leases SET owner = ?, expires_at = ?, attempts = attempts + 1 "
+                               "WHERE scan_id = ? AND partition = ?",
+                               (owner, now + self.lease_seconds, scan_id, partition))
+            return partition
+        return self._write(claim)
+
+    def renew(self, scan_id: str, partition: int, owner: str) -> bool:
+        """
+        Extends the lease. False if `owner` no longer holds it.
+        """
+        return self._write(lambda: self._conn.execute(
+            "UPDATE leases SET expires_at = ? WHERE scan_id = ? AND partition = ? AND owner = ? AND done_at IS NULL",
+            (time.time() + self.lease_seconds, scan_id, partition, owner)).rowcount == 1)
+
+    def complete(self, scan_id: str, partition: int, owner: str, barcodes: List[str], errors: List[str] = ()) -> bool:
+        """
+        Stores the corrupt albaranes of a partition and marks it done, if
+        `owner` still holds its lease. False (results dropped) otherwise.
+        `errors` are the scan errors that left the partition partially checked.
+        """
+        def complete():
+            if self._conn.execute("UPDATE leases SET done_at = ?, errors = ? WHERE scan_id = ? AND partition = ? "
+                                  "AND owner = ? AND done_at IS NULL",
+                                  (time.time(), "\n".join(errors) or None, scan_id, partition, owner)).rowcount != 1:
+                return False
+            self._conn.executemany("INSERT OR IGNORE INTO shard_results (scan_id, partition, barcode) VALUES (?, ?, ?)",
+                                   ((scan_id, partition, b) for b in barcodes))
+            return True
+        return self._write(complete)
+
+    def progress(self, scan_id: str) -> Tuple[int, int]:
+        """
+        Returns (partitions done, partitions).
+        """
+        return self._conn.execute("SELECT COUNT(done_at), COUNT(*) FROM leases WHERE scan_id = ?",
+                                  (scan_id,)).fetchone()
+
+    def completed(self, scan_id: str) -> List[Tuple[int, List[str]]]:
+        """
+        Returns (partition, corrupt albaranes) for every partition done.
+        """
+        results = {p: [] for (p,) in self._conn.execute(
+            "SELECT partition FROM leases WHERE scan_id = ? AND done_at IS NOT NULL", (scan_id,))}
+        for partition, barcode in self._conn.execute(
+                "SELECT partition, barcode FROM shard_results WHERE scan_id = ? ORDER BY barcode", (scan_id,)):
+            results[partition].append(barcode)
+        return sorted(results.items())
+
+    def partition_errors(self, scan_id: str) -> List[Tuple[int, List[str]]]:
+        """
+        Returns (partition, scan errors) for every partition done with errors.
+        """
+        return [(partition, errors.split("\n")) for partition, errors in self._conn.execute(
+            "SELECT partition, errors FROM leases WHERE scan_id = ? AND done_at IS NOT NULL AND errors IS NOT NULL "
+            "ORDER BY partition", (scan_id,))]
+
+    def close(self):
+        self._conn.close()
+
+class _LeaseKeeper(threading.Thread):
+    """
+    Renews a partition lease in the background while the shard scans it.
+    Uses its own connection: SQLite connections stay in their thread.
+    """
+
+    def __init__(self, db_path: str, lease_seconds: float, scan_id: str, partition: int, owner: str):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.args = (scan_id, partition, owner)
+        self.lost = False
+        self._finished = threading.Event()
+
+    def run(self):
+        store = None
+        try:
+            store = ShardStore(self.db_path, self.lease_seconds)
+            while not self._finished.wait(self.lease_seconds / 3):
+                if not store.renew(*self.args):
+                    self.lost = True
+                    return
+        except sqlite3.Error as e:
+            logging.warning(f"Could not renew shard lease: {e}")
+        finally:
+            if store is not None:
+                store.close()
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+
+def run_shard(store: ShardStore, scan_partition: Callable[[int, int], List[str]], owner: str = None,
+              poll_interval: float = DEFAULT_POLL_INTERVAL, start_wait: float = DEFAULT_START_WAIT,
+              errors: List[str] = None) -> int:
+    """
+    Works as one shard of the newest open scan: claims partitions and calls
+    `scan_partition(partition, partitions)`, which returns the corrupt
+    albaranes of that partition, until every partition is done. Partitions
+    whose shard died are claimed again once their lease expires.
+
+    `errors` is the list `scan_partition` appends its scan errors to (see
+    iter_corrupt_files); they are stored with the partition and cleared
+    before the next one.
+    Returns the number of partitions this shard completed.
+    """
+    owner = owner or default_owner()
+    deadline = time.monotonic() + start_wait
+    scan = store.open_scan()
+    while scan is None and time.monotonic() < deadline:
+        time.sleep(poll_interval)
+        scan = store.open_scan()
+    if scan is None:
+        logging.warning(f"No sharded scan to work on in {store.db_path}.")
+        return 0
+
+    scan_id, partitions = scan
+    logging.info(f"Shard {owner} working on scan {scan_id} ({partitions} partitions).")
+    completed = 0
+    while True:
+        partition = store.claim(scan_id, owner)
+        if partition is None:
+            done, total = store.progress(scan_id)
+            if done == total:
+                break
+            # The rest are leased to other shards: wait in case one of them dies
+            time.sleep(poll_interval)
+            continue
+
+        keeper = _LeaseKeeper(store.db_path, store.lease_seconds, scan_id, partition, owner)
+        keeper.start()
+        if errors is not None:
+            errors.clear()
+        try:
+            barcodes = scan_partition(partition, partitions)
+        finally:
+            keeper.stop()
+        if store.complete(scan_id, partition, owner, barcodes, errors or ()):
+            completed += 1
+            logging.info(f"Shard {owner}: partition {partition + 1}/{partitions} done, {len(barcodes)} corrupt.")
+        else:
+            logging.warning(f"Shard {owner}: lost the lease of partition {partition + 1}/{partitions}; "
+                            f"its results were discarded.")
+
+    logging.info(f"Shard {owner} finished: {completed} partitions of scan {scan_id}.")
+    return completed
+
+def iter_shard_results(store: ShardStore, scan_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                       timeout: float = None, errors: List[str] = None) -> Iterator[str]:
+    """
+    Coordinator side: yields the corrupt albaranes of each partition as its
+    shard completes it, until the whole scan is done. Partitions are
+    disjoint by albaran, so each albaran is yielded once.
+    Once every partition is done, the scan errors reported by the shards are
+    appended to `errors`, if given.
+    Raises TimeoutError after `timeout` seconds (None = wait forever).
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    seen = set()
+    while True:
+        for partition, barcodes in store.completed(scan_id):
+            if partition not in seen:
+                seen.add(partition)
+                yield from barcodes
+        done, total = store.progress(scan_id)
+        if len(seen) == total:
+            if errors is not None:
+                for partition, messages in store.partition_errors(scan_id):
+                    errors.extend(f"Partition {partition + 1}/{total}: {m}" for m in messages)
+            return
+        if deadline is not None and time.monotonic() >= deadline:
+            raise TimeoutError(f"Sharded scan {scan_id}: only {done} of {total} partitions done "
+                               f"after {timeout:.0f}s.")
+        time.sleep(poll_interval)
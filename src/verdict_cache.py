@@ -0,0 +1,163 @@
+import os
+import sqlite3
+import time
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from pdf_worker import VALIDATION_PYPDF
+
+# Seconds a write waits for another process (e.g. a local shard) holding the database
+DEFAULT_BUSY_TIMEOUT = 120
+
+class VerdictCache:
+    """
+    On-disk store of PDF validation verdicts, so files that were already
+    checked in a previous run are not parsed again.
+
+    A verdict is reused only if the file still has the same size, mtime and
+    inode/file-id as when it was checked; any change invalidates it. A "valid"
+    verdict is only reused for validation depths up to the one it was checked
+    at, while a "corrupt" verdict holds for any depth.
+
+    Several processes (the shards of a sharded run) may share the file: a
+    write waits up to `timeout` seconds for the others, and a flush that
+    still finds the database locked keeps its verdicts for the next one
+    instead of failing the scan.
+    """
+
+    def __init__(self, db_path: str, max_entries: int = 200000, max_age_days: int = 30,
+                 timeout: float = DEFAULT_BUSY_TIMEOUT):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = sqlite3.connect(db_path, timeout=timeout)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS verdicts (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                file_id INTEGER NOT NULL,
+                is_valid INTEGER NOT NULL,
+                checked_at REAL NOT NULL,
+                last_seen REAL NOT NULL,
+                depth INTEGER NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_verdicts_last_seen ON verdicts(last_seen)")
+        self._conn.commit()
+
+        # Loaded lazily on first lookup: one query instead of one per file.
+        self._entries: Optional[Dict[str, Tuple[int, int, int, int, int]]] = None
+        self._pending: List[Tuple] = []
+        self._seen: List[str] = []
+
+    def _load(self):
+        self._entries = {}
+        for path, size, mtime_ns, file_id, is_valid, depth in self._conn.execute(
+                "SELECT path, size, mtime_ns, file_id, is_valid, depth FROM verdicts"):
+            self._entries[path] = (size, mtime_ns, file_id, is_valid, depth)
+
+    def lookup(self, path: str, size: int, mtime_ns: int, file_id: int,
+               depth: int = VALIDATION_PYPDF) -> Optional[bool]:
+        """
+        Returns the cached verdict (True = valid) if the file is unchanged,
+        or None if it must be validated again.
+        """
+        if self._entries is None:
+            self._load()
+
+        entry = self._entries.get(path)
+        if entry is not None and entry[:3] == (size, mtime_ns, file_id) and (not entry[3] or entry[4] >= depth):
+            self.hits += 1
+            self._seen.append(path)
+            return bool(entry[3])
+
+        self.misses += 1
+        return None
+
+    def record(self, path: str, size: int, mtime_ns: int, file_id: int, is_valid: bool,
+               depth: int = VALIDATION_PYPDF):
+        """
+        Queues a fresh verdict. Written to disk on flush().
+        """
+        now = time.time()
+        self._pending.append((path, size, mtime_ns, file_id, int(is_valid), now, now, depth))
+        if self._entries is not None:
+            self._entries[path] = (size, mtime_ns, file_id, int(is_valid), depth)
+
+    def invalidate(self, path: str = None):
+        """
+        Drops the verdict for `path`, or every verdict if no path is given.
+        """
+        if path is None:
+            self._conn.execute("DELETE FROM verdicts")
+            self._entries = {}
+        else:
+            self._conn.execute("DELETE FROM verdicts WHERE path = ?", (path,))
+            if self._entries is not None:
+                self._entries.pop(path, None)
+        self._conn.commit()
+
+    def evict(self):
+        """
+        Removes verdicts for files not seen in `max_age_days`, then the least
+        recently seen ones until at most `max_entries` remain.
+        """
+        removed = 0
+        if self.max_age_days and self.max_age_days > 0:
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += self._conn.execute("DELETE FROM verdicts WHERE last_seen < ?", (cutoff,)).rowcount
+
+        if self.max_entries and self.max_entries > 0:
+            removed += self._conn.execute("""
+                DELETE FROM verdicts WHERE path IN (
+                    SELECT path FROM verdicts ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+
+        self._conn.commit()
+        if removed:
+            logging.info(f"Verdict cache: evicted {removed} entries.")
+            self._entries = None
+
+    def flush(self):
+        """
+        Writes pending verdicts, refreshes last_seen for cache hits and applies
+        the eviction policy.
+        """
+        now = time.time()
+        try:
+            if self._pending:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO verdicts (path, size, mtime_ns, file_id, is_valid, checked_at, last_seen, depth) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+            if self._seen:
+                self._conn.executemany("UPDATE verdicts SET last_seen = ? WHERE path = ?",
+                                       ((now, p) for p in self._seen))
+            self._conn.commit()
+            self._pending = []
+            self._seen = []
+            self.evict()
+        except sqlite3.OperationalError as e:
+            # Busy past the timeout: a cache write is never worth failing the scan
+            self._conn.rollback()
+            logging.warning(f"Verdict cache busy ({e}): {len(self._pending)} verdicts kept for the next flush.")
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+def file_identity(entry: os.DirEntry) -> Tuple[int, int, int]:
+    """
+    Returns (size, mtime_ns, file_id) for a directory entry.
+    On Windows DirEntry.inode() returns the NTFS file id.
+    """
+    st = entry.stat()
+    try:
+        file_id = entry.inode()
+    except OSError:
+        file_id = 0
+    return st.st_size, st.st_mtime_ns, file_id
@@ -0,0 +1,312 @@
+import os
+import sys
+import time
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+from multiprocessing import cpu_count
+from typing import Callable, Dict, List, Tuple
+
+from pdf_checker import (clean_albaran_number, ValidationPool, VALIDATION_PYPDF, REASON_CORRUPT,
+                         DEFAULT_FILE_TIMEOUT, DEFAULT_MEMORY_LIMIT_MB, DEFAULT_MAX_TASKS_PER_CHILD,
+                         DEFAULT_PAGE_SAMPLE, DEFAULT_PAGES_PER_TASK)
+from dir_walker import walk_pdf_files, is_excluded
+from verdict_cache import file_identity
+
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_FLUSH_INTERVAL = 300
+
+# inotify(7) constants
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct("iIII")
+
+class _InotifySource:
+    """
+    Reports PDFs once they are fully written (IN_CLOSE_WRITE) or moved into a
+    watched directory. Blocks in select() between events, so it costs no CPU
+    while idle. Only sees local changes: use polling for network shares.
+    """
+
+    def __init__(self, roots: List[str], recursive: bool, max_depth: int, exclude: List[str]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.exclude = exclude
+        self._dirs: Dict[int, Tuple[str, int]] = {}
+        self._pending: List[str] = []
+        for root in roots:
+            if os.path.isdir(root):
+                self._watch_tree(root, 0)
+            else:
+                logging.error(f"Directory not found: {root}")
+
+    def _watch_tree(self, path: str, depth: int, report_existing: bool = False):
+        wd = self._add_watch(self.fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            logging.warning(f"Cannot watch {path}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._dirs[wd] = (path, depth)
+
+        descend = self.recursive and (not self.max_depth or depth < self.max_depth)
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if is_excluded(entry.path, entry.name, self.exclude):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        if descend:
+                            self._watch_tree(entry.path, depth + 1, report_existing)
+                    elif report_existing and entry.name.lower().endswith(".pdf"):
+                        # Files copied into a new folder before its watch existed
+                        self._pending.append(entry.path)
+        except OSError as e:
+            logging.warning(f"Error scanning directory {path}: {e}")
+
+    def wait(self, timeout: float) -> List[str]:
+        if not self._pending:
+            ready, _, _ = select.select([self.fd], [], [], max(0, timeout))
+            if ready:
+                self._read_events()
+        paths, self._pending = self._pending, []
+        return paths
+
+    def _read_events(self):
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                logging.warning("Watch event queue overflowed; some files may only be checked in the next batch run.")
+                continue
+            if mask & IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if wd not in self._dirs:
+                continue
+
+            directory, depth = self._dirs[wd]
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and self.recursive \
+                        and (not self.max_depth or depth < self.max_depth) \
+                        and not is_excluded(path, name, self.exclude):
+                    self._watch_tree(path, depth + 1, report_existing=True)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and name.lower().endswith(".pdf") \
+                    and not is_excluded(path, name, self.exclude):
+                self._pending.append(path)
+
+    def close(self):
+        os.close(self.fd)
+
+class _PollingSource:
+    """
+    Fallback for Windows and network shares, where change notifications are
+    unavailable or unreliable. Lists the roots every `interval` seconds and
+    reports a PDF once its size and mtime are unchanged between two polls,
+    i.e. once the scanner has finished writing it.
+    """
+
+    def __init__(self, roots: List[str], recursive: bool, max_depth: int, exclude: List[str], interval: float):
+        self.roots = roots
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.exclude = exclude
+        self.interval = interval
+        self._next_poll = time.monotonic()
+        self._since = time.time()
+        self._candidates: Dict[str, Tuple[int, int, int]] = {}
+        self._reported: Dict[str, Tuple[int, int, int]] = {}
+
+    def wait(self, timeout: float) -> List[str]:
+        delay = self._next_poll - time.monotonic()
+        if delay > timeout:
+            time.sleep(max(0, timeout))
+            return []
+        time.sleep(max(0, delay))
+        self._next_poll = time.monotonic() + self.interval
+
+        # Files modified since a little before the previous poll, or since the
+        # oldest file still waiting for its second sighting
+        poll_started = time.time()
+        seen = {}
+        for entry in walk_pdf_files(self.roots, self._since, self.recursive, self.max_depth, self.exclude):
+            seen[entry.path] = file_identity(entry)
+
+        ready = []
+        for path, identity in seen.items():
+            if self._candidates.get(path) == identity and self._reported.get(path) != identity:
+                self._reported[path] = identity
+                ready.append(path)
+        self._candidates = seen
+        # The caller may take longer than `interval` to come back (slow flush,
+        # large share): the next poll must still list every unreported file.
+        # mtimes are floored to whole seconds so float rounding can't exclude one.
+        waiting = [identity[1] // 1_000_000_000 for path, identity in seen.items()
+                   if self._reported.get(path) != identity]
+        self._since = min([poll_started - self.interval, *waiting])
+        # Forget files that left the window
+        self._reported = {p: i for p, i in self._reported.items() if p in seen}
+        return ready
+
+    def close(self):
+        pass
+
+def _create_source(roots, mode, poll_interval, recursive, max_depth, exclude):
+    mode = (mode or "auto").lower()
+    if mode in ("auto", "inotify") and sys.platform.startswith("linux"):
+        try:
+            return _InotifySource(roots, recursive, max_depth, exclude)
+        except (OSError, AttributeError) as e:
+            if mode == "inotify":
+                raise
+            logging.warning(f"inotify unavailable ({e}), falling back to polling.")
+    elif mode == "inotify":
+        raise ValueError("inotify watch mode is only available on Linux")
+    return _PollingSource(roots, recursive, max_depth, exclude, poll_interval)
+
+def watch_directories(roots: List[str], on_flush: Callable[[List[str]], None], mode: str = "auto",
+                      poll_interval: float = DEFAULT_POLL_INTERVAL, flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+                      validation_depth: int = VALIDATION_PYPDF, processes: int = None, recursive: bool = False,
+                      max_depth: int = 0, exclude: List[str] = None, cache=None, stop_after: float = None,
+                      file_timeout: float = DEFAULT_FILE_TIMEOUT, memory_limit_mb: int = DEFAULT_MEMORY_LIMIT_MB,
+                      max_tasks_per_child: int = DEFAULT_MAX_TASKS_PER_CHILD,
+                      page_sample: int = DEFAULT_PAGE_SAMPLE, pages_per_task: int = DEFAULT_PAGES_PER_TASK,
+                      pool: ValidationPool = None):
+    """
+    Watches `roots` and validates new or changed PDFs as they land, on a
+    worker pool kept alive for the whole session.
+
+    Corrupt albaran numbers are accumulated and passed to `on_flush` at most
+    every `flush_interval` seconds, so a burst of bad scans produces one
+    notification round instead of one per file. A file that is rescanned
+    correctly before the flush is dropped from the pending findings.
+    Files that hit the per-file limits are reported as corrupt (see
+    iter_corrupt_files). Files unchanged since their verdict was cached are
+    not validated again.
+
+    Every file is judged on its own as it lands: unlike iter_corrupt_files,
+    revision policies and identical-copy skipping don't apply (they need the
+    albaran's other files, which watching one event at a time doesn't see).
+
+    Runs until interrupted (or for `stop_after` seconds), then flushes what
+    is pending. A ValidationPool passed as `pool` is used instead of the
+    processes/limit options, and left running.
+    """
+    exclude = list(exclude or [])
+    source = _create_source(roots, mode, poll_interval, recursive, max_depth, exclude)
+    logging.info(f"Watching {', '.join(roots)} ({type(source).__name__.strip('_')}). "
+                 f"Findings are sent every {flush_interval:.0f}s.")
+
+    owns_pool = pool is None
+    if owns_pool:
+        pool = ValidationPool(processes or cpu_count(), file_timeout, memory_limit_mb, max_tasks_per_child,
+                              page_sample, pages_per_task)
+    pending: Dict[str, str] = {}
+    identities = {}
+    started = time.monotonic()
+    next_flush = None
+    stopped = False
+
+    def judge(file_path, is_valid):
+        nonlocal next_flush
+        if is_valid:
+            pending.pop(file_path, None)
+        else:
+            pending[file_path] = clean_albaran_number(os.path.basename(file_path))
+            if next_flush is None:
+                next_flush = time.monotonic() + flush_interval
+
+    def handle(results):
+        for file_path, is_valid, _, _, reason, _ in results:
+            identity = identities.pop(file_path, None)
+            if is_valid is None:
+                logging.warning(f"Could not check {os.path.basename(file_path)} ({reason}): "
+                                f"not reported as corrupt.")
+                continue
+            if cache is not None and identity is not None and reason in (None, REASON_CORRUPT):
+                cache.record(file_path, *identity, is_valid, validation_depth)
+            judge(file_path, is_valid)
+
+    def flush():
+        nonlocal next_flush
+        next_flush = None
+        if not pending:
+            return
+        stems = list(dict.fromkeys(pending.values()))
+        pending.clear()
+        logging.info(f"Watch: reporting {len(stems)} corrupt albaranes.")
+        try:
+            on_flush(stems)
+        except Exception as e:
+            logging.error(f"Failed to notify watch findings: {e}")
+
+    try:
+        while True:
+            now = time.monotonic()
+            if stop_after is not None and now - started >= stop_after:
+                break
+
+            # Sleep until the next event, result or flush deadline
+            timeout = poll_interval if pool.pending() == 0 else 0.2
+            if next_flush is not None:
+                timeout = min(timeout, max(0, next_flush - now))
+            if stop_after is not None:
+                timeout = min(timeout, max(0, started + stop_after - now))
+
+            for path in source.wait(timeout):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                if cache is not None:
+                    identity = (st.st_size, st.st_mtime_ns, st.st_ino)
+                    verdict = cache.lookup(path, *identity, validation_depth)
+                    if verdict is not None:
+                        judge(path, verdict)
+                        continue
+                    identities[path] = identity
+                pool.submit([(path, os.path.basename(path), validation_depth)])
+
+            handle(pool.get(timeout=0))
+
+            if next_flush is not None and time.monotonic() >= next_flush:
+                if cache is not None:
+                    cache.flush()
+                flush()
+
+        # Let the files in flight finish before the last flush
+        while pool.pending():
+            handle(pool.get())
+        stopped = True
+
+    except KeyboardInterrupt:
+        # Workers got the interrupt too; files still in flight are checked in the next run
+        logging.info("Watch interrupted.")
+    finally:
+        if owns_pool:
+            if stopped:
+                pool.close()
+            else:
+                pool.terminate()
+        source.close()
+        if cache is not None:
+            cache.flush()
+        flush()
@@ -0,0 +1,378 @@
+import os
+import sys
+import time
+import ctypes
+import logging
+import multiprocessing
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Any, Callable, List, Optional
+
+# How often busy workers are checked against the time and memory limits
+WATCHDOG_INTERVAL = 0.2
+
+# Reasons reported for files whose worker had to be killed
+LIMIT_TIMEOUT = "timeout"
+LIMIT_MEMORY = "memory"
+LIMIT_CRASH = "crash"
+TASK_ERROR = "error"
+
+# Chunk id of the messages that carry a worker's log record instead of results
+_LOG_RECORD = 0
+
+class _PipeLogQueue:
+    """
+    Queue of a worker's logging QueueHandler: sends each record to the
+    parent right away over the worker's own pipe, so the records of a
+    worker that is later killed are not lost and no queue is shared.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def put_nowait(self, record: logging.LogRecord):
+        self.conn.send((_LOG_RECORD, record, False))
+
+def _forward_logging(conn, level: int, log_filter: logging.Filter = None):
+    from logging.handlers import QueueHandler
+
+    handler = QueueHandler(_PipeLogQueue(conn))
+    if log_filter is not None:
+        handler.addFilter(log_filter)
+    root = logging.getLogger()
+    for inherited in list(root.handlers):
+        root.removeHandler(inherited)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+def _worker_main(conn, status, worker: Callable, max_tasks: int, initializer: Callable = None, initargs=(),
+                 log_config: tuple = None):
+    """
+    Worker process loop. Receives (chunk_id, chunk) messages and answers
+    with the results of the whole chunk, as (ok, result or error) pairs,
+    and whether the worker is exiting to be recycled.
+
+    `status` is shared memory [chunk_id, item index, start time, ready],
+    written before each item, so the parent knows which file a stuck worker
+    is on without any message round trip.
+
+    With `log_config` = (level, filter), the worker's log records are sent
+    to the parent on the same pipe, and logged there.
+    """
+    if log_config is not None:
+        _forward_logging(conn, *log_config)
+    if initializer is not None:
+        initializer(*initargs)
+    status[3] = 1.0
+    done = 0
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+
+        chunk_id, chunk = message
+        results = []
+        for index, args in enumerate(chunk):
+            status[0] = chunk_id
+            status[1] = index
+            status[2] = time.time()
+            try:
+                results.append((True, worker(args)))
+            except Exception as e:
+                results.append((False, repr(e)))
+            status[2] = 0.0
+        done += len(chunk)
+
+        # Recycle the process after `max_tasks` items (like maxtasksperchild)
+        recycle = bool(max_tasks) and done >= max_tasks
+        conn.send((chunk_id, results, recycle))
+        if recycle:
+            return
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """
+    Resident memory of a process in MB, or None where unsupported.
+    """
+    try:
+        if sys.platform.startswith("linux"):
+            with open(f"/proc/{pid}/statm") as f:
+                resident_pages = int(f.read().split()[1])
+            return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+        if sys.platform == "win32":
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                            ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                            ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+            kernel32 = ctypes.windll.kernel32
+            # PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ
+            handle = kernel32.OpenProcess(0x1000 | 0x0010, False, pid)
+            if not handle:
+                return None
+            try:
+                counters = PROCESS_MEMORY_COUNTERS()
+                counters.cb = ctypes.sizeof(counters)
+                if not kernel32.K32GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                    return None
+                return counters.WorkingSetSize / (1024 * 1024)
+            finally:
+                kernel32.CloseHandle(handle)
+    except (OSError, ValueError, AttributeError):
+        return None
+    return None
+
+class _Worker:
+    def __init__(self, process, conn, status):
+        self.process = process
+        self.conn = conn
+        self.status = status
+        self.chunk_id = None
+        self.chunk = None
+
+class SupervisedPool:
+    """
+    Process pool that enforces a per-item wall-clock and memory limit.
+
+    Unlike multiprocessing.Pool, each worker has its own pipe, so a worker
+    stuck on a pathological file (huge xref, cyclic references, zip-bomb
+    stream) can be killed without corrupting shared queues. The item it was
+    working on is reported through `limit_result(args, reason, seconds)`,
+    the rest of its chunk is requeued (results are sent per chunk, so items
+    it had already finished are checked again), and a fresh worker is started.
+    Workers are also recycled after `max_tasks_per_child` items.
+
+    With `log_config` (see log_setup.worker_log_config), workers log through
+    the parent instead of their own handlers.
+    """
+
+    def __init__(self, processes: int, worker: Callable, limit_result: Callable,
+                 task_timeout: float = None, memory_limit_mb: float = None, max_tasks_per_child: int = None,
+                 initializer: Callable = None, initargs=(), log_config: tuple = None):
+        self.processes = max(1, processes)
+        self.worker = worker
+        self.limit_result = limit_result
+        self.task_timeout = task_timeout or None
+        self.memory_limit_mb = memory_limit_mb or None
+        self.max_tasks_per_child = max_tasks_per_child or 0
+        self.initializer = initializer
+        self.initargs = initargs
+        self.log_config = log_config
+        self.limit_hits: List[tuple] = []
+
+        self._ctx = multiprocessing.get_context()
+        self._queue = deque()
+        self._next_chunk_id = 0
+        self._outstanding = 0
+        self._workers: List[_Worker] = [self._spawn() for _ in range(self.processes)]
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._ctx.Pipe()
+        status = self._ctx.Array("d", 4, lock=False)
+        process = self._ctx.Process(target=_worker_main, daemon=True,
+                                    args=(child_conn, status, self.worker, self.max_tasks_per_child,
+                                          self.initializer, self.initargs, self.log_config))
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn, status)
+
+    def submit(self, chunk: List[Any]):
+        """
+        Queues a chunk of items. Chunks are sent to workers as they become idle.
+        """
+        if not chunk:
+            return
+        self._queue.append(list(chunk))
+        self._outstanding += len(chunk)
+        self._dispatch()
+
+    def pending(self) -> int:
+        """
+        Number of submitted items whose result has not been returned yet.
+        """
+        return self._outstanding
+
+    def _dispatch(self):
+        for index, worker in enumerate(self._workers):
+            if not self._queue:
+                return
+            if worker.chunk is not None:
+                continue
+            chunk = self._queue.popleft()
+            self._next_chunk_id += 1
+            worker.chunk_id, worker.chunk = self._next_chunk_id, chunk
+            try:
+                worker.conn.send((worker.chunk_id, chunk))
+            except (OSError, ValueError):
+                self._replace(index, LIMIT_CRASH, None)
+
+    def get(self, timeout: float = None) -> List[Any]:
+        """
+        Returns the results that are ready, waiting up to `timeout` seconds
+        (None = until at least one is ready, 0 = don't wait).
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            self._dispatch()
+            results = []
+            busy = [w.conn for w in self._workers if w.chunk is not None]
+            if not busy:
+                if self._queue:
+                    # A send failed and the worker was replaced: dispatch again
+                    continue
+                return results
+
+            wait_for = WATCHDOG_INTERVAL
+            if deadline is not None:
+                wait_for = max(0.0, min(wait_for, deadline - time.monotonic()))
+            for conn in wait(busy, timeout=wait_for):
+                index = next(i for i, w in enumerate(self._workers) if w.conn is conn)
+                results += self._receive(index)
+
+            results += self._watchdog()
+            if results or (deadline is not None and time.monotonic() >= deadline):
+                self._outstanding -= len(results)
+                return results
+
+    def _receive(self, index: int) -> List[Any]:
+        worker = self._workers[index]
+        results = []
+        try:
+            while worker.conn.poll():
+                chunk_id, payload, recycle = worker.conn.recv()
+                if chunk_id == _LOG_RECORD:
+                    logging.getLogger(payload.name).handle(payload)
+                    continue
+                for args, (ok, result) in zip(worker.chunk, payload):
+                    if not ok:
+                        logging.error(f"Worker error on {args[0] if isinstance(args, tuple) else args}: {result}")
+                        result = self.limit_result(args, TASK_ERROR, 0.0)
+                    results.append(result)
+                worker.chunk_id = worker.chunk = None
+                if recycle:
+                    worker.process.join()
+                    worker.conn.close()
+                    self._workers[index] = self._spawn()
+                break
+        except (EOFError, OSError):
+            results += self._replace(index, LIMIT_CRASH, self._current_item(worker))
+        return results
+
+    def _current_item(self, worker: _Worker) -> Optional[int]:
+        status = worker.status
+        if worker.chunk is None or not status[2] or int(status[0]) != worker.chunk_id:
+            return None
+        return int(status[1])
+
+    def _watchdog(self) -> List[Any]:
+        results = []
+        now = time.time()
+        for index, worker in enumerate(self._workers):
+            if worker.chunk is None:
+                continue
+            item = self._current_item(worker)
+            if not worker.process.is_alive():
+                # Read anything it sent before dying
+                results += self._receive(index)
+                if self._workers[index] is worker and worker.chunk is not None:
+                    results += self._replace(index, LIMIT_CRASH, self._current_item(worker))
+                continue
+            # Read once: the worker resets it to 0 when the item finishes
+            started = worker.status[2]
+            if item is None or not started:
+                continue
+            if self.task_timeout and now - started > self.task_timeout:
+                results += self._replace(index, LIMIT_TIMEOUT, item)
+            elif self.memory_limit_mb:
+                rss = process_rss_mb(worker.process.pid)
+                if rss is not None and rss > self.memory_limit_mb:
+                    results += self._replace(index, LIMIT_MEMORY, item)
+        return results
+
+    def _forward_logs(self, worker: _Worker):
+        """
+        Logs the records a dead worker sent before it died. Its results are
+        dropped: the chunk is requeued.
+        """
+        try:
+            while worker.conn.poll():
+                chunk_id, payload, _ = worker.conn.recv()
+                if chunk_id == _LOG_RECORD:
+                    logging.getLogger(payload.name).handle(payload)
+        except Exception:
+            # A message cut short by the kill
+            pass
+
+    def _replace(self, index: int, reason: str, item: Optional[int]) -> List[Any]:
+        """
+        Kills worker `index`, reports `item` of its chunk with `reason`,
+        requeues its other unfinished items and starts a new worker.
+        """
+        worker = self._workers[index]
+        started = worker.status[2]
+        elapsed = time.time() - started if started else 0.0
+
+        if worker.process.is_alive():
+            worker.process.terminate()
+        worker.process.join()
+        self._forward_logs(worker)
+        worker.conn.close()
+        if not worker.status[3]:
+            # Died while importing or initializing: a new worker would too
+            self._workers.pop(index)
+            self.terminate()
+            raise RuntimeError(f"Worker process failed to start (exit code {worker.process.exitcode}).")
+        self._workers[index] = self._spawn()
+
+        results = []
+        if worker.chunk is not None:
+            remaining = [args for i, args in enumerate(worker.chunk) if i != item]
+            if remaining:
+                self._queue.appendleft(remaining)
+            if item is not None:
+                args = worker.chunk[item]
+                logging.warning(f"Worker {reason} after {elapsed:.1f}s on {args[0] if isinstance(args, tuple) else args}; "
+                                f"worker restarted.")
+                self.limit_hits.append((args, reason, elapsed))
+                results.append(self.limit_result(args, reason, elapsed))
+        return results
+
+    def close(self):
+        for worker in self._workers:
+            try:
+                worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.conn.close()
+        self._workers = []
+
+    def restart(self):
+        """
+        Kills every worker and starts fresh ones, dropping all queued and
+        running items (e.g. after a caller stopped reading results half way).
+        """
+        self.terminate()
+        self._queue.clear()
+        self._outstanding = 0
+        self._workers = [self._spawn() for _ in range(self.processes)]
+
+    def terminate(self):
+        for worker in self._workers:
+            worker.process.terminate()
+        for worker in self._workers:
+            worker.process.join()
+            worker.conn.close()
+        self._workers = []
@@ -0,0 +1,143 @@
+import os
+import sys
+import zlib
+import random
+import argparse
+
+# Share of each kind of file in a generated corpus. Most nightly files are
+# valid single-page scans; the bad ones are mostly truncated uploads.
+DEFAULT_MIX = {
+    "valid": 0.70,
+    "multipage": 0.10,
+    "image": 0.05,
+    "truncated": 0.08,
+    "garbage": 0.04,
+    "empty": 0.03,
+}
+
+CORRUPT_KINDS = ("truncated", "garbage", "empty")
+
+def build_pdf(pages: int = 1, image_size: int = 0, rng: random.Random = None, compress: bool = False) -> bytes:
+    """
+    Builds a well-formed PDF with `pages` A4 pages of text. If `image_size`
+    is given, every page also draws a grayscale image of about that many
+    (incompressible) bytes, like a scanned albaran. With `compress`, page
+    content streams are Flate-encoded.
+    """
+    rng = rng or random.Random(0)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(b"")  # filled in once the page tree exists
+    pages_id = add(b"")
+    font = add(b"<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>")
+
+    image = None
+    if image_size:
+        side = max(1, int(image_size ** 0.5))
+        pixels = zlib.compress(rng.randbytes(side * side), 1)
+        image = add(b"<</Type/XObject/Subtype/Image/Width %d/Height %d/ColorSpace/DeviceGray"
+                    b"/BitsPerComponent 8/Filter/FlateDecode/Length %d>>stream\n" % (side, side, len(pixels))
+                    + pixels + b"\nendstream")
+
+    kids = []
+    for number in range(1, pages + 1):
+        text = b"BT /F1 12 Tf 72 770 Td (Albaran de entrada - pagina %d) Tj ET" % number
+        if image:
+            text += b"\nq 451 0 0 600 72 100 cm /Im1 Do Q"
+        if compress:
+            text = zlib.compress(text)
+            content = add(b"<</Length %d/Filter/FlateDecode>>stream\n" % len(text) + text + b"\nendstream")
+        else:
+            content = add(b"<</Length %d>>stream\n" % len(text) + text + b"\nendstream")
+        resources = b"<</Font<</F1 %d 0 R>>" % font
+        if image:
+            resources += b"/XObject<</Im1 %d 0 R>>" % image
+        resources += b">>"
+        kids.append(add(b"<</Type/Page/Parent %d 0 R/MediaBox[0 0 595 842]/Contents %d 0 R/Resources %s>>"
+                        % (pages_id, content, resources)))
+
+    objects[catalog - 1] = b"<</Type/Catalog/Pages %d 0 R>>" % pages_id
+    objects[pages_id - 1] = b"<</Type/Pages/Kids[%s]/Count %d>>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<</Size %d/Root %d 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+def albaran_filename(rng: random.Random, barcode: int) -> str:
+    """
+    Realistic names: plain barcode, -Rev(x.xx) revisions and _002 copies.
+    """
+    style = rng.random()
+    if style < 0.6:
+        return f"{barcode}.pdf"
+    if style < 0.85:
+        return f"{barcode}-Rev({rng.randint(1, 3)}.{rng.randint(0, 99):02d}).pdf"
+    return f"{barcode}_{rng.randint(2, 4):03d}.pdf"
+
+def make_file(kind: str, rng: random.Random) -> bytes:
+    if kind == "valid":
+        return build_pdf(1, rng=rng)
+    if kind == "multipage":
+        return build_pdf(rng.randint(5, 60), rng=rng)
+    if kind == "image":
+        return build_pdf(rng.randint(1, 3), image_size=rng.randint(500_000, 2_000_000), rng=rng)
+    if kind == "truncated":
+        data = build_pdf(rng.randint(1, 10), rng=rng)
+        return data[:rng.randint(16, len(data) - 32)]
+    if kind == "garbage":
+        if rng.random() < 0.5:
+            return b"<html><head><title>502 Bad Gateway</title></head><body>Error</body></html>"
+        return rng.randbytes(rng.randint(100, 50_000))
+    if kind == "empty":
+        return b""
+    raise ValueError(f"Unknown file kind: {kind}")
+
+def generate_corpus(out_dir: str, count: int, seed: int = 1234, mix: dict = None) -> dict:
+    """
+    Writes `count` PDFs to `out_dir` and returns a manifest
+    {filename: kind}. Barcodes are unique, so each corrupt file maps to one
+    expected corrupt albaran number.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    os.makedirs(out_dir, exist_ok=True)
+
+    manifest = {}
+    barcodes = rng.sample(range(1_000_000, 9_999_999), count)
+    for barcode in barcodes:
+        kind = rng.choices(kinds, weights)[0]
+        name = albaran_filename(rng, barcode)
+        with open(os.path.join(out_dir, name), "wb") as f:
+            f.write(make_file(kind, rng))
+        manifest[name] = kind
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a synthetic albaran PDF corpus.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.out_dir, args.files, args.seed)
+    corrupt = sum(1 for kind in manifest.values() if kind in CORRUPT_KINDS)
+    print(f"Generated {len(manifest)} files in {args.out_dir} ({corrupt} corrupt).")
+
+if __name__ == "__main__":
+    sys.exit(main())
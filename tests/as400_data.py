@@ -0,0 +1,93 @@
+import os
+import sys
+import random
+import argparse
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from db_backends import create_sqlite_database
+
+DEFAULT_CENTERS = (60, 160, 210, 330, 450)
+# Share of scanned albaranes without an ENTMEC entry (LEFT JOIN gives NULLs)
+ORPHAN_SHARE = 0.02
+INSERT_BATCH = 50_000
+
+def _rows(rng: random.Random, barcodes, centers, providers):
+    next_number = {center: 100_000 for center in centers}
+    for barcode in barcodes:
+        center = rng.choice(centers)
+        next_number[center] += 1
+        number = next_number[center]
+        mayor, account, division, _ = rng.choice(providers)
+        entmec = None
+        if rng.random() >= ORPHAN_SHARE:
+            # CHAR columns come back padded to their width, as on DB2
+            entmec = (center, number, 20260000 + rng.randint(1, 12) * 100 + rng.randint(1, 28), mayor, account,
+                      division, rng.choice(("A", "B", "")).ljust(2), f"{rng.randint(1, 999999)}".ljust(10))
+        yield (barcode, rng.choice("SN"), center, number), entmec
+
+def generate_as400_db(db_path: str, rows: int, seed: int = 1234, centers=DEFAULT_CENTERS,
+                      barcodes=()) -> list:
+    """
+    Writes a SQLite copy of DRVAA00K, ENTMEC and PRODIV (see
+    db_backends.SQLITE_SCHEMA) with `rows` scanned albaranes spread over
+    `centers`, and returns their barcodes. `barcodes` (e.g. the albaranes
+    of a generated PDF corpus) are included first.
+    """
+    rng = random.Random(seed)
+    conn = create_sqlite_database(db_path)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+
+    providers = []
+    for _ in range(max(50, rows // 200)):
+        providers.append((rng.choice((400, 410)), rng.randint(1, 999999), rng.randint(1, 20),
+                          f"PROVEEDOR {rng.randint(1, 99999)}, S.A.".ljust(40)))
+    providers = list({p[:3]: p for p in providers}.values())
+    conn.executemany("INSERT OR IGNORE INTO PRODIV VALUES (?, ?, ?, ?)", providers)
+
+    wanted = list(dict.fromkeys(int(b) for b in barcodes))
+    taken = set(wanted)
+    extra = []
+    while len(wanted) + len(extra) < rows:
+        barcode = rng.randint(1_000_000, 99_999_999)
+        if barcode not in taken:
+            taken.add(barcode)
+            extra.append(barcode)
+    all_barcodes = wanted + extra
+
+    drv_batch, ent_batch = [], []
+
+    def flush():
+        conn.executemany("INSERT INTO DRVAA00K VALUES (?, ?, ?, ?)", drv_batch)
+        conn.executemany("INSERT INTO ENTMEC VALUES (?, ?, ?, ?, ?, ?, ?, ?)", ent_batch)
+        drv_batch.clear()
+        ent_batch.clear()
+
+    for drv, entmec in _rows(rng, all_barcodes, list(centers), providers):
+        drv_batch.append(drv)
+        if entmec is not None:
+            ent_batch.append(entmec)
+        if len(drv_batch) >= INSERT_BATCH:
+            flush()
+    flush()
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+    return [str(b) for b in all_barcodes]
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates a SQLite stand-in for the AS400 detail tables.")
+    parser.add_argument("db_path")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db_path):
+        parser.error(f"{args.db_path} already exists")
+    barcodes = generate_as400_db(args.db_path, args.rows, args.seed)
+    print(f"Generated {len(barcodes)} albaranes in {args.db_path}.")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from as400_data import generate_as400_db
+from db_backends import SQLiteBackend
+from db_client import DBClient
+from detail_cache import AlbaranDetailCache
+
+# Share of looked-up albaranes that are not in the DB (negative cache entries)
+MISSING_SHARE = 0.05
+
+def lookup_stems(db_path: str, count: int, seed: int) -> list:
+    import sqlite3
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        total = conn.execute("SELECT COUNT(*) FROM DRVAA00K").fetchone()[0]
+        offsets = rng.sample(range(total), min(total, count))
+        present = [str(conn.execute("SELECT HVPROG FROM DRVAA00K LIMIT 1 OFFSET ?", (o,)).fetchone()[0])
+                   for o in offsets]
+    finally:
+        conn.close()
+    missing = [str(rng.randint(100_000_000, 999_999_999)) for _ in range(int(count * MISSING_SHARE))]
+    stems = present + missing
+    rng.shuffle(stems)
+    return stems
+
+def run_one(db_path: str, stems: list, batch_size: int, parallel: int, fetch_size: int, cache_path: str = None,
+            cache_state: str = "none") -> dict:
+    cache = None
+    if cache_path:
+        cache = AlbaranDetailCache(cache_path)
+        if cache_state == "cold":
+            cache.invalidate()
+    client = DBClient(backend=SQLiteBackend(db_path), batch_size=batch_size, pool_size=parallel,
+                      parallel_queries=parallel, fetch_size=fetch_size, cache=cache)
+    try:
+        start = time.perf_counter()
+        rows = client.get_albaran_details(stems)
+        wall = time.perf_counter() - start
+    finally:
+        client.close()
+        if cache is not None:
+            cache.close()
+    return {
+        "batch_size": batch_size,
+        "parallel": parallel,
+        "fetch_size": fetch_size,
+        "cache": cache_state,
+        "albaranes": len(stems),
+        "rows": len(rows),
+        "wall_s": round(wall, 4),
+        "albaranes_per_s": round(len(stems) / wall) if wall else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks DBClient lookups against a SQLite stand-in for the AS400.")
+    parser.add_argument("--rows", type=int, default=200_000, help="DB size when generating one.")
+    parser.add_argument("--db", help="Existing SQLite database (default: generate a temporary one).")
+    parser.add_argument("--lookups", type=int, default=5000, help="Albaranes looked up per measurement.")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--batch-sizes", default="100,500,900", help="Comma-separated IN-list chunk sizes.")
+    parser.add_argument("--parallel", default="1,4", help="Comma-separated concurrent chunk counts.")
+    parser.add_argument("--fetch-size", type=int, default=1000)
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    temp_dir = tempfile.mkdtemp(prefix="as400_bench_")
+    db_path = args.db
+    try:
+        if not db_path:
+            db_path = os.path.join(temp_dir, "as400.db")
+            print(f"Generating {args.rows} albaranes in {db_path}...", file=sys.stderr)
+            generate_as400_db(db_path, args.rows, args.seed)
+        stems = lookup_stems(db_path, args.lookups, args.seed)
+
+        results = []
+        for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+            for parallel in (int(p) for p in args.parallel.split(",")):
+                results.append(run_one(db_path, stems, batch_size, parallel, args.fetch_size))
+
+        # Detail cache in front of the DB: first run fills it, second is served from it
+        batch_size = int(args.batch_sizes.split(",")[0])
+        cache_path = os.path.join(temp_dir, "details.db")
+        for state in ("cold", "warm"):
+            results.append(run_one(db_path, stems, batch_size, 1, args.fetch_size, cache_path, state))
+
+        for r in results:
+            print(f"batch={r['batch_size']:<5} parallel={r['parallel']:<3} cache={r['cache']:<5} "
+                  f"{r['albaranes_per_s']:>9} albaranes/s  {r['rows']} rows in {r['wall_s']}s", file=sys.stderr)
+
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db": {"path": args.db, "rows": args.rows if not args.db else None, "seed": args.seed},
+            "results": results,
+        }
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+
+    finally:
+        shutil.rmtree(temp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdf_checker import scan_directory, parse_validation_depth
+from run_metrics import RunMetrics
+from worker_pool import process_rss_mb
+from albaran_corpus import generate_corpus
+
+class LatencyMetrics(RunMetrics):
+    """
+    RunMetrics that also keeps every per-file latency reported by the
+    workers during the scan, for exact percentiles.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.latencies = []
+
+    def observe_latency(self, seconds: float):
+        super().observe_latency(seconds)
+        with self._lock:
+            self.latencies.append(seconds * 1000)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[index]
+
+def peak_rss_mb():
+    """
+    Peak resident memory of this process, in MB. Not available on Windows.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+class WorkerMemorySampler(threading.Thread):
+    """
+    Samples the summed resident memory of this process's children (the
+    validation workers) every `interval` seconds and keeps the peak. None
+    where process_rss_mb is unsupported.
+    """
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_mb = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            sizes = [process_rss_mb(p.pid) for p in multiprocessing.active_children()]
+            sizes = [size for size in sizes if size is not None]
+            if sizes:
+                self.peak_mb = max(self.peak_mb or 0, sum(sizes))
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        return round(self.peak_mb, 1) if self.peak_mb is not None else None
+
+def run_one(corpus: str, workers: int, depth: str, execution: str) -> dict:
+    """
+    One measurement, run in a fresh interpreter so peak RSS is not shared
+    between configurations. Latencies are the per-file times the workers
+    report during the scan, so they include queueing and contention.
+    """
+    files = [os.path.join(corpus, name) for name in os.listdir(corpus) if name.lower().endswith(".pdf")]
+    total_bytes = sum(os.path.getsize(f) for f in files)
+    validation_depth = parse_validation_depth(depth)
+
+    metrics = LatencyMetrics()
+    sampler = WorkerMemorySampler()
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        corrupt = scan_directory(corpus, days_back=1, validation_depth=validation_depth, processes=workers,
+                                 execution=execution, metrics=metrics)
+        wall = time.perf_counter() - start
+    finally:
+        workers_rss = sampler.stop()
+    latencies = metrics.latencies
+
+    return {
+        "workers": workers,
+        "depth": depth,
+        "execution": execution,
+        "files": len(files),
+        "corrupt": len(corrupt),
+        "wall_s": round(wall, 4),
+        "files_per_s": round(len(files) / wall, 1) if wall else None,
+        "bytes_per_s": round(total_bytes / wall) if wall else None,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "parent_peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": workers_rss,
+    }
+
+def compare(results: list, baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = {(r["workers"], r["depth"], r.get("execution", "procesos")): r for r in json.load(f)["results"]}
+    print(f"\nComparison with {baseline_path}:")
+    for r in results:
+        old = baseline.get((r["workers"], r["depth"], r["execution"]))
+        if not old or not old["files_per_s"]:
+            continue
+        change = (r["files_per_s"] - old["files_per_s"]) / old["files_per_s"] * 100
+        print(f"  workers={r['workers']:<3} depth={r['depth']:<10} {r['execution']:<9} files/s {old['files_per_s']:>9} -> "
+              f"{r['files_per_s']:>9} ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks scan_directory on a synthetic albaran corpus.")
+    parser.add_argument("--files", type=int, default=2000, help="Corpus size when generating one.")
+    parser.add_argument("--corpus", help="Existing corpus directory (default: generate a temporary one).")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--workers", default=f"1,{os.cpu_count()}", help="Comma-separated worker counts.")
+    parser.add_argument("--depths", default="estructura,pypdf", help="Comma-separated validation levels.")
+    parser.add_argument("--execution", default="procesos", help="Comma-separated execution modes (procesos,hibrido).")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout).")
+    parser.add_argument("--compare", help="Previous JSON report to compare files/s against.")
+    parser.add_argument("--run-one", nargs=4, metavar=("CORPUS", "WORKERS", "DEPTH", "EXECUTION"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        corpus, workers, depth, execution = args.run_one
+        print(json.dumps(run_one(corpus, int(workers), depth, execution)))
+        return
+
+    temp_dir = None
+    corpus = args.corpus
+    if not corpus:
+        temp_dir = tempfile.mkdtemp(prefix="albaran_corpus_")
+        corpus = temp_dir
+        print(f"Generating {args.files} files in {corpus}...", file=sys.stderr)
+        generate_corpus(corpus, args.files, args.seed)
+
+    try:
+        results = []
+        for execution in args.execution.split(","):
+            for depth in args.depths.split(","):
+                for workers in args.workers.split(","):
+                    output = subprocess.run([sys.executable, __file__, "--run-one", corpus, workers.strip(),
+                                             depth.strip(), execution.strip()],
+                                            check=True, capture_output=True, text=True).stdout
+                    result = json.loads(output.strip().splitlines()[-1])
+                    print(f"workers={result['workers']:<3} depth={result['depth']:<10} {result['execution']:<9} "
+                          f"{result['files_per_s']:>9} files/s  p50={result['p50_ms']}ms p99={result['p99_ms']}ms "
+                          f"rss={result['parent_peak_rss_mb']}MB+{result['workers_peak_rss_mb']}MB workers", file=sys.stderr)
+                    results.append(result)
+
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus": {"path": args.corpus, "files": results[0]["files"] if results else 0, "seed": args.seed},
+            "results": results,
+        }
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        else:
+            print(json.dumps(report, indent=2))
+
+        if args.compare:
+            compare(results, args.compare)
+
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+
+# Add src to path
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(ROOT, 'src'))
+
+from pdf_checker import scan_directory, ValidationPool, VALIDATION_PYPDF
+from albaran_corpus import generate_corpus
+
+MAIN_PATH = os.path.join(ROOT, 'main.py')
+
+def import_time(statement: str, repeat: int) -> float:
+    """
+    Median wall time of a fresh interpreter running `statement`, minus an
+    empty interpreter: the import cost every spawned worker pays.
+    """
+    def run(code):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], check=True, cwd=ROOT,
+                           env={**os.environ, "PYTHONPATH": os.path.join(ROOT, 'src')})
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
+    return round(max(0.0, run(statement) - run("pass")), 4)
+
+def pool_ready(workers: int) -> float:
+    """
+    Time from creating the pool until every worker has answered one task.
+    """
+    start = time.perf_counter()
+    pool = ValidationPool(workers)
+    try:
+        for _ in range(workers):
+            pool.submit([(MAIN_PATH, "main.py", VALIDATION_PYPDF)])
+        while pool.pending():
+            pool.get()
+        return time.perf_counter() - start
+    finally:
+        pool.close()
+
+def repeated_scans(corpus: str, workers: int, scans: int, reuse: bool) -> float:
+    """
+    Mean time per scan of `corpus`, with a new pool per scan or one shared pool.
+    """
+    pool = ValidationPool(workers) if reuse else None
+    start = time.perf_counter()
+    try:
+        for _ in range(scans):
+            scan_directory(corpus, days_back=1, processes=workers, pool=pool)
+    finally:
+        if pool is not None:
+            pool.close()
+    return (time.perf_counter() - start) / scans
+
+def run_pools(corpus: str, workers: int, scans: int) -> dict:
+    # Spawned children re-import the __main__ module: point it at main.py, as
+    # in a real run, instead of this script
+    sys.modules["__main__"].__file__ = MAIN_PATH
+    sys.path.insert(0, ROOT)
+    return {
+        "pool_ready_s": round(pool_ready(workers), 4),
+        "scan_new_pool_s": round(repeated_scans(corpus, workers, scans, reuse=False), 4),
+        "scan_reused_pool_s": round(repeated_scans(corpus, workers, scans, reuse=True), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures validation worker startup and pool reuse.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--start-method", default="spawn", help="spawn (Windows default), fork or forkserver.")
+    parser.add_argument("--files", type=int, default=100, help="Corpus size for the repeated scans.")
+    parser.add_argument("--scans", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=5, help="Interpreter launches per import measurement.")
+    parser.add_argument("--output", help="Write the JSON report here (default: stdout).")
+    parser.add_argument("--run-pools", nargs=4, metavar=("CORPUS", "WORKERS", "SCANS", "START_METHOD"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_pools:
+        corpus, workers, scans, start_method = args.run_pools
+        multiprocessing.set_start_method(start_method)
+        print(json.dumps(run_pools(corpus, int(workers), int(scans))))
+        return
+
+    imports = {
+        "main": import_time("import main", args.repeat),
+        "pdf_worker": import_time("import pdf_worker", args.repeat),
+        "pypdf": import_time("import pypdf", args.repeat),
+    }
+    print(f"Import time: {imports}", file=sys.stderr)
+
+    corpus = tempfile.mkdtemp(prefix="albaran_corpus_")
+    try:
+        generate_corpus(corpus, args.files)
+        output = subprocess.run([sys.executable, __file__, "--run-pools", corpus, str(args.workers), str(args.scans),
+                                 args.start_method], check=True, capture_output=True, text=True).stdout
+        pools = json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(corpus)
+    print(f"Pools ({args.start_method}, {args.workers} workers): {pools}", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "start_method": args.start_method,
+        "workers": args.workers,
+        "files": args.files,
+        "import_s": imports,
+        **pools,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
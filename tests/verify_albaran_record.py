@@ -0,0 +1,78 @@
+import os
+import sys
+import shutil
+import tempfile
+import tracemalloc
+from decimal import Decimal
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from albaran_record import AlbaranRecord, CenterRouter, FIELDS, record_factory
+from detail_cache import AlbaranDetailCache
+
+# As pyodbc returns them: uppercase names, DECIMAL columns, padded CHAR columns
+COLUMNS = [field.upper() for field in FIELDS]
+
+def db_row(i):
+    return (Decimal(f"{1000000 + i}"), "S", Decimal("60.00"), Decimal(i), Decimal("20260101"), Decimal("400"),
+            Decimal("123"), Decimal("1"), "A ", f"A{i:<8}", "PROVEEDOR, S.A.                         ")
+
+def allocated(build):
+    tracemalloc.start()
+    rows = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return rows, size
+
+def main():
+    # Normalised once at fetch time
+    record = record_factory(COLUMNS)(db_row(7))
+    assert (record.cod_barras, record.alm, record.num_int, record.fecha) == ("1000007", 60, 7, 20260101), record
+    assert (record.serie, record.albaran, record.proveedor_desc) == ("A", "A7", "PROVEEDOR, S.A."), record.as_dict()
+
+    # Columns in another order, or missing, are matched by name
+    reordered = record_factory(list(reversed(COLUMNS)) + ["EXTRA"])(tuple(reversed(db_row(7))) + ("x",))
+    assert reordered == record, reordered.as_dict()
+    partial = record_factory(["cod_barras", "alm"])((Decimal("1000007.0"), " 060 "))
+    assert (partial.cod_barras, partial.alm, partial.proveedor_desc) == ("1000007", 60, None), partial.as_dict()
+
+    # Routing index: '060', '60' and 60.00 are one center; names fall back to the code
+    router = CenterRouter({"060": "almacen60@example.com", "160": "almacen160@example.com", "mad": "mad@example.com"},
+                          {"60": "ALMACEN 60"})
+    assert router.route(60) == ("almacen60@example.com", "ALMACEN 60")
+    assert router.route("060") == router.route("60") == router.route(60)
+    assert router.route(160) == ("almacen160@example.com", "CENTRO 160")
+    assert router.route("MAD") == ("mad@example.com", "CENTRO MAD")
+    assert router.route(999) is None and router.route(None) is None
+    records = [AlbaranRecord("1", alm=160), AlbaranRecord("2", alm=60), AlbaranRecord("3", alm=160)]
+    assert {code: [r.cod_barras for r in rs] for code, rs in router.group(records).items()} == \
+        {160: ["1", "3"], 60: ["2"]}
+    debug = CenterRouter({"060": "almacen60@example.com"}, debug_email="debug@example.com")
+    assert debug.route(60) == ("debug@example.com", "CENTRO 60")
+
+    # Records survive the detail cache
+    test_dir = tempfile.mkdtemp(prefix="albaran_record_")
+    try:
+        cache = AlbaranDetailCache(os.path.join(test_dir, "details.db"))
+        cache.store(["1000007", "1000008"], {"1000007": [record]})
+        rows, to_query = cache.get_many(["1000007", "1000008", "1000010"])
+        assert to_query == ["1000010"], to_query
+        assert rows == [record], [row.as_dict() for row in rows]
+        cache.close()
+    finally:
+        shutil.rmtree(test_dir)
+
+    # Large result sets: a fraction of the memory of one dict per row
+    count = 50000
+    dicts, dict_bytes = allocated(lambda: [dict(zip(COLUMNS, db_row(i))) for i in range(count)])
+    make_record = record_factory(COLUMNS)
+    del dicts
+    records, record_bytes = allocated(lambda: [make_record(db_row(i)) for i in range(count)])
+    print(f"{count} rows: {dict_bytes / 2**20:.1f} MB as dicts, {record_bytes / 2**20:.1f} MB as records")
+    assert record_bytes < dict_bytes * 0.7, (record_bytes, dict_bytes)
+
+    print("SUCCESS: DB rows are normalised into compact records and routed to their centers.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import os
+import sys
+import email
+import email.header
+import shutil
+import sqlite3
+import tempfile
+import threading
+import subprocess
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from albaran_corpus import generate_corpus, CORRUPT_KINDS
+from as400_data import generate_as400_db
+from db_backends import SQLiteBackend
+from db_client import DBClient
+from detail_cache import AlbaranDetailCache
+from revisions import clean_albaran_number
+from verify_email_batch import FakeSMTPServer
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="db_backend_")
+    db_path = os.path.join(test_dir, "as400.db")
+    try:
+        pdf_dir = os.path.join(test_dir, "pdfs")
+        manifest = generate_corpus(pdf_dir, 80, seed=21)
+        corrupt = sorted(clean_albaran_number(name) for name, kind in manifest.items() if kind in CORRUPT_KINDS)
+        # Half of the corrupt albaranes are in the DB
+        in_db = corrupt[::2]
+        barcodes = generate_as400_db(db_path, 3000, seed=21, centers=(60, 160), barcodes=in_db)
+
+        # Lookups run the production query through the attached "$$LIBFAL" and LIB001 schemas
+        sample = barcodes[:1000] + ["1"]
+        client = DBClient(backend=SQLiteBackend(db_path), batch_size=250)
+        rows = client.get_albaran_details(sample)
+        client.close()
+        assert sorted(r.cod_barras for r in rows) == sorted(barcodes[:1000]), len(rows)
+        found = [r for r in rows if r.alm is not None]
+        assert found and all(r.alm in (60, 160) for r in found)
+        assert all(not r.albaran.endswith(" ") and not r.proveedor_desc.endswith(" ") for r in found)
+        assert any(r.alm is None for r in rows), "orphan albaranes (no ENTMEC row) should come back with NULLs"
+
+        # Chunking, parallel chunks and the detail cache return the same rows
+        key = lambda r: r.cod_barras
+        cache = AlbaranDetailCache(os.path.join(test_dir, "details.db"))
+        for options in ({"batch_size": 7, "parallel_queries": 4, "pool_size": 4}, {"cache": cache}, {"cache": cache}):
+            client = DBClient(backend=SQLiteBackend(db_path), **options)
+            assert sorted(client.get_albaran_details(sample), key=key) == sorted(rows, key=key), options
+            client.close()
+        assert cache.hits == len(sample), cache.hits
+        cache.close()
+
+        # The database is opened read-only
+        conn = SQLiteBackend(db_path).connect()
+        try:
+            conn.execute('DELETE FROM "$$LIBFAL".DRVAA00K')
+            raise AssertionError("stand-in database was writable")
+        except sqlite3.OperationalError:
+            pass
+        conn.close()
+
+        # A missing database fails on first use, like an unreachable AS400
+        client = DBClient(backend=SQLiteBackend(os.path.join(test_dir, "missing.db")))
+        try:
+            client.get_albaran_details(["1"])
+            raise AssertionError("missing database was not reported")
+        except FileNotFoundError:
+            pass
+
+        # End to end: scan, lookup and per-center mails without ODBC
+        server = FakeSMTPServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        with open(os.path.join(test_dir, "config.ini"), "w") as f:
+            f.write(f"""[GENERAL]
+carpeta_pdf = {pdf_dir}
+dias_atras = 1
+cache_veredictos =
+historial =
+[DATABASE]
+motor = sqlite
+ruta_sqlite = {db_path}
+cache_detalles =
+[EMAIL]
+servidor_smtp = 127.0.0.1
+puerto_smtp = {server.server_address[1]}
+remitente = autocheck@example.com
+usar_tls = no
+destinatarios_central = central@example.com
+[CENTROS]
+060 = almacen60@example.com
+160 = almacen160@example.com
+[NOMBRES_CENTROS]
+60 = ALMACEN 60
+[METRICAS]
+json =
+""")
+        subprocess.run([sys.executable, os.path.join(ROOT, "main.py")], cwd=test_dir, check=True,
+                       capture_output=True, timeout=300)
+        messages = {}
+        for recipients, data in server.messages:
+            message = email.message_from_bytes(data)
+            text = next(part for part in message.walk() if part.get_content_type() == "text/plain")
+            messages[recipients[0]] = (message["Subject"], text.get_payload(decode=True).decode("utf-8"))
+        assert str(email.header.make_header(email.header.decode_header(messages["central@example.com"][0]))) == \
+            f"Informe de Albaranes PDF Corruptos - {len(corrupt)} detectados", messages.keys()
+
+        # Each center gets its own albaranes; those without an ENTMEC row have no center
+        client = DBClient(backend=SQLiteBackend(db_path))
+        expected = {}
+        for record in client.get_albaran_details(in_db):
+            if record.alm is not None:
+                expected.setdefault(f"almacen{record.alm}@example.com", set()).add(record.cod_barras)
+        client.close()
+        assert expected and set(messages) - {"central@example.com"} == set(expected), (messages.keys(), expected)
+        for recipient, center_barcodes in expected.items():
+            body = messages[recipient][1]
+            assert all(b in body for b in center_barcodes), (recipient, center_barcodes)
+            assert not any(b in body for b in set(corrupt) - center_barcodes), recipient
+        server.shutdown()
+
+        print("SUCCESS: The SQLite stand-in serves the lookup path and a full run works without ODBC.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from as400_data import generate_as400_db
+from db_backends import SQLiteBackend
+from db_client import DBClient
+from run_metrics import RunMetrics
+
+class CountingBackend(SQLiteBackend):
+    """
+    SQLite stand-in that records connections, statements (with their number
+    of parameters), fetchmany sizes and how many statements run at once.
+    """
+
+    def __init__(self, db_path, execute_delay=0.0):
+        super().__init__(db_path)
+        self.execute_delay = execute_delay
+        self.fail_next = False
+        self.connects = 0
+        self.closed = 0
+        self.statements = []
+        self.fetch_sizes = set()
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            self.connects += 1
+        return CountingConnection(self, super().connect())
+
+class CountingConnection:
+    def __init__(self, backend, conn):
+        self.backend = backend
+        self.conn = conn
+
+    def cursor(self):
+        return CountingCursor(self.backend, self.conn.cursor())
+
+    def close(self):
+        self.backend.closed += 1
+        self.conn.close()
+
+class CountingCursor:
+    def __init__(self, backend, cursor):
+        self.backend = backend
+        self.cursor = cursor
+        self.description = None
+
+    def execute(self, sql, params):
+        backend = self.backend
+        with backend.lock:
+            backend.statements.append(len(params))
+            backend.running += 1
+            backend.max_running = max(backend.max_running, backend.running)
+            fail, backend.fail_next = backend.fail_next, False
+        try:
+            time.sleep(backend.execute_delay)
+            if fail:
+                raise RuntimeError("connection reset by the AS400")
+            self.cursor.execute(sql, params)
+            self.description = self.cursor.description
+        finally:
+            with backend.lock:
+                backend.running -= 1
+
+    def fetchmany(self, size):
+        self.backend.fetch_sizes.add(size)
+        return self.cursor.fetchmany(size)
+
+    def close(self):
+        self.cursor.close()
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="db_client_")
+    db_path = os.path.join(test_dir, "as400.db")
+    try:
+        barcodes = generate_as400_db(db_path, 2300, seed=5)
+        key = lambda r: r.cod_barras
+        reference = sorted(DBClient(backend=SQLiteBackend(db_path)).get_albaran_details(barcodes), key=key)
+        assert len(reference) == 2300
+
+        # IN lists are split into batch_size chunks and rows fetched fetch_size at a time
+        backend = CountingBackend(db_path)
+        metrics = RunMetrics()
+        client = DBClient(backend=backend, batch_size=500, fetch_size=64, metrics=metrics)
+        # Revisions of one albaran share a stem: looked up once
+        rows = client.get_albaran_details(barcodes + barcodes[:100])
+        assert sorted(rows, key=key) == reference
+        assert backend.statements == [500, 500, 500, 500, 300], backend.statements
+        assert backend.fetch_sizes == {64}, backend.fetch_sizes
+        assert metrics.counters["db_chunks"] == 5 and metrics.counters["db_rows"] == 2300, metrics.counters
+
+        # The pooled connection is reused across lookups, and replaced after an error
+        client.get_albaran_details(barcodes[:10])
+        assert backend.connects == 1, backend.connects
+        backend.fail_next = True
+        try:
+            client.get_albaran_details(barcodes[:10])
+            raise AssertionError("the query error was swallowed")
+        except RuntimeError:
+            pass
+        assert backend.closed == 1
+        assert len(client.get_albaran_details(barcodes[:10])) == 10 and backend.connects == 2
+        # A caller that stops reading mid-result doesn't hand back a half-read cursor
+        rows = client.iter_albaran_details(barcodes[:100])
+        next(rows)
+        rows.close()
+        assert backend.closed == 2
+        client.get_albaran_details(barcodes[:10])
+        client.close()
+        assert (backend.connects, backend.closed) == (3, 3), (backend.connects, backend.closed)
+
+        # Parallel chunks: up to parallel_queries statements at once, each on its own pooled connection
+        backend = CountingBackend(db_path, execute_delay=0.05)
+        client = DBClient(backend=backend, batch_size=100, parallel_queries=4)
+        start = time.perf_counter()
+        rows = client.get_albaran_details(barcodes)
+        elapsed = time.perf_counter() - start
+        assert sorted(rows, key=key) == reference
+        assert len(backend.statements) == 23 and sum(backend.statements) == 2300, backend.statements
+        assert backend.max_running == 4 and backend.connects == 4, (backend.max_running, backend.connects)
+        assert elapsed < 23 * 0.05 * 0.6, elapsed
+        client.get_albaran_details(barcodes)
+        assert backend.connects == 4, backend.connects
+        client.close()
+
+        print("SUCCESS: Lookups are chunked, fetched in batches, run in parallel and reuse pooled connections.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
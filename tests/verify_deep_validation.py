@@ -0,0 +1,108 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdf_checker import scan_directory, select_pages, ValidationPool, VALIDATION_DEEP, VALIDATION_PYPDF
+from verdict_cache import VerdictCache
+from run_metrics import RunMetrics
+from worker_pool import TASK_ERROR
+from albaran_corpus import build_pdf
+
+def damage_page(data: bytes, page: int) -> bytes:
+    """
+    Overwrites the middle of the compressed content stream of `page`
+    (1-based) in place, so offsets stay valid and the file still opens.
+    """
+    start = 0
+    for _ in range(page):
+        start = data.index(b"/Filter/FlateDecode>>stream\n", start) + len(b"/Filter/FlateDecode>>stream\n")
+    end = data.index(b"\nendstream", start)
+    middle = (start + end) // 2
+    return data[:middle - 4] + b"\xff" * 8 + data[middle + 4:]
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="deep_validation_")
+    try:
+        document = build_pdf(200, compress=True)
+        files = {
+            "1000001.pdf": document,
+            "1000002-Rev(1.00).pdf": damage_page(document, 150),
+            "1000003.pdf": damage_page(build_pdf(5, compress=True), 3),
+        }
+        for name, data in files.items():
+            with open(os.path.join(test_dir, name), "wb") as f:
+                f.write(data)
+
+        # pypdf level only opens the first page: the damage goes unnoticed
+        found = scan_directory(test_dir, days_back=1, validation_depth=VALIDATION_PYPDF, processes=2)
+        assert found == [], found
+
+        # Deep level, 200 pages split in tasks of 20 across 4 workers
+        found = scan_directory(test_dir, days_back=1, validation_depth=VALIDATION_DEEP, processes=4,
+                               pages_per_task=20)
+        assert sorted(found) == ["1000002", "1000003"], found
+
+        # The merged result reports the first bad page
+        pool = ValidationPool(4, pages_per_task=20)
+        try:
+            pool.submit([(os.path.join(test_dir, name), name, VALIDATION_DEEP) for name in files])
+            results = {}
+            while pool.pending():
+                for file_path, is_valid, _, _, _, bad_page in pool.get():
+                    results[os.path.basename(file_path)] = (is_valid, bad_page)
+        finally:
+            pool.close()
+        assert results == {"1000001.pdf": (True, None), "1000002-Rev(1.00).pdf": (False, 150),
+                           "1000003.pdf": (False, 3)}, results
+
+        # A page task that fails (file gone mid-check) leaves the file unchecked instead of corrupt
+        vanishing = os.path.join(test_dir, "1000004.pdf")
+        with open(vanishing, "wb") as f:
+            f.write(document)
+        pool = ValidationPool(1, pages_per_task=1)
+        try:
+            pool.submit([(vanishing, "1000004.pdf", VALIDATION_DEEP)])
+            while not pool._splits:
+                assert pool.get(timeout=0.01) == []
+            os.remove(vanishing)
+            results = []
+            while not results:
+                results = pool.get()
+        finally:
+            pool.close()
+        (_, is_valid, _, _, reason, bad_page), = results
+        assert (is_valid, reason, bad_page) == (None, TASK_ERROR, None), results[0]
+
+        # A scan lists worker errors with the limit hits, doesn't cache them and doesn't report them
+        cache = VerdictCache(os.path.join(test_dir, "verdicts.db"))
+        metrics = RunMetrics()
+        pool = ValidationPool(2)
+        try:
+            # A depth the workers can't compare against makes every task raise
+            found = scan_directory(test_dir, days_back=1, validation_depth="bogus", pool=pool, cache=cache,
+                                   metrics=metrics)
+        finally:
+            pool.close()
+        cache.flush()
+        assert found == [], found
+        assert metrics.counters["files_error"] == 3 and metrics.counters["files_validated"] == 0, metrics.counters
+        assert cache._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] == 0
+        cache.close()
+
+        # Sampling: first, last and N reproducible random pages
+        sample = select_pages(200, 5, "1000002.pdf")
+        assert len(sample) == 7 and sample[0] == 0 and sample[-1] == 199, sample
+        assert sample == select_pages(200, 5, "1000002.pdf")
+        assert select_pages(6, 5, "x") == list(range(6))
+
+        print("SUCCESS: Deep mode finds damaged later pages, splits large documents and reports the first bad page.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
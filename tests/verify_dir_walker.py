@@ -0,0 +1,62 @@
+import os
+import sys
+import shutil
+import time
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from dir_walker import walk_pdf_files
+from verify_multiprocessing import create_dummy_pdf
+
+def names(roots, cutoff_ts, **kwargs):
+    return sorted(entry.name for entry in walk_pdf_files(roots, cutoff_ts, **kwargs))
+
+def main():
+    test_dir = os.path.join(os.path.dirname(__file__), "temp_test_walker")
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+
+    # share_a/root.pdf, share_a/160/2024-01/a.pdf, share_a/160/tmp/skip.pdf, share_b/b.pdf
+    share_a = os.path.join(test_dir, "share_a")
+    share_b = os.path.join(test_dir, "share_b")
+    month = os.path.join(share_a, "160", "2024-01")
+    tmp = os.path.join(share_a, "160", "tmp")
+    for d in (month, tmp, share_b):
+        os.makedirs(d)
+
+    try:
+        create_dummy_pdf(os.path.join(share_a, "root.pdf"))
+        create_dummy_pdf(os.path.join(month, "a.pdf"))
+        create_dummy_pdf(os.path.join(tmp, "skip.pdf"))
+        create_dummy_pdf(os.path.join(share_b, "b.pdf"))
+        cutoff = time.time() - 3600
+
+        assert names([share_a], cutoff) == ["root.pdf"]
+        assert names([share_a, share_b], cutoff) == ["b.pdf", "root.pdf"]
+        assert names([share_a], cutoff, recursive=True) == ["a.pdf", "root.pdf", "skip.pdf"]
+        assert names([share_a], cutoff, recursive=True, max_depth=1) == ["root.pdf"]
+        assert names([share_a], cutoff, recursive=True, exclude=["tmp"]) == ["a.pdf", "root.pdf"]
+        assert names([share_a], cutoff, recursive=True, exclude=["*/2024-*"]) == ["root.pdf", "skip.pdf"]
+
+        # An old month folder is not searched for files when pruning
+        old = cutoff - 3600
+        os.utime(month, (old, old))
+        assert names([share_a], cutoff, recursive=True, prune_by_mtime=True) == ["root.pdf", "skip.pdf"]
+        assert names([share_a], cutoff, recursive=True) == ["a.pdf", "root.pdf", "skip.pdf"]
+
+        # An unreachable root is skipped and reported, so the caller knows the listing is partial
+        errors = []
+        assert names([share_a, os.path.join(test_dir, "offline")], cutoff, errors=errors) == ["root.pdf"]
+        assert len(errors) == 1 and "offline" in errors[0], errors
+        errors = []
+        assert names([share_a, share_b], cutoff, recursive=True, errors=errors) and errors == [], errors
+
+        print("SUCCESS: Multi-root, recursion, depth, exclusion and pruning behave as expected.")
+
+    finally:
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
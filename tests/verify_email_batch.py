@@ -0,0 +1,164 @@
+import os
+import sys
+import time
+import socket
+import threading
+import socketserver
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from albaran_record import AlbaranRecord
+from email_sender import EmailSender
+
+class FakeSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal local SMTP stand-in. Records every delivered message and the
+    number of connections, and can inject failures:
+    - `fail_data`: number of DATA commands to answer with a transient 451
+    - `drop_after`: close the connection after this many messages
+    - `reject`: recipient addresses answered with a permanent 550
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeSMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.fail_data = 0
+        self.drop_after = None
+        self.reject = set()
+        self.lock = threading.Lock()
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        delivered = 0
+        recipients = []
+        self.reply("220 localhost fake smtp")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 localhost")
+            elif verb == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip("<> ")
+                if recipient in server.reject:
+                    self.reply("550 No such user")
+                    continue
+                recipients.append(recipient)
+                self.reply("250 OK")
+            elif verb == "DATA":
+                with server.lock:
+                    fail = server.fail_data > 0
+                    if fail:
+                        server.fail_data -= 1
+                if fail:
+                    self.reply("451 Try again later")
+                    continue
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if data_line in (b".\r\n", b".\n", b""):
+                        break
+                    data.append(data_line)
+                with server.lock:
+                    server.messages.append((recipients, b"".join(data)))
+                delivered += 1
+                self.reply("250 Queued")
+                if server.drop_after and delivered >= server.drop_after:
+                    return
+            elif verb == "RSET" or verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+def main():
+    server = FakeSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    try:
+        sender = EmailSender(host, port, False, "autocheck@example.com", retry_backoff=0.01)
+        records = [AlbaranRecord(str(1000 + i), alm=160) for i in range(3)]
+        reports = [(f"centro{i}@example.com", records, f"CENTRO {i}") for i in range(20)]
+
+        # One session for the whole batch
+        results = sender.send_center_reports(reports)
+        assert all(r["ok"] for r in results), results
+        assert len(server.messages) == 20, len(server.messages)
+        assert server.connections == 1, server.connections
+        assert all(r["latency"] >= 0 for r in results)
+
+        # Transient 4xx is retried; a dropped connection is reopened
+        server.messages.clear()
+        server.connections = 0
+        server.fail_data = 1
+        server.drop_after = 5
+        results = sender.send_center_reports(reports)
+        assert all(r["ok"] for r in results), results
+        assert len(server.messages) == 20, len(server.messages)
+        assert results[0]["attempts"] == 2, results[0]
+        assert server.connections == 4, server.connections
+
+        # Concurrent sender pool: one session per sender thread
+        server.messages.clear()
+        server.connections = 0
+        server.drop_after = None
+        sender.concurrency = 4
+        results = sender.send_center_reports(reports)
+        assert all(r["ok"] for r in results), results
+        assert len(server.messages) == 20, len(server.messages)
+        assert server.connections <= 4, server.connections
+
+        # Relay down: the first message goes through the retries, the rest of the batch fails at once
+        probe = socket.socket()
+        probe.bind(("127.0.0.1", 0))
+        closed_port = probe.getsockname()[1]
+        probe.close()
+        for concurrency in (1, 4):
+            sender = EmailSender(host, closed_port, False, "autocheck@example.com", retry_backoff=0.1,
+                                 concurrency=concurrency, circuit_reset=1)
+            start = time.perf_counter()
+            results = sender.send_center_reports(reports * 5)
+            elapsed = time.perf_counter() - start
+            assert not any(r["ok"] for r in results), results
+            assert elapsed < 3, elapsed
+            tried = [r for r in results if r["attempts"]]
+            assert 1 <= len(tried) <= concurrency and any(r["attempts"] == 4 for r in tried), tried
+            # Senders still retrying when another one opens the breaker stop there
+            cut_short = [r for r in results if r["attempts"] < 4]
+            assert all("unreachable" in r["error"] for r in cut_short), results
+        # ... and so does the next batch, until the breaker resets
+        server.messages.clear()
+        sender.smtp_port = port
+        assert not any(r["ok"] for r in sender.send_center_reports(reports))
+        time.sleep(1.1)
+        assert all(r["ok"] for r in sender.send_center_reports(reports))
+        assert len(server.messages) == 20, len(server.messages)
+
+        print("SUCCESS: Batch delivery reuses sessions, retries transient errors, reconnects "
+              "and stops when the relay is down.")
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
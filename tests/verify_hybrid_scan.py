@@ -0,0 +1,126 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from albaran_corpus import generate_corpus, build_pdf, CORRUPT_KINDS
+import pdf_checker
+from pdf_checker import scan_directory, ValidationPool, VALIDATION_LEVELS, _HybridScanner
+from revisions import clean_albaran_number
+
+class TrackingScanner(_HybridScanner):
+    """
+    _HybridScanner that records the most bytes held (reserved by reads under
+    way or buffered for the parsers) and files held (being read or parsed)
+    at once.
+    """
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_buffered = 0
+        self.max_held = 0
+        TrackingScanner.instances.append(self)
+
+    def _start_reads(self):
+        super()._start_reads()
+        self.max_buffered = max(self.max_buffered, self.buffered_bytes)
+        self.max_held = max(self.max_held, self.reading + self.parsing)
+
+    def _on_read(self, *args):
+        results = super()._on_read(*args)
+        self.max_buffered = max(self.max_buffered, self.buffered_bytes)
+        return results
+
+class BusyPool(ValidationPool):
+    """
+    ValidationPool that holds its results back until `held_until`, as
+    parsers busy with a backlog would, so the readers get ahead.
+    """
+    held_until = 0
+
+    def get(self, timeout=None):
+        if time.monotonic() < self.held_until:
+            time.sleep(0.01)
+            return []
+        return super().get(timeout=timeout)
+
+def tracked_scan(path, pool, **options):
+    TrackingScanner.instances.clear()
+    pool.held_until = time.monotonic() + 0.5
+    pdf_checker._HybridScanner = TrackingScanner
+    try:
+        found = scan_directory(path, days_back=1, execution="hibrido", pool=pool, **options)
+    finally:
+        pdf_checker._HybridScanner = _HybridScanner
+    scanner, = TrackingScanner.instances
+    return sorted(found), scanner
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="hybrid_scan_")
+    try:
+        corpus_dir = os.path.join(test_dir, "corpus")
+        manifest = generate_corpus(corpus_dir, 150, seed=29)
+        expected = sorted({clean_albaran_number(name) for name, kind in manifest.items() if kind in CORRUPT_KINDS})
+
+        # Same verdicts as the process pool at every depth
+        pool = ValidationPool(2)
+        try:
+            for level, depth in VALIDATION_LEVELS.items():
+                by_pool = sorted(scan_directory(corpus_dir, days_back=1, validation_depth=depth, pool=pool))
+                by_hybrid = sorted(scan_directory(corpus_dir, days_back=1, validation_depth=depth, pool=pool,
+                                                  execution="hibrido", read_threads=2, read_ahead=8))
+                assert by_hybrid == by_pool, (level, set(by_hybrid) ^ set(by_pool))
+                if depth != VALIDATION_LEVELS["estructura"]:
+                    assert by_pool == expected, (level, set(by_pool) ^ set(expected))
+        finally:
+            pool.close()
+
+        # Scanned albaranes of ~200 KB each, read much faster than the parsers get through them
+        scans_dir = os.path.join(test_dir, "scans")
+        os.makedirs(scans_dir)
+        for i in range(40):
+            with open(os.path.join(scans_dir, f"{5000000 + i}.pdf"), "wb") as f:
+                f.write(build_pdf(1, image_size=200_000))
+        file_size = os.path.getsize(os.path.join(scans_dir, "5000000.pdf"))
+        budget = 1024 * 1024
+
+        pool = BusyPool(1)
+        try:
+            # Unbounded by memory, read-ahead caps the files held...
+            found, scanner = tracked_scan(scans_dir, pool, read_threads=4, max_read_threads=4, read_ahead=30)
+            assert found == []
+            assert scanner.max_held == 30, scanner.max_held
+            assert scanner.max_buffered > 2 * budget, scanner.max_buffered
+
+            found, scanner = tracked_scan(scans_dir, pool, read_threads=4, max_read_threads=4, read_ahead=3)
+            assert found == [] and scanner.max_held == 3, scanner.max_held
+
+            # ... and the memory budget caps the bytes, counting the reads under way
+            found, scanner = tracked_scan(scans_dir, pool, read_threads=4, max_read_threads=4, read_ahead=30,
+                                          read_memory_mb=1)
+            assert found == []
+            assert budget - file_size < scanner.max_buffered <= budget, (scanner.max_buffered, budget, file_size)
+            assert scanner.buffered_bytes == 0 and not scanner.reserved
+
+            # A file bigger than the whole budget is still read, on its own
+            big = os.path.join(scans_dir, "5000100.pdf")
+            with open(big, "wb") as f:
+                f.write(build_pdf(1, image_size=1_500_000))
+            found, scanner = tracked_scan(scans_dir, pool, read_threads=4, max_read_threads=4, read_ahead=30,
+                                          read_memory_mb=1)
+            assert found == [] and scanner.max_buffered <= max(budget, os.path.getsize(big)), scanner.max_buffered
+        finally:
+            pool.close()
+
+        print("SUCCESS: Hybrid scans match the process pool and stay within their read-ahead and memory budget.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
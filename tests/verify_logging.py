@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from log_setup import LogPipeline, LOG_JSON, parse_module_levels, worker_log_config
+from pdf_checker import scan_directory, ValidationPool
+from worker_pool import SupervisedPool, LIMIT_TIMEOUT
+from verify_multiprocessing import create_dummy_pdf
+
+def log_then_hang(item):
+    logging.warning(f"Working on {item}, about to hang")
+    time.sleep(30)
+    return item
+
+def timeout_result(args, reason, seconds):
+    return args, reason
+
+def read_json_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="logging_")
+    pdf_dir = os.path.join(test_dir, "pdfs")
+    os.makedirs(pdf_dir)
+    for i in range(4):
+        create_dummy_pdf(os.path.join(pdf_dir, f"100{i}.pdf"), is_valid=True)
+        create_dummy_pdf(os.path.join(pdf_dir, f"200{i}.pdf"), is_valid=False)
+    try:
+        # Worker records reach the single listener, as JSON lines with their process
+        log_path = os.path.join(test_dir, "run.log")
+        logs = LogPipeline(log_path, log_format=LOG_JSON).start()
+        pool = ValidationPool(2, log_config=worker_log_config())
+        try:
+            assert sorted(scan_directory(pdf_dir, days_back=1, pool=pool)) == [f"200{i}" for i in range(4)]
+            logging.info("Run summary", extra={"albaranes": 4})
+        finally:
+            pool.close()
+            logs.stop()
+        entries = read_json_lines(log_path)
+        corrupt = [e for e in entries if e["message"].startswith("Corrupt PDF found")]
+        assert len(corrupt) == 4, entries
+        assert all(e["module"] == "pdf_worker" and e["process"] != "MainProcess" for e in corrupt), corrupt
+        assert any(e["module"] == "pdf_checker" and e["process"] == "MainProcess" for e in entries)
+        assert any(e.get("albaranes") == 4 for e in entries), entries[-1]
+
+        # Per source file levels apply to worker records too
+        log_path = os.path.join(test_dir, "quiet.log")
+        logs = LogPipeline(log_path, module_levels=parse_module_levels("pdf_worker.py=ERROR, pdf_checker=DEBUG"),
+                           log_format=LOG_JSON).start()
+        pool = ValidationPool(2, log_config=worker_log_config())
+        try:
+            scan_directory(pdf_dir, days_back=1, pool=pool)
+        finally:
+            pool.close()
+            logs.stop()
+        modules = {e["module"] for e in read_json_lines(log_path)}
+        assert "pdf_worker" not in modules and "pdf_checker" in modules, modules
+
+        # The records of a worker killed on a limit are kept
+        log_path = os.path.join(test_dir, "killed.log")
+        logs = LogPipeline(log_path).start()
+        pool = SupervisedPool(1, log_then_hang, timeout_result, task_timeout=0.5, log_config=worker_log_config())
+        try:
+            pool.submit(["stuck.pdf"])
+            results = []
+            while not results:
+                results = pool.get()
+            assert results == [("stuck.pdf", LIMIT_TIMEOUT)], results
+        finally:
+            pool.terminate()
+            logs.stop()
+        with open(log_path, encoding="utf-8") as f:
+            text = f.read()
+        assert "Working on stuck.pdf, about to hang" in text and "Worker timeout" in text, text
+
+        # The log file is rotated
+        log_path = os.path.join(test_dir, "rotated.log")
+        logs = LogPipeline(log_path, max_bytes=2000, backups=2).start()
+        for i in range(200):
+            logging.info(f"Line {i} of a long run")
+        logs.stop()
+        assert os.path.exists(log_path + ".1") and os.path.exists(log_path + ".2")
+        assert not os.path.exists(log_path + ".3") and os.path.getsize(log_path) <= 2000
+        with open(log_path, encoding="utf-8") as f:
+            assert f.read().rstrip().endswith("Line 199 of a long run")
+
+        # Logging only queues the record: a slow handler doesn't slow the caller
+        log_path = os.path.join(test_dir, "slow.log")
+        logs = LogPipeline(log_path)
+        emit = logs.handlers[0].emit
+        logs.handlers[0].emit = lambda record: (time.sleep(0.01), emit(record))
+        logs.start()
+        start = time.perf_counter()
+        for i in range(100):
+            logging.info(f"Line {i}")
+        elapsed = time.perf_counter() - start
+        logs.stop()
+        assert elapsed < 0.5, elapsed
+        with open(log_path, encoding="utf-8") as f:
+            assert len(f.readlines()) == 100
+
+        print("SUCCESS: Worker records reach one listener, with JSON lines, per file levels and rotation.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
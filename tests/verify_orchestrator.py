@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import threading
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from orchestrator import run_pipeline
+from run_metrics import RunMetrics
+
+SCAN_DELAY = 0.05
+LOOKUP_DELAY = 0.2
+
+def slow_scan(stems):
+    for stem in stems:
+        time.sleep(SCAN_DELAY)
+        yield stem
+
+def main():
+    stems = [str(1000 + i) for i in range(12)]
+    batches = []
+    central_calls = []
+    scan_done = threading.Event()
+    lookups_during_scan = []
+
+    def scan():
+        yield from slow_scan(stems)
+        scan_done.set()
+
+    def lookup(batch):
+        batches.append(list(batch))
+        lookups_during_scan.append(not scan_done.is_set())
+        time.sleep(LOOKUP_DELAY)
+        return [{"COD_BARRAS": stem, "ALM": 160} for stem in batch if stem != "1005"]
+
+    def notify_central(found):
+        central_calls.append(list(found))
+        return set(found)
+
+    def notify_centers(rows):
+        return {row["COD_BARRAS"] for row in rows}
+
+    metrics = RunMetrics()
+    result = run_pipeline(scan(), lookup, notify_central, notify_centers, batch_size=4, lookup_concurrency=2,
+                          metrics=metrics)
+    sequential = len(stems) * SCAN_DELAY + len(batches) * LOOKUP_DELAY
+
+    assert sorted(result["corrupt"]) == stems, result["corrupt"]
+    assert sorted(b for batch in batches for b in batch) == stems and all(len(b) <= 4 for b in batches), batches
+    assert any(lookups_during_scan), "lookups should start while the scan is running"
+    assert len(result["rows"]) == 11 and central_calls == [stems], (result["rows"], central_calls)
+    assert result["notified"] == set(stems), result["notified"]
+    assert result["wall_seconds"] < sequential, (result["wall_seconds"], sequential)
+    assert metrics.stages["end_to_end"] == result["wall_seconds"]
+    print(f"Pipeline: {result['wall_seconds']:.2f}s end to end, {sequential:.2f}s one stage after another")
+
+    # A failed lookup still notifies Central; nothing found means nothing sent
+    def failing_lookup(batch):
+        raise RuntimeError("AS400 down")
+
+    central_calls.clear()
+    result = run_pipeline(iter(stems[:3]), failing_lookup, notify_central, notify_centers)
+    assert result["rows"] == [] and central_calls == [stems[:3]], (result, central_calls)
+
+    central_calls.clear()
+    result = run_pipeline(iter([]), lookup, notify_central, notify_centers)
+    assert result["corrupt"] == [] and central_calls == [], (result, central_calls)
+
+    # Scan errors propagate to the caller
+    def broken_scan():
+        yield "1000"
+        raise OSError("share unavailable")
+
+    try:
+        run_pipeline(broken_scan(), lookup, notify_central, notify_centers)
+        raise AssertionError("scan error was swallowed")
+    except OSError:
+        pass
+
+    print("SUCCESS: Scan, DB lookups and notifications overlap and failures are handled.")
+
+if __name__ == "__main__":
+    main()
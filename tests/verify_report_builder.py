@@ -0,0 +1,66 @@
+import os
+import sys
+import csv
+import time
+import email
+import threading
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from albaran_record import AlbaranRecord
+from email_sender import EmailSender
+from report_builder import CENTER_REPORT, CENTRAL_REPORT, CSV_DELIMITER, CSV_ENCODING
+from verify_email_batch import FakeSMTPServer
+
+def make_rows(count):
+    return [AlbaranRecord(str(1000000 + i), alm=160, num_int=i, fecha="20260101",
+                          proveedor_desc="Proveedor <Ñ> & Hijos, S.A. con un nombre muy largo para la columna",
+                          albaran=f"A{i}", flag=None) for i in range(count)]
+
+def main():
+    # Inline report: aligned text, escaped HTML, no attachment
+    text, html, attachment = CENTER_REPORT.render(make_rows(3), max_inline_rows=10)
+    lines = text.splitlines()
+    assert lines[0].startswith("Cod.Barras   ALM  Nº int"), lines[0]
+    assert len(lines[2]) == len(lines[3]) and "1000002" in lines[4], lines
+    assert "Proveedor <Ñ> & Hijos, S.A. con un nomb " in lines[2] and "None" not in text, lines[2]
+    assert html.count("<tr>") == 4 and "&lt;Ñ&gt; &amp;" in html, html
+    assert attachment is None
+    assert text.endswith("\n\nPor favor, vuelva a escanear estos documentos."), text
+
+    text, _, _ = CENTRAL_REPORT.render([AlbaranRecord("1"), AlbaranRecord("2")])
+    assert text == ("Se han detectado los siguientes archivos PDF corruptos o ilegibles:\n\n- 1\n- 2\n\n"
+                    "Por favor, revise estos archivos."), text
+
+    # Large report: summary body, every row in the CSV
+    rows = make_rows(5000)
+    start = time.perf_counter()
+    text, html, (name, data) = CENTER_REPORT.render(rows, max_inline_rows=500)
+    elapsed = time.perf_counter() - start
+    assert "5000 albaranes" in text and "<table>" not in html and name.endswith(".csv"), text
+    records = list(csv.reader(data.decode(CSV_ENCODING).splitlines(), delimiter=CSV_DELIMITER))
+    assert len(records) == 5001 and records[1][0] == "1000000" and records[1][-1] == "", records[:2]
+    print(f"Rendered 5000 rows to CSV in {elapsed * 1000:.1f} ms")
+
+    # Sent as multipart/mixed with the CSV attached
+    server = FakeSMTPServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        sender = EmailSender(*server.server_address, False, "autocheck@example.com", max_inline_rows=500)
+        results = sender.send_center_reports([("centro@example.com", rows, "CENTRO 160"),
+                                              ("otro@example.com", rows[:2], "CENTRO 60")])
+        assert all(r["ok"] for r in results), results
+        large, small = (email.message_from_bytes(data) for _, data in server.messages)
+        assert large.get_content_type() == "multipart/mixed", large.get_content_type()
+        attached = [p for p in large.walk() if p.get_filename()]
+        assert len(attached) == 1 and attached[0].get_payload(decode=True) == data
+        assert small.get_content_type() == "multipart/alternative", small.get_content_type()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    print("SUCCESS: Reports render in one pass and large ones go as a summary with a CSV attachment.")
+
+if __name__ == "__main__":
+    main()
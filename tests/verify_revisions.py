@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from pdf_checker import scan_directory
+from revisions import revision_number, REVISIONS_ALL, REVISIONS_LATEST, REVISIONS_ALL_CORRUPT, NEWEST_BY_DATE
+from run_metrics import RunMetrics
+from verify_multiprocessing import create_dummy_pdf
+
+def write(test_dir, name, is_valid, age_seconds=0, content=None):
+    path = os.path.join(test_dir, name)
+    if content is not None:
+        with open(path, "wb") as f:
+            f.write(content)
+    else:
+        create_dummy_pdf(path, is_valid)
+    mtime = time.time() - age_seconds
+    os.utime(path, (mtime, mtime))
+
+def scan(test_dir, policy, **kwargs):
+    metrics = RunMetrics()
+    found = scan_directory(test_dir, days_back=1, processes=2, revision_policy=policy, metrics=metrics, **kwargs)
+    assert len(found) == len(set(found)), found
+    return sorted(found), metrics.counters
+
+def main():
+    assert revision_number("1234.pdf") == ((), 0)
+    assert revision_number("1234-Rev(1.02).pdf") == ((1, 2), 0)
+    assert revision_number("1234-Rev(1.02)_003.pdf") == ((1, 2), 3)
+    assert revision_number("1234-Rev(1.10).pdf") > revision_number("1234-Rev(1.02).pdf")
+
+    test_dir = tempfile.mkdtemp(prefix="revisions_")
+    try:
+        # 1001: original fine (touched last), revision bad
+        write(test_dir, "1001.pdf", True, age_seconds=100)
+        write(test_dir, "1001-Rev(1.01).pdf", False, age_seconds=200)
+        # 1002: original bad (touched last), revision fine
+        write(test_dir, "1002.pdf", False, age_seconds=100)
+        write(test_dir, "1002-Rev(1.02).pdf", True, age_seconds=200)
+        # 1003: two different bad files
+        write(test_dir, "1003.pdf", False, content=b"not a pdf")
+        write(test_dir, "1003_002.pdf", False, content=b"not a pdf either")
+        # 1004: bad file and a byte-identical copy
+        write(test_dir, "1004.pdf", False)
+        write(test_dir, "1004_002.pdf", False)
+
+        found, counters = scan(test_dir, REVISIONS_ALL)
+        assert found == ["1001", "1002", "1003", "1004"], found
+        assert counters["files_duplicate"] == 1, counters
+        assert counters["files_validated"] == 7, counters
+
+        found, counters = scan(test_dir, REVISIONS_LATEST)
+        assert found == ["1001", "1003", "1004"], found
+        assert counters["files_superseded"] == 4, counters
+        assert counters["files_validated"] == 4, counters
+
+        found, _ = scan(test_dir, REVISIONS_LATEST, newest_by=NEWEST_BY_DATE)
+        assert found == ["1002", "1003", "1004"], found
+
+        found, _ = scan(test_dir, REVISIONS_ALL_CORRUPT)
+        assert found == ["1003", "1004"], found
+
+        found, counters = scan(test_dir, REVISIONS_ALL, skip_copies=False)
+        assert found == ["1001", "1002", "1003", "1004"], found
+        assert counters["files_validated"] == 8, counters
+
+        print("SUCCESS: Revisions are grouped, selected and deduplicated as configured.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import subprocess
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from run_history import RunHistory
+from as400_data import generate_as400_db
+from verify_email_batch import FakeSMTPServer
+from verify_multiprocessing import create_dummy_pdf
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+def run(db_path, corrupt, notify=True, missing=(), reminder_hours=24, complete=True):
+    """
+    One scheduled run in delta mode: returns (changes, albaranes due).
+    """
+    history = RunHistory(db_path, reminder_hours)
+    history.start_run()
+    history.record_corrupt(corrupt, complete)
+    due = history.due(corrupt)
+    history.record_missing(missing)
+    if notify:
+        history.record_notified(due)
+    changes = history.changes()
+    history.finish_run()
+    history.close()
+    return changes, due
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="run_history_")
+    db_path = os.path.join(test_dir, "history.db")
+    try:
+        changes, due = run(db_path, ["1001", "1002"], missing=["1002"])
+        assert changes == {"new": ["1001", "1002"], "resolved": [], "missing": ["1002"]}, changes
+        assert due == ["1001", "1002"], due
+
+        # Same window again plus one new albaran: only the new one is due
+        changes, due = run(db_path, ["1001", "1002", "1003"], missing=["1002"])
+        assert changes == {"new": ["1003"], "resolved": [], "missing": []}, changes
+        assert due == ["1003"], due
+
+        # Nothing sent (SMTP down): still due next run
+        _, due = run(db_path, ["1001", "1002", "1003", "1004"], notify=False)
+        assert due == ["1004"], due
+        _, due = run(db_path, ["1001", "1002", "1003", "1004"])
+        assert due == ["1004"], due
+
+        # Reminder interval elapsed: open albaranes are due again
+        time.sleep(0.05)
+        _, due = run(db_path, ["1001", "1002", "1003", "1004"], reminder_hours=0.01 / 3600)
+        assert due == ["1001", "1002", "1003", "1004"], due
+
+        # 1002 resolved, then back: it is new again
+        changes, due = run(db_path, ["1001", "1003", "1004"])
+        assert changes["resolved"] == ["1002"] and due == [], (changes, due)
+        changes, due = run(db_path, ["1001", "1002", "1003", "1004"])
+        assert changes["new"] == ["1002"] and due == ["1002"], (changes, due)
+
+        # A crashed run is not taken as the previous one
+        history = RunHistory(db_path)
+        history.start_run()
+        history.record_corrupt(["9999"])
+        history.close()
+        changes, due = run(db_path, ["1001", "1002", "1003", "1004"])
+        assert changes == {"new": [], "resolved": [], "missing": []}, changes
+        assert due == [], due
+
+        # A partial scan (share offline) resolves nothing and is not the previous run of the next one
+        changes, due = run(db_path, ["1001"], complete=False)
+        assert changes == {"new": [], "resolved": [], "missing": []} and due == [], (changes, due)
+        changes, due = run(db_path, ["1001", "1002", "1003", "1004"])
+        assert changes == {"new": [], "resolved": [], "missing": []} and due == [], (changes, due)
+
+        # Changes between any two past runs
+        history = RunHistory(db_path)
+        assert history.changes(run_id=2) == {"new": ["1003"], "resolved": [], "missing": []}
+        history.close()
+
+        # End to end: a run with the share unreachable doesn't make the next one renotify everything
+        pdf_dir = os.path.join(test_dir, "pdfs")
+        os.makedirs(pdf_dir)
+        corrupt = [f"50000{i}" for i in range(6)]
+        for barcode in corrupt:
+            create_dummy_pdf(os.path.join(pdf_dir, f"{barcode}.pdf"), is_valid=False)
+        create_dummy_pdf(os.path.join(pdf_dir, "600000.pdf"), is_valid=True)
+        as400_path = os.path.join(test_dir, "as400.db")
+        generate_as400_db(as400_path, 50, seed=17, centers=(60,), barcodes=corrupt)
+        server = FakeSMTPServer()
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def scheduled_run(pdf_path, history_name="main_history.db"):
+            with open(os.path.join(test_dir, "config.ini"), "w") as f:
+                f.write(f"""[GENERAL]
+carpeta_pdf = {pdf_path}
+dias_atras = 1
+cache_veredictos =
+historial = {os.path.join(test_dir, history_name)}
+[DATABASE]
+motor = sqlite
+ruta_sqlite = {as400_path}
+cache_detalles =
+[EMAIL]
+servidor_smtp = 127.0.0.1
+puerto_smtp = {server.server_address[1]}
+remitente = autocheck@example.com
+usar_tls = no
+destinatarios_central = central@example.com
+notificar = nuevos
+[CENTROS]
+60 = almacen60@example.com
+[METRICAS]
+json =
+""")
+            sent = len(server.messages)
+            subprocess.run([sys.executable, os.path.join(ROOT, "main.py")], cwd=test_dir, check=True,
+                           capture_output=True, timeout=300)
+            return [recipients[0] for recipients, _ in server.messages[sent:]]
+
+        assert "central@example.com" in scheduled_run(pdf_dir)
+        assert scheduled_run(pdf_dir) == []
+        assert scheduled_run(os.path.join(test_dir, "offline")) == []
+        assert scheduled_run(pdf_dir) == [], "a partial run resolved the open albaranes"
+        history = RunHistory(os.path.join(test_dir, "main_history.db"))
+        assert history.changes(run_id=4) == {"new": [], "resolved": [], "missing": []}, history.changes(run_id=4)
+        history.close()
+
+        # Once the share is fully scanned again, a fixed file is resolved and a new one notified
+        create_dummy_pdf(os.path.join(pdf_dir, f"{corrupt[0]}.pdf"), is_valid=True)
+        create_dummy_pdf(os.path.join(pdf_dir, "500009.pdf"), is_valid=False)
+        assert scheduled_run(pdf_dir) == ["central@example.com"]
+        history = RunHistory(os.path.join(test_dir, "main_history.db"))
+        assert history.changes(run_id=5) == {"new": ["500009"], "resolved": [corrupt[0]], "missing": ["500009"]}, \
+            history.changes(run_id=5)
+        history.close()
+
+        # Central's summary lists every albaran: when only the center's report fails, the center's
+        # albaranes are not notified, and go out again on the next run
+        center_dir = os.path.join(test_dir, "center")
+        os.makedirs(center_dir)
+        for barcode in corrupt[1:3]:
+            create_dummy_pdf(os.path.join(center_dir, f"{barcode}.pdf"), is_valid=False)
+        server.reject = {"almacen60@example.com"}
+        assert scheduled_run(center_dir, "center_history.db") == ["central@example.com"]
+        server.reject = set()
+        assert sorted(scheduled_run(center_dir, "center_history.db")) == ["almacen60@example.com",
+                                                                           "central@example.com"]
+        assert scheduled_run(center_dir, "center_history.db") == []
+        server.shutdown()
+
+        print("SUCCESS: Run history tracks new, resolved and notified albaranes and reminders, "
+              "and partial scans resolve nothing.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import threading
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import run_metrics
+from run_metrics import RunMetrics, LATENCY_BUCKETS_MS, timed_iter
+
+def parse_prometheus(path):
+    """
+    Parses a textfile-collector file into {(metric, labels): value} and
+    {metric: type}, checking every line is a comment or a sample.
+    """
+    samples, types = {}, {}
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    assert text.endswith("\n"), "the file must end with a newline"
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, metric, kind = line.split(" ")
+            types[metric] = kind
+            continue
+        if line.startswith("# HELP "):
+            continue
+        name, value = line.rsplit(" ", 1)
+        labels = ()
+        if "{" in name:
+            name, label_text = name[:-1].split("{", 1)
+            labels = tuple(tuple(pair.split("=", 1)) for pair in label_text.split(","))
+            labels = tuple((key, raw.strip('"')) for key, raw in labels)
+        assert (name, labels) not in samples, f"duplicate sample {line}"
+        samples[(name, labels)] = float(value)
+    return samples, types
+
+def slow_items(items, delay):
+    for item in items:
+        time.sleep(delay)
+        yield item
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="run_metrics_")
+    try:
+        metrics = RunMetrics()
+        with metrics.stage("scan"):
+            time.sleep(0.05)
+        metrics.add_time("db_lookup", 0.25)
+        metrics.incr("files_validated", 5)
+        metrics.incr("files_corrupt")
+        metrics.incr("files_corrupt")
+        # Bounds are inclusive; anything past the last one lands in the overflow bucket
+        for seconds in (0.0005, 0.001, 0.003, 0.2, 0.2, 20):
+            metrics.observe_latency(seconds)
+
+        # JSON summary
+        json_path = os.path.join(test_dir, "metrics.json")
+        metrics.write_json(json_path)
+        with open(json_path, encoding="utf-8") as f:
+            summary = json.load(f)
+        assert summary["counters"] == {"files_validated": 5, "files_corrupt": 2}, summary["counters"]
+        assert summary["stages_s"]["db_lookup"] == 0.25
+        assert 0.05 <= summary["stages_s"]["scan"] < 0.5, summary["stages_s"]
+        latency = summary["file_latency"]
+        assert latency["count"] == 6
+        assert abs(latency["mean_ms"] - (0.0005 + 0.001 + 0.003 + 0.4 + 20) / 6 * 1000) < 0.001, latency
+        expected = {f"le_{bound}ms": 0 for bound in LATENCY_BUCKETS_MS}
+        expected.update({"le_1ms": 2, "le_5ms": 1, "le_250ms": 2, "gt_10000ms": 1})
+        assert latency["buckets"] == expected, latency["buckets"]
+        assert RunMetrics().to_dict()["file_latency"]["mean_ms"] == 0
+
+        # Prometheus textfile: gauges plus a cumulative histogram in seconds
+        prom_path = os.path.join(test_dir, "autocheck.prom")
+        metrics.write_prometheus(prom_path)
+        samples, types = parse_prometheus(prom_path)
+        assert types == {
+            "autocheck_run_duration_seconds": "gauge",
+            "autocheck_run_timestamp_seconds": "gauge",
+            "autocheck_stage_seconds": "gauge",
+            "autocheck_count": "gauge",
+            "autocheck_file_validation_seconds": "histogram",
+        }, types
+        assert samples[("autocheck_count", (("name", "files_corrupt"),))] == 2
+        assert samples[("autocheck_count", (("name", "files_validated"),))] == 5
+        assert samples[("autocheck_stage_seconds", (("stage", "db_lookup"),))] == 0.25
+        assert samples[("autocheck_run_timestamp_seconds", ())] == round(metrics.started_at)
+        buckets = [(labels[0][1], value) for (name, labels), value in samples.items()
+                   if name == "autocheck_file_validation_seconds_bucket"]
+        assert [le for le, _ in buckets] == [str(bound / 1000) for bound in LATENCY_BUCKETS_MS] + ["+Inf"], buckets
+        counts = dict(buckets)
+        assert counts["0.001"] == 2 and counts["0.005"] == 3 and counts["0.1"] == 3, counts
+        assert counts["0.25"] == 5 and counts["10.0"] == 5 and counts["+Inf"] == 6, counts
+        assert all(a <= b for (_, a), (_, b) in zip(buckets, buckets[1:])), "buckets must be cumulative"
+        assert samples[("autocheck_file_validation_seconds_count", ())] == 6
+        assert abs(samples[("autocheck_file_validation_seconds_sum", ())] - 20.4045) < 1e-6
+
+        # Writes replace the file whole: a reader never sees a partial file, and no temp file is left
+        stop = threading.Event()
+        bad_reads = []
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    with open(json_path, encoding="utf-8") as f:
+                        json.load(f)
+                except ValueError as e:
+                    bad_reads.append(e)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        for i in range(200):
+            metrics.incr(f"counter_{i}")
+            metrics.write_json(json_path)
+        stop.set()
+        thread.join()
+        assert not bad_reads, bad_reads[:3]
+        assert sorted(os.listdir(test_dir)) == ["autocheck.prom", "metrics.json"], os.listdir(test_dir)
+
+        # A write that fails before the swap leaves the previous file as it was
+        with open(prom_path, encoding="utf-8") as f:
+            previous = f.read()
+
+        def failing_replace(src, dst):
+            raise OSError(28, "No space left on device")
+
+        real_replace = os.replace
+        run_metrics.os.replace = failing_replace
+        try:
+            metrics.incr("files_corrupt")
+            try:
+                metrics.write_prometheus(prom_path)
+                raise AssertionError("the failed write was swallowed")
+            except OSError:
+                pass
+        finally:
+            run_metrics.os.replace = real_replace
+        with open(prom_path, encoding="utf-8") as f:
+            assert f.read() == previous
+
+        # write() logs failures instead of raising, and still writes the other output
+        missing_dir = os.path.join(test_dir, "missing", "metrics.json")
+        prom_path = os.path.join(test_dir, "again.prom")
+        metrics.write(json_path=missing_dir, prometheus_path=prom_path)
+        assert not os.path.exists(missing_dir) and os.path.exists(prom_path)
+
+        # timed_iter charges the time spent producing items to the stage, not the caller's time
+        metrics = RunMetrics()
+        for _ in timed_iter(slow_items(range(5), 0.02), metrics, "listing"):
+            time.sleep(0.05)
+        assert 0.1 <= metrics.stages["listing"] < 0.2, metrics.stages
+
+        print("SUCCESS: Run metrics are written atomically as JSON and Prometheus text, with latency buckets.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
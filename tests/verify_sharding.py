@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.append(os.path.dirname(__file__))
+
+from albaran_corpus import generate_corpus
+import pdf_checker
+from pdf_checker import scan_directory, list_partitions
+from sharding import ShardStore, run_shard, iter_shard_results
+
+PARTITIONS = 6
+LEASE_SECONDS = 2
+
+def shard_main(db_path, pdf_dir, owner):
+    # As main.run_shard_worker: one listing, split by partition
+    store = ShardStore(db_path, LEASE_SECONDS)
+    listing = {}
+
+    def scan_partition(partition, partitions):
+        if not listing:
+            listing.update(list_partitions(pdf_dir, 1, partitions))
+        return scan_directory(pdf_dir, days_back=1, entries=listing.get(partition, []))
+
+    try:
+        run_shard(store, scan_partition, owner=owner, poll_interval=0.2, start_wait=10)
+    finally:
+        store.close()
+
+def dying_shard_main(db_path):
+    # Claims a partition and dies before completing it, without cleaning up
+    store = ShardStore(db_path, LEASE_SECONDS)
+    scan_id, _ = store.open_scan()
+    store.claim(scan_id, "dead-shard")
+    os._exit(1)
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="sharding_")
+    pdf_dir = os.path.join(test_dir, "pdfs")
+    db_path = os.path.join(test_dir, "shards.db")
+    try:
+        generate_corpus(pdf_dir, 240, seed=19)
+        expected = sorted(scan_directory(pdf_dir, days_back=1))
+        assert expected, "the corpus should have corrupt albaranes"
+
+        # A shard walks the share once, whatever the number of partitions
+        walks = []
+        walk = pdf_checker.walk_pdf_files
+        pdf_checker.walk_pdf_files = lambda *args: walks.append(args) or walk(*args)
+        try:
+            listing = list_partitions(pdf_dir, 1, PARTITIONS)
+            by_partition = [scan_directory(pdf_dir, days_back=1, entries=listing.get(p, [])) for p in range(PARTITIONS)]
+        finally:
+            pdf_checker.walk_pdf_files = walk
+        assert len(walks) == 1, len(walks)
+        assert sorted(b for barcodes in by_partition for b in barcodes) == expected
+        assert sum(len(entries) for entries in listing.values()) == len(os.listdir(pdf_dir))
+        assert [sorted(barcodes) for barcodes in by_partition] == \
+            [sorted(scan_directory(pdf_dir, days_back=1, shard=(p, PARTITIONS))) for p in range(PARTITIONS)]
+
+        store = ShardStore(db_path, LEASE_SECONDS)
+        scan_id = store.create_scan(PARTITIONS)
+
+        dying = multiprocessing.Process(target=dying_shard_main, args=(db_path,))
+        dying.start()
+        dying.join()
+        assert dying.exitcode == 1
+
+        start = time.perf_counter()
+        shards = [multiprocessing.Process(target=shard_main, args=(db_path, pdf_dir, f"shard-{i}"))
+                  for i in range(2)]
+        for shard in shards:
+            shard.start()
+        merged = sorted(iter_shard_results(store, scan_id, poll_interval=0.2, timeout=120))
+        for shard in shards:
+            shard.join(30)
+            assert shard.exitcode == 0, shard.exitcode
+        elapsed = time.perf_counter() - start
+
+        assert merged == expected, (len(merged), len(expected))
+        assert store.progress(scan_id) == (PARTITIONS, PARTITIONS)
+        # The dead shard's partition waited for its lease to expire and was leased again
+        releases = store._conn.execute("SELECT COUNT(*) FROM leases WHERE scan_id = ? AND attempts > 1",
+                                       (scan_id,)).fetchone()[0]
+        assert releases == 1 and elapsed >= LEASE_SECONDS * 0.9, (releases, elapsed)
+        owners = {row[0] for row in store._conn.execute("SELECT owner FROM leases WHERE scan_id = ?", (scan_id,))}
+        assert "dead-shard" not in owners, owners
+        print(f"Sharded scan: {len(merged)} corrupt albaranes from {PARTITIONS} partitions in {elapsed:.2f}s")
+
+        # A shard that lost its lease cannot complete the partition any more
+        assert not store.complete(scan_id, 0, "dead-shard", ["0000000"])
+        assert "0000000" not in {b for _, barcodes in store.completed(scan_id) for b in barcodes}
+
+        # Nothing left to claim; a new scan is picked up by late shards, a closed one is not
+        assert store.claim(scan_id, "late-shard") is None
+        store.close_scan(scan_id)
+        assert store.open_scan() is None
+
+        # Scan errors of a shard (e.g. a root it could not reach) reach the coordinator
+        scan_id = store.create_scan(2)
+        for partition in range(2):
+            assert store.claim(scan_id, "shard-0") == partition
+            store.complete(scan_id, partition, "shard-0", [], ["Directory not found: X:\\"] if partition else [])
+        errors = []
+        assert list(iter_shard_results(store, scan_id, errors=errors)) == []
+        assert errors == ["Partition 2/2: Directory not found: X:\\"], errors
+        store.close_scan(scan_id)
+        store.close()
+
+        print("SUCCESS: Shards split the scan, a dead shard's partition is re-leased and the merge matches.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import pdf_checker
+from pdf_checker import iter_corrupt_files, ValidationPool
+from verify_multiprocessing import create_dummy_pdf
+
+class CountingPool(ValidationPool):
+    """
+    ValidationPool that records the most files outstanding at once.
+    """
+    max_pending = 0
+
+    def submit(self, chunk):
+        super().submit(chunk)
+        self.max_pending = max(self.max_pending, self.pending())
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="streaming_")
+    expected = set()
+    for i in range(200):
+        corrupt = i % 4 == 0
+        create_dummy_pdf(os.path.join(test_dir, f"{100000 + i}.pdf"), is_valid=not corrupt)
+        if corrupt:
+            expected.add(str(100000 + i))
+
+    walk = pdf_checker.walk_pdf_files
+    listing = {"files": 0, "done": False}
+
+    def slow_walk(*args):
+        # A share that lists slowly, as SMB does
+        for entry in walk(*args):
+            listing["files"] += 1
+            yield entry
+            time.sleep(0.01)
+        listing["done"] = True
+
+    pool = CountingPool(2)
+    try:
+        # Corrupt albaranes come out while the folder is still being listed
+        pdf_checker.walk_pdf_files = slow_walk
+        try:
+            found = []
+            listed_at_first = None
+            for stem in iter_corrupt_files(test_dir, days_back=1, chunksize=4, max_in_flight=8, pool=pool):
+                if listed_at_first is None:
+                    listed_at_first = (listing["files"], listing["done"])
+                found.append(stem)
+        finally:
+            pdf_checker.walk_pdf_files = walk
+        assert set(found) == expected and len(found) == len(expected), (len(found), len(expected))
+        assert not listed_at_first[1] and listed_at_first[0] < 100, listed_at_first
+
+        # With a fast listing the window fills up, and never goes over max_in_flight
+        for chunksize, max_in_flight in ((4, 8), (16, 40), (3, 10)):
+            pool.max_pending = 0
+            found = list(iter_corrupt_files(test_dir, days_back=1, chunksize=chunksize, max_in_flight=max_in_flight,
+                                            pool=pool))
+            assert set(found) == expected, len(found)
+            assert max_in_flight - chunksize < pool.max_pending <= max_in_flight, \
+                (chunksize, max_in_flight, pool.max_pending)
+
+        print("SUCCESS: Results stream out during the listing and files in flight stay within the limit.")
+
+    finally:
+        pool.close()
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
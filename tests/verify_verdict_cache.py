@@ -0,0 +1,153 @@
+import os
+import sys
+import shutil
+import time
+import sqlite3
+import subprocess
+import multiprocessing
+
+# Add src to path
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.append(SRC)
+
+from pdf_checker import scan_directory, VALIDATION_STRUCTURE, VALIDATION_PYPDF
+from verdict_cache import VerdictCache
+from verify_multiprocessing import create_dummy_pdf
+
+# Passes the structural checks (header, %%EOF, startxref in range) but pypdf can't open it
+BROKEN_BODY = b"%PDF-1.4\n1 0 obj<</Broken\nstartxref\n9\n%%EOF"
+
+# Structural scan in a process where pypdf can't be imported
+STRUCTURE_ONLY_SCAN = """
+import sys
+sys.modules["pypdf"] = None
+sys.path.insert(0, sys.argv[1])
+from pdf_checker import scan_directory, VALIDATION_STRUCTURE
+print(",".join(sorted(scan_directory(sys.argv[2], days_back=1, validation_depth=VALIDATION_STRUCTURE, processes=2))))
+"""
+
+def shard_flushes(cache_path, shard, files, rounds):
+    """
+    One local shard: records its verdicts in `rounds` flushes, as a long
+    sharded scan does, on the cache file the other shards use too.
+    """
+    cache = VerdictCache(cache_path)
+    per_round = files // rounds
+    for r in range(rounds):
+        for i in range(r * per_round, (r + 1) * per_round):
+            cache.record(f"/share/{shard}/{i}.pdf", 1000 + i, i, i, i % 7 != 0, VALIDATION_PYPDF)
+        cache.flush()
+    cache.close()
+
+def main():
+    test_dir = os.path.join(os.path.dirname(__file__), "temp_test_cache")
+    if os.path.exists(test_dir):
+        shutil.rmtree(test_dir)
+    os.makedirs(test_dir)
+    cache_path = os.path.join(test_dir, "verdicts.db")
+    pdf_dir = os.path.join(test_dir, "pdfs")
+    os.makedirs(pdf_dir)
+
+    try:
+        for i in range(3):
+            create_dummy_pdf(os.path.join(pdf_dir, f"777000{i}.pdf"), is_valid=True)
+        create_dummy_pdf(os.path.join(pdf_dir, "8880000-Rev(1.00).pdf"), is_valid=False)
+
+        # First run: everything is a miss
+        cache = VerdictCache(cache_path)
+        first = scan_directory(pdf_dir, days_back=1, cache=cache)
+        assert (cache.hits, cache.misses) == (0, 4), (cache.hits, cache.misses)
+        cache.close()
+
+        # Second run: everything is a hit, same verdicts
+        cache = VerdictCache(cache_path)
+        second = scan_directory(pdf_dir, days_back=1, cache=cache)
+        assert (cache.hits, cache.misses) == (4, 0), (cache.hits, cache.misses)
+        assert first == second == ["8880000"], (first, second)
+        cache.close()
+
+        # Rewriting a file invalidates its verdict
+        time.sleep(0.01)
+        create_dummy_pdf(os.path.join(pdf_dir, "8880000-Rev(1.00).pdf"), is_valid=True)
+        cache = VerdictCache(cache_path)
+        third = scan_directory(pdf_dir, days_back=1, cache=cache)
+        assert (cache.hits, cache.misses) == (3, 1), (cache.hits, cache.misses)
+        assert third == [], third
+
+        # Size-bounded eviction
+        cache.max_entries = 2
+        cache.close()
+        cache = VerdictCache(cache_path)
+        count = cache._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        assert count == 2, count
+        cache.close()
+
+        # The structural tier rejects empty, truncated and non-PDF files without pypdf
+        tier_dir = os.path.join(test_dir, "tiers")
+        os.makedirs(tier_dir)
+        create_dummy_pdf(os.path.join(tier_dir, "9000.pdf"))
+        with open(os.path.join(tier_dir, "9000.pdf"), "rb") as f:
+            valid = f.read()
+        for name, content in (("9001", b""), ("9002", valid[:len(valid) // 2]),
+                              ("9003", b"<html><body>Session expired</body></html>"), ("9004", BROKEN_BODY)):
+            with open(os.path.join(tier_dir, f"{name}.pdf"), "wb") as f:
+                f.write(content)
+        found = subprocess.run([sys.executable, "-c", STRUCTURE_ONLY_SCAN, SRC, tier_dir], check=True,
+                               capture_output=True, text=True).stdout.split()
+        assert found == ["9001,9002,9003"], found
+
+        # Verdicts are cached per depth: a valid one only holds up to the depth it was checked at
+        tier_cache = os.path.join(test_dir, "tiers.db")
+        cache = VerdictCache(tier_cache)
+        found = sorted(scan_directory(tier_dir, days_back=1, cache=cache, validation_depth=VALIDATION_STRUCTURE))
+        assert found == ["9001", "9002", "9003"], found
+        cache.close()
+        cache = VerdictCache(tier_cache)
+        found = sorted(scan_directory(tier_dir, days_back=1, cache=cache, validation_depth=VALIDATION_PYPDF))
+        assert found == ["9001", "9002", "9003", "9004"], found
+        # Corrupt verdicts are reused at any depth; valid structural ones are checked again
+        assert (cache.hits, cache.misses) == (3, 2), (cache.hits, cache.misses)
+        cache.close()
+        cache = VerdictCache(tier_cache)
+        found = sorted(scan_directory(tier_dir, days_back=1, cache=cache, validation_depth=VALIDATION_STRUCTURE))
+        assert found == ["9001", "9002", "9003", "9004"] and (cache.hits, cache.misses) == (5, 0), \
+            (found, cache.hits, cache.misses)
+        cache.close()
+
+        # Local shards share the cache file: concurrent flushes wait for each other instead of failing
+        shared_path = os.path.join(test_dir, "shared.db")
+        VerdictCache(shared_path).close()
+        shards = [multiprocessing.Process(target=shard_flushes, args=(shared_path, shard, 3000, 6))
+                  for shard in range(4)]
+        for shard in shards:
+            shard.start()
+        for shard in shards:
+            shard.join()
+        assert [shard.exitcode for shard in shards] == [0] * 4
+        with sqlite3.connect(shared_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0] == 12000
+
+        # A lock held past the timeout doesn't fail the scan: the verdicts wait for the next flush
+        blocker = sqlite3.connect(shared_path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        cache = VerdictCache(shared_path, timeout=0.2)
+        cache.record("/share/late.pdf", 1, 2, 3, False, VALIDATION_PYPDF)
+        cache.flush()
+        assert len(cache._pending) == 1
+        blocker.execute("ROLLBACK")
+        blocker.close()
+        cache.flush()
+        assert not cache._pending
+        cache.close()
+        cache = VerdictCache(shared_path)
+        assert cache.lookup("/share/late.pdf", 1, 2, 3) is False
+        cache.close()
+
+        print("SUCCESS: Verdict cache hits, misses, invalidation and eviction behave as expected.")
+
+    finally:
+        if os.path.exists(test_dir):
+            shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import watcher
+from watcher import watch_directories, _create_source, _InotifySource, _PollingSource
+from pdf_checker import ValidationPool
+from verdict_cache import VerdictCache
+from verify_multiprocessing import create_dummy_pdf
+
+class RecordingPool(ValidationPool):
+    """
+    ValidationPool that records the files submitted to it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.submitted = []
+
+    def submit(self, chunk):
+        self.submitted += [args[0] for args in chunk]
+        super().submit(chunk)
+
+class FailingSource:
+    """
+    Source that reports `paths` once, then fails as a lost inotify descriptor
+    or an unreachable share would.
+    """
+
+    def __init__(self, paths):
+        self.paths = paths
+
+    def wait(self, timeout):
+        paths, self.paths = self.paths, None
+        if paths is None:
+            raise OSError(5, "Input/output error")
+        return paths
+
+    def close(self):
+        pass
+
+def wait_for(source, timeout):
+    """
+    Collects what `source` reports until it reports something or `timeout` passes.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        paths = source.wait(deadline - time.monotonic())
+        if paths:
+            return paths
+    return []
+
+def main():
+    test_dir = tempfile.mkdtemp(prefix="watcher_")
+    try:
+        # Polling: a file is reported once unchanged between two polls
+        poll_dir = os.path.join(test_dir, "poll")
+        os.makedirs(poll_dir)
+        source = _PollingSource([poll_dir], False, 0, [], interval=0.3)
+        assert source.wait(0) == []
+        growing = os.path.join(poll_dir, "1001.pdf")
+        create_dummy_pdf(growing)
+        assert wait_for(source, 0.35) == []
+        with open(growing, "ab") as f:
+            f.write(b"% still writing\n")
+        assert wait_for(source, 0.35) == []
+        assert wait_for(source, 2) == [growing]
+        assert wait_for(source, 1) == [], "a file is reported once"
+
+        # ... even when the caller comes back long after the poll interval (slow flush, large share)
+        source = _PollingSource([poll_dir], False, 0, [], interval=1)
+        assert source.wait(0) == []
+        time.sleep(0.2)
+        late = os.path.join(poll_dir, "1002.pdf")
+        create_dummy_pdf(late)
+        time.sleep(2.8)
+        assert source.wait(0) == []
+        assert wait_for(source, 3) == [late], "file written during a busy gap was never reported"
+
+        # inotify where available, polling when asked for or when inotify can't start
+        notify_dir = os.path.join(test_dir, "notify")
+        os.makedirs(notify_dir)
+        assert isinstance(_create_source([notify_dir], "sondeo", 1, False, 0, []), _PollingSource)
+        if sys.platform.startswith("linux"):
+            source = _create_source([notify_dir], "auto", 1, True, 0, [])
+            assert isinstance(source, _InotifySource)
+            try:
+                path = os.path.join(notify_dir, "2001.pdf")
+                create_dummy_pdf(path)
+                assert wait_for(source, 2) == [path]
+                # Files copied into a new folder before its watch existed are reported too
+                staging = os.path.join(test_dir, "staging")
+                os.makedirs(staging)
+                create_dummy_pdf(os.path.join(staging, "2002.pdf"))
+                os.rename(staging, os.path.join(notify_dir, "160"))
+                assert wait_for(source, 2) == [os.path.join(notify_dir, "160", "2002.pdf")]
+            finally:
+                source.close()
+
+            def no_inotify(*args):
+                raise OSError(24, "Too many open files")
+            watcher._InotifySource = no_inotify
+            try:
+                assert isinstance(_create_source([notify_dir], "auto", 1, False, 0, []), _PollingSource)
+                try:
+                    _create_source([notify_dir], "inotify", 1, False, 0, [])
+                    raise AssertionError("inotify mode should not fall back")
+                except OSError:
+                    pass
+            finally:
+                watcher._InotifySource = _InotifySource
+        else:
+            assert isinstance(_create_source([notify_dir], "auto", 1, False, 0, []), _PollingSource)
+
+        # Watch session over polling: a file landing during a slow flush is reported in the next one
+        watch_dir = os.path.join(test_dir, "watch")
+        os.makedirs(watch_dir)
+        flushed = []
+
+        def on_flush(stems):
+            flushed.append(sorted(stems))
+            if len(flushed) == 1:
+                create_dummy_pdf(os.path.join(watch_dir, "3002.pdf"), is_valid=False)
+                time.sleep(2)
+
+        def scanner():
+            time.sleep(0.5)
+            create_dummy_pdf(os.path.join(watch_dir, "3000.pdf"), is_valid=True)
+            create_dummy_pdf(os.path.join(watch_dir, "3001.pdf"), is_valid=False)
+
+        threading.Thread(target=scanner).start()
+        watch_directories([watch_dir], on_flush, mode="sondeo", poll_interval=0.5, flush_interval=0.5,
+                          processes=2, stop_after=8)
+        assert flushed == [["3001"], ["3002"]], flushed
+
+        # Verdicts are cached: a file closed again unchanged (scanner software, antivirus) isn't revalidated
+        if sys.platform.startswith("linux"):
+            cache_dir = os.path.join(test_dir, "cached")
+            os.makedirs(cache_dir)
+            cache = VerdictCache(os.path.join(test_dir, "verdicts.db"))
+            names = {"4000.pdf": True, "4001.pdf": False}
+            for session in range(2):
+                flushes = []
+
+                def touch_files():
+                    time.sleep(0.5)
+                    for name, is_valid in names.items():
+                        path = os.path.join(cache_dir, name)
+                        if session == 0:
+                            create_dummy_pdf(path, is_valid=is_valid)
+                        else:
+                            open(path, "r+b").close()
+
+                threading.Thread(target=touch_files).start()
+                pool = RecordingPool(2)
+                try:
+                    watch_directories([cache_dir], flushes.append, mode="inotify", flush_interval=0.3,
+                                      cache=cache, pool=pool, stop_after=1.5)
+                finally:
+                    pool.close()
+                assert flushes == [["4001"]], (session, flushes)
+                assert len(pool.submitted) == (2 if session == 0 else 0), (session, pool.submitted)
+            cache.close()
+
+        # A failing source doesn't leak the workers of a pool the watcher started
+        original_create_source = watcher._create_source
+        watcher._create_source = lambda *args: FailingSource([os.path.join(watch_dir, "3000.pdf")])
+        try:
+            watch_directories([watch_dir], on_flush, processes=2, poll_interval=0.1)
+            raise AssertionError("the source error was swallowed")
+        except OSError:
+            pass
+        finally:
+            watcher._create_source = original_create_source
+        assert multiprocessing.active_children() == [], multiprocessing.active_children()
+
+        print("SUCCESS: Watch mode reports finished files with inotify or polling, also after slow flushes.")
+
+    finally:
+        shutil.rmtree(test_dir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from worker_pool import SupervisedPool, LIMIT_TIMEOUT, LIMIT_MEMORY, LIMIT_CRASH
+
+def misbehaving_worker(args):
+    """
+    Stand-in for a pathological PDF: `kind` decides whether the worker hangs,
+    balloons memory, dies or answers normally (with its pid).
+    """
+    path, kind = args
+    if kind == "hang":
+        time.sleep(60)
+    elif kind == "balloon":
+        hog = bytearray(400 * 1024 * 1024)
+        hog[::4096] = b"x" * len(hog[::4096])
+        time.sleep(60)
+    elif kind == "crash":
+        os._exit(1)
+    return path, True, 0.0, 0, os.getpid()
+
+def limit_result(args, reason, seconds):
+    return args[0], False, seconds, 0, reason
+
+def run(pool, items, chunk=4):
+    for i in range(0, len(items), chunk):
+        pool.submit(items[i:i + chunk])
+    results = {}
+    while pool.pending():
+        for result in pool.get():
+            results[result[0]] = result
+    return results
+
+def main():
+    items = [(f"ok_{i}", "ok") for i in range(12)]
+    items[1] = ("hang", "hang")
+    items[6] = ("balloon", "balloon")
+    items[9] = ("crash", "crash")
+
+    pool = SupervisedPool(2, misbehaving_worker, limit_result, task_timeout=1.0, memory_limit_mb=200)
+    try:
+        start = time.perf_counter()
+        results = run(pool, items)
+        elapsed = time.perf_counter() - start
+    finally:
+        pool.close()
+
+    assert len(results) == len(items), sorted(results)
+    assert results["hang"][4] == LIMIT_TIMEOUT, results["hang"]
+    assert results["balloon"][4] == LIMIT_MEMORY, results["balloon"]
+    assert results["crash"][4] == LIMIT_CRASH, results["crash"]
+    assert all(results[f"ok_{i}"][1] for i in range(12) if i not in (1, 6, 9)), results
+    assert elapsed < 20, elapsed
+    assert len(pool.limit_hits) == 3, pool.limit_hits
+    print(f"Limits enforced in {elapsed:.1f}s: {[(args[0], reason) for args, reason, _ in pool.limit_hits]}")
+
+    # Recycling: every worker process handles at most 3 files
+    pool = SupervisedPool(2, misbehaving_worker, limit_result, max_tasks_per_child=3)
+    try:
+        results = run(pool, [(f"ok_{i}", "ok") for i in range(24)], chunk=3)
+    finally:
+        pool.close()
+    pids = [r[4] for r in results.values()]
+    assert len(results) == 24, len(results)
+    assert max(pids.count(pid) for pid in set(pids)) <= 3, pids
+
+    print("SUCCESS: Stuck, ballooning and crashing workers are replaced and their files reported.")
+
+if __name__ == "__main__":
+    main()